@@ -0,0 +1,51 @@
+import os
+from typing import List
+
+import yaml
+
+from communication_library.frame import ids, Frame
+
+
+def load_checkpoints(path: str) -> dict:
+    """
+    Named checkpoints from a YAML file, empty when the file does not exist yet.
+    """
+    if path is None or not os.path.exists(path):
+        return {}
+    with open(path, 'r') as checkpoint_file:
+        return yaml.safe_load(checkpoint_file) or {}
+
+
+def save_checkpoints(path: str, checkpoints: dict) -> None:
+    # zapis do pliku tymczasowego i podmiana, przerwany zapis nie psuje istniejących punktów
+    temporary_path = path + '.tmp'
+    with open(temporary_path, 'w') as checkpoint_file:
+        yaml.safe_dump(checkpoints, checkpoint_file, sort_keys=False)
+    os.replace(temporary_path, path)
+
+
+def checkpoint_name(names: List[str], index: int) -> str:
+    """
+    Name of the checkpoint with the given index, used by control frames which carry only a number.
+    :param names: checkpoint names in file order when the file was loaded, never changed afterwards,
+                  so an index always means the same checkpoint; indexes past the end are named checkpoint-<index>
+    """
+    return names[index] if index < len(names) else f'checkpoint-{index}'
+
+
+def checkpoint_frame(operation: ids.OperationID, index: int, rocket: int = 0) -> Frame:
+    """
+    Control frame asking the simulator to save or restore a checkpoint.
+    :param operation: OperationID.SIMULATOR.value.CHECKPOINT_SAVE or CHECKPOINT_RESTORE
+    :param index:     index of the checkpoint name in the simulator's checkpoint file
+    :param rocket:    rocket of tcp_multi_simulator.py, 0 for tcp_simulator.py
+    """
+    return Frame(destination=ids.BoardID.ROCKET,
+                 priority=ids.PriorityID.HIGH,
+                 action=ids.ActionID.SERVICE,
+                 source=ids.BoardID.SOFTWARE,
+                 device_type=ids.DeviceID.SIMULATOR,
+                 device_id=rocket,
+                 data_type=ids.DataTypeID.UINT32,
+                 operation=operation,
+                 payload=(index,))
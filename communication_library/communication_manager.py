@@ -1,17 +1,19 @@
 from typing import Callable, List, Optional
 from collections import deque
+from itertools import islice
 import os
+import threading
 
 from communication_library.exceptions import (MissingHeaderError,
                                                                  UnregisteredCallbackError)
 
-from communication_library.exceptions import TransportError  # pylint: disable=ungrouped-imports
+from communication_library.exceptions import TransportError, TransportTimeoutError  # pylint: disable=ungrouped-imports
 from communication_library.tcp_transport import TcpTransport # pylint: disable=ungrouped-imports
 from communication_library.frame import Frame # pylint: disable=ungrouped-imports
 from communication_library.protocol import GroundStationProtocol # pylint: disable=ungrouped-imports
 
 from communication_library.ids import HEADER_ID, BoardID
-from communication_library.ids import PriorityID
+from communication_library.ids import PriorityID, ActionID, DeviceID, DataTypeID, OperationID
 from communication_library.transport import (TransportSettings,
                                                                 TransportOptions,
                                                                 TransportInfo,
@@ -22,12 +24,29 @@ class CommunicationManager:
     """
     Main communication interface for the Ground Station.
     """
+    # Control frames from the proxy handled by the manager itself
+    _PROXY_REPLIES = (OperationID.PROXY.value.SESSION_OPEN,
+                      OperationID.PROXY.value.SESSION_RESUME,
+                      OperationID.PROXY.value.CREDIT)
+    # header, values, payload and crc
+    _FRAME_LENGTH = 14
+    # seconds to wait for the rest of a frame whose beginning was already received
+    _FRAME_REST_TIMEOUT = 0.1
 
     def __init__(self) -> None:
         self._transport = None
         self._protocol = GroundStationProtocol()
         self._priority_buffer = {int(priority): deque() for priority in PriorityID}
         self._callbacks = {}
+        self._session_id = None
+        self._session_sequence = 0
+        self._session_resuming = False
+        # window asked with enable_flow_control(), 0 for the proxy default, None if flow control is off
+        self._credit_window: Optional[int] = None
+        self._send_credits = None
+        # the send buffer, credits and socket writes are shared by the thread receiving
+        # frames (credits from the proxy) and the threads sending commands
+        self._send_lock = threading.RLock()
 
     @property
     def transport_info(self) -> TransportInfo:
@@ -69,9 +88,138 @@ class CommunicationManager:
         :param timeout: read timeout in seconds, None for forever, 0 for non-blocking
         :param write_timeout: write timeout in seconds, same as read timeout
         """
-        for queue in self._priority_buffer.values():
-            queue.clear()
-        self._transport.open(transport_options, timeout, write_timeout)
+        with self._send_lock:
+            for queue in self._priority_buffer.values():
+                queue.clear()
+            self._send_credits = None
+            self._transport.open(transport_options, timeout, write_timeout)
+
+    def reconnect(self, transport_options: TransportSettings, timeout: int = 0,
+                  write_timeout: Optional[int] = 1) -> None:
+        """
+        Opens the transport again keeping the buffered frames and resumes
+        the proxy session if one was opened.
+        """
+        with self._send_lock:
+            if self.is_connected:
+                self._transport.close()
+            self._send_credits = None
+            self._transport.open(transport_options, timeout, write_timeout)
+        if self._session_id is not None:
+            self.resume_session(self._session_id, self._session_sequence)
+        if self._credit_window is not None:
+            self.enable_flow_control(self._credit_window)
+
+    @property
+    def session_id(self) -> Optional[int]:
+        """
+        Id of the resumable proxy session, None if there is none.
+        """
+        return self._session_id
+
+    @property
+    def session_sequence(self) -> int:
+        """
+        Sequence number of the last frame received in the proxy session.
+        """
+        return self._session_sequence
+
+    def open_session(self) -> None:
+        """
+        Asks the proxy for a resumable session, the id arrives with
+        the reply handled by receive().
+        """
+        with self._send_lock:
+            self._transport.write(self._proxy_request(OperationID.PROXY.value.SESSION_OPEN))
+
+    def resume_session(self, session_id: int, last_sequence: int) -> None:
+        """
+        Asks the proxy to resend frames of the session after last_sequence.
+        Frames received before the reply are discarded, the proxy resends them.
+        :param session_id: id received when the session was opened
+        :param last_sequence: sequence number of the last frame received
+        """
+        operations = OperationID.PROXY.value
+        self._session_id = session_id
+        self._session_sequence = last_sequence
+        self._session_resuming = True
+        with self._send_lock:
+            self._transport.write(self._proxy_request(operations.SESSION_RESUME, session_id) +
+                                  self._proxy_request(operations.SESSION_SEQUENCE, last_sequence))
+
+    def enable_flow_control(self, window: int = 0) -> None:
+        """
+        Asks the proxy for credit based flow control. Once the proxy grants
+        the window send() only writes frames while credits are left, the rest
+        stays buffered until the proxy returns credits for delivered frames.
+        :param window: frames allowed in flight, 0 for the proxy default
+        """
+        with self._send_lock:
+            self._credit_window = window
+            self._transport.write(self._proxy_request(OperationID.PROXY.value.CREDIT, window))
+
+    @property
+    def send_lock(self) -> threading.RLock:
+        """
+        Lock held while the send buffer, credits or socket writes are used,
+        for callers which need several operations, e.g. push() and flush(), done at once.
+        """
+        return self._send_lock
+
+    @property
+    def send_credits(self) -> Optional[int]:
+        """
+        Frames that can be sent right now, None if flow control is off.
+        """
+        return self._send_credits
+
+    @property
+    def can_send(self) -> bool:
+        return self._send_credits is None or self._send_credits > 0
+
+    @property
+    def buffered_frames(self) -> int:
+        """
+        Number of frames pushed and not sent yet.
+        """
+        return sum(len(queue) for queue in self._priority_buffer.values())
+
+    def _proxy_request(self, operation: int, value: Optional[int] = None) -> bytes:
+        data_type = DataTypeID.NO_DATA if value is None else DataTypeID.UINT32
+        frame = Frame(destination=BoardID.PROXY,
+                      priority=PriorityID.HIGH,
+                      action=ActionID.SERVICE,
+                      source=BoardID.PROXY,
+                      device_type=DeviceID.PROXY,
+                      device_id=0,
+                      data_type=data_type,
+                      operation=operation,
+                      payload=() if value is None else (value,))
+        return self._protocol.encode(frame)
+
+    def _handle_proxy_frame(self, frame: Frame) -> None:
+        operations = OperationID.PROXY.value
+        if frame.operation == operations.CREDIT:
+            with self._send_lock:
+                if frame.action == ActionID.ACK:
+                    self._send_credits = frame.data
+                elif frame.action == ActionID.NACK:
+                    self._credit_window = None
+                    self._send_credits = None
+                elif self._send_credits is not None:
+                    self._send_credits += frame.data
+        elif frame.operation == operations.SESSION_OPEN:
+            if frame.action == ActionID.ACK:
+                self._session_id = frame.data
+                self._session_sequence = 0
+        elif frame.operation == operations.SESSION_RESUME:
+            self._session_resuming = False
+            if frame.action != ActionID.ACK:
+                self._session_id = None
+                self._session_sequence = 0
+                # the session is gone, a new one keeps the next connection loss recoverable;
+                # frames discarded while waiting for the reply are replaced by the proxy's feed snapshot
+                self.open_session()
 
     def disconnect(self) -> None:
         """
@@ -107,37 +255,105 @@ class CommunicationManager:
         Put the frame in a buffer for sending
         :param frame: frame to add to the queue
         """
-        self._priority_buffer[frame.priority].append(frame)
+        with self._send_lock:
+            self._priority_buffer[frame.priority].append(frame)
 
     def pop(self, default=None) -> Frame:
         """
         Pop out first of the buffered frames according to their priority.
         """
+        with self._send_lock:
+            for queue in self._priority_buffer.values():
+                if queue:
+                    return queue.popleft()
+            return default
+
+    def _peek(self, count: int) -> List[Frame]:
+        """
+        First count of the buffered frames in the order pop() returns them, left in the buffer.
+        """
+        frames = []
         for queue in self._priority_buffer.values():
-            if queue:
-                return queue.popleft()
-        return default
+            frames.extend(islice(queue, count - len(frames)))
+            if len(frames) == count:
+                break
+        return frames
 
     def send(self) -> Frame:
         """
         Sends first of the queued frames to the hardware.
+        Nothing is sent when flow control is on and no credits are left.
+        The frame stays buffered if the write fails.
         """
-        frame = self.pop()
-        if frame is not None:
-            frame_bytes = self._protocol.encode(frame)
-            self._transport.write(frame_bytes)
-        return frame
+        with self._send_lock:
+            if not self.can_send:
+                return None
+            frames = self._peek(1)
+            if not frames:
+                return None
+            self._transport.write(self._protocol.encode(frames[0]))
+            self.pop()
+            if self._send_credits is not None:
+                self._send_credits -= 1
+            return frames[0]
+
+    def flush(self) -> int:
+        """
+        Sends as many queued frames as the credits allow with a single write.
+        If the write fails, e.g. with ClosedTransportError when the socket is not writable,
+        the frames stay buffered and no credits are used.
+        :return: number of frames sent
+        """
+        with self._send_lock:
+            count = self.buffered_frames
+            if self._send_credits is not None:
+                count = min(count, max(0, self._send_credits))
+            if not count:
+                return 0
+            frames = self._peek(count)
+            self._transport.write(b''.join(self._protocol.encode(frame) for frame in frames))
+            for _ in range(count):
+                self.pop()
+            if self._send_credits is not None:
+                self._send_credits -= count
+            return count
+
+    def wait_for_frame(self, timeout: Optional[float]) -> bool:
+        """
+        Blocks until a frame can be received or the timeout passes, without polling.
+        :param timeout: seconds to wait at most, None for forever
+        :return: True if data is available, False on timeout
+        """
+        return self._transport.wait_readable(timeout, self._FRAME_LENGTH)
+
+    def receive_frames(self, max_frames: int = 256) -> List[Frame]:
+        """
+        Receives all frames available right now, at most max_frames, without waiting.
+        Registered callbacks are called, frames without one are returned like the others
+        instead of raising UnregisteredCallbackError. Bytes before a header are skipped.
+        """
+        frames = []
+        while len(frames) < max_frames:
+            try:
+                frame = self._read_frame()
+            except TransportTimeoutError:
+                break
+            except MissingHeaderError:
+                continue
+            callback = self._callbacks.get(frame)
+            if callback is not None:
+                callback(frame)
+            frames.append(frame)
+        return frames
 
     def receive(self) -> Frame:
         """
         Receives some data from the transport, governed by the protocol.
         """
-        header = self._transport.read(1)
-        if header != bytes([HEADER_ID]):
-            raise MissingHeaderError(f'Received byte is not a header: {header}')
+        frame = self._read_frame()
+        if frame.destination == BoardID.PROXY and frame.operation in self._PROXY_REPLIES:
+            return frame
 
-        raw_frame = self._transport.read(13)
-        frame = self._protocol.decode(header + raw_frame)
         frame_matched = False
         try:
             self._callbacks[frame](frame)
@@ -150,6 +366,29 @@ class CommunicationManager:
 
         return frame
 
+    def _read_frame(self) -> Frame:
+        header = self._transport.read(1)
+        if header != bytes([HEADER_ID]):
+            raise MissingHeaderError(f'Received byte is not a header: {header}')
+
+        try:
+            raw_frame = self._transport.read(self._FRAME_LENGTH - 1)
+        except TransportTimeoutError:
+            # the rest of the frame is on its way, waiting for it keeps the header from being lost
+            if not self._transport.wait_readable(self._FRAME_REST_TIMEOUT, self._FRAME_LENGTH - 1):
+                raise
+            raw_frame = self._transport.read(self._FRAME_LENGTH - 1)
+        is_proxy_frame = self._protocol.peek_values(header + raw_frame)[0] == BoardID.PROXY
+        if self._session_id is not None and not is_proxy_frame:
+            if self._session_resuming:
+                raise TransportTimeoutError('Waiting for the session to be resumed')
+            self._session_sequence += 1
+
+        frame = self._protocol.decode(header + raw_frame)
+        if is_proxy_frame and frame.operation in self._PROXY_REPLIES:
+            self._handle_proxy_frame(frame)
+        return frame
+
     def clear_pattern_pre_processors(self):
         self._pattern_pre_processors = []
 
@@ -33,22 +33,22 @@ class Frame:
                                    default_factory=tuple) 
 
     def __post_init__(self):
-        for field_name, value in self.as_dict().items():
-            if field_name == 'payload':
-                self._ensure_payload_type(value)
-            else:
-                self._ensure_value_type(field_name, value)
+        # fields read directly, as_dict() would deep copy the whole frame
+        for field_name in _VALUE_FIELDS:
+            self._ensure_value_type(field_name, getattr(self, field_name))
+        self._ensure_payload_type(self.payload)
 
     def as_dict(self) -> dict:
         return asdict(self)
 
     def _ensure_payload_type(self, payload: tuple) -> None:
-        error_msg = f'{self} has payload of type {type(payload)}'
-        assert isinstance(payload, tuple), error_msg
+        # rendering the prefix checks the ids, unknown ones raise ValueError like the enums
+        self._str_prefix()
+        assert isinstance(payload, tuple), f'{self} has payload of type {type(payload)}'
         zero_padding = (0 for _ in range(self._valid_payload_len - len(payload)))
         object.__setattr__(self, 'payload', (*self.payload, *zero_padding))
-        error_msg = f'{self} has wrong payload length (expected {self._valid_payload_len})'
-        assert self._valid_payload_len == len(self.payload), error_msg
+        assert self._valid_payload_len == len(self.payload), \
+            f'{self} has wrong payload length (expected {self._valid_payload_len})'
 
     @property
     def _valid_payload_len(self) -> int:
@@ -103,26 +103,76 @@ class Frame:
                      operation=self.operation,
                      payload=self.payload)
 
+    @property
+    def _routing_key(self) -> tuple:
+        return (self.destination, self.priority, self.action, self.source,
+                self.device_type, self.device_id, self.data_type, self.operation)
+
+    def _names(self) -> Tuple[str, ...]:
+        try:
+            return (_BOARD_NAMES[self.destination],
+                    _PRIORITY_NAMES[self.priority],
+                    _ACTION_NAMES[self.action],
+                    _BOARD_NAMES[self.source],
+                    _DEVICE_NAMES[self.device_type],
+                    _DATA_TYPE_NAMES[self.data_type],
+                    _OPERATION_NAMES[(self.device_type, self.operation)])
+        except KeyError:
+            # unknown ids raise the same errors as the enums themselves
+            ids.BoardID(self.destination), ids.PriorityID(self.priority), ids.ActionID(self.action)
+            ids.BoardID(self.source), ids.DataTypeID(self.data_type)
+            ids.OperationID[ids.DeviceID(self.device_type).name].value(self.operation)
+            raise
+
     def as_mono_str(self) -> str:
-        device_name = ids.DeviceID(self.device_type).name
-        return ' '.join((f'{ids.BoardID(self.destination).name:<9}',
-                         f'{ids.PriorityID(self.priority).name:<4}',
-                         f'{ids.ActionID(self.action).name:<8}',
-                         f'{ids.BoardID(self.source).name:<7}',
-                         f'{device_name:<9}',
-                         f'{self.device_id:<2}',
-                         f'{self.payload_format_str(self.data_type):<7}',
-                         f'{ids.OperationID[device_name].value(self.operation).name:<15}',
-                         f'{self.payload}')).lower()
+        key = self._routing_key
+        prefix = _MONO_PREFIXES.get(key)
+        if prefix is None:
+            destination, priority, action, source, device_name, _, operation = self._names()
+            prefix = ' '.join((f'{destination:<9}',
+                               f'{priority:<4}',
+                               f'{action:<8}',
+                               f'{source:<7}',
+                               f'{device_name:<9}',
+                               f'{self.device_id:<2}',
+                               f'{self.payload_format_str(self.data_type):<7}',
+                               f'{operation:<15}', ''))
+            _cache_prefix(_MONO_PREFIXES, key, prefix)
+        return prefix + str(self.payload).lower()
+
+    def _str_prefix(self) -> str:
+        key = self._routing_key
+        prefix = _STR_PREFIXES.get(key)
+        if prefix is None:
+            destination, priority, action, source, device_name, data_type, operation = self._names()
+            prefix = ', '.join((f'frame({destination}', priority, action, source, device_name,
+                                f'{self.device_id}', data_type, operation, ''))
+            _cache_prefix(_STR_PREFIXES, key, prefix)
+        return prefix
 
     def __str__(self):
-        device_name = ids.DeviceID(self.device_type).name
-        return ', '.join((f'Frame({ids.BoardID(self.destination).name}',
-                          f'{ids.PriorityID(self.priority).name}',
-                          f'{ids.ActionID(self.action).name}',
-                          f'{ids.BoardID(self.source).name}',
-                          f'{device_name}',
-                          f'{self.device_id}',
-                          f'{ids.DataTypeID(self.data_type).name}',
-                          f'{ids.OperationID[device_name].value(self.operation).name}',
-                          f'{self.payload})')).lower()
+        return self._str_prefix() + str(self.payload).lower() + ')'
+
+
+_VALUE_FIELDS = tuple(f.name for f in fields(Frame) if f.name != 'payload')
+
+# lowercase names of the ids, precomputed so rendering a frame needs no enum lookups
+_BOARD_NAMES = {int(board): board.name.lower() for board in ids.BoardID}
+_PRIORITY_NAMES = {int(priority): priority.name.lower() for priority in ids.PriorityID}
+_ACTION_NAMES = {int(action): action.name.lower() for action in ids.ActionID}
+_DEVICE_NAMES = {int(device): device.name.lower() for device in ids.DeviceID}
+_DATA_TYPE_NAMES = {int(data_type): data_type.name.lower() for data_type in ids.DataTypeID}
+_OPERATION_NAMES = {(int(device), int(operation)): operation.name.lower()
+                    for device in ids.DeviceID for operation in ids.OperationID[device.name].value}
+
+# rendered text up to the payload, keyed by all other fields of the frame
+_STR_PREFIXES = {}
+_MONO_PREFIXES = {}
+# a bounded cache, the number of distinct frames used in practice is small
+_PREFIX_CACHE_SIZE = 4096
+
+
+def _cache_prefix(cache: dict, key: tuple, prefix: str) -> None:
+    if len(cache) >= _PREFIX_CACHE_SIZE:
+        cache.clear()
+    cache[key] = prefix
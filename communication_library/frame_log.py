@@ -0,0 +1,208 @@
+from bisect import bisect_right
+from collections import deque
+from enum import IntEnum
+from pathlib import Path
+from typing import Iterator, List, Optional, Tuple
+import struct
+import threading
+import time
+
+
+class FrameDirection(IntEnum):
+    FROM_CLIENT = 0
+    TO_CLIENTS = 1
+
+
+# magic, wall clock ns and monotonic ns at the moment the segment was opened
+SEGMENT_HEADER = struct.Struct('<8sQQ')
+SEGMENT_MAGIC = b'AGHFLOG1'
+# monotonic ns timestamp, direction, client id, raw frame bytes
+RECORD = struct.Struct('<QBH14s')
+# timestamp of the indexed record and its byte offset in the segment
+INDEX_ENTRY = struct.Struct('<QQ')
+
+SEGMENT_SUFFIX = '.frames'
+INDEX_SUFFIX = '.index'
+
+
+class FrameLogWriter:
+    """
+    Append-only recorder of raw frames split into fixed-size record segments.
+    Records are only queued by record(), packing and file writes happen
+    on a background thread so the caller never waits for disk I/O.
+    :param directory:       directory where segments are created
+    :param segment_size:    maximum size of a single segment in bytes
+    :param index_interval:  every n-th record of a segment is put in its index
+    :param flush_interval:  how often in seconds the writer thread flushes
+    """
+
+    def __init__(self, directory: str, segment_size: int = 64 * 1024 * 1024,
+                 index_interval: int = 1024, flush_interval: float = 0.2) -> None:
+        self._directory = Path(directory)
+        self._directory.mkdir(parents=True, exist_ok=True)
+        # microseconds keep two recordings started in the same second apart and in chronological order
+        now = time.time_ns()
+        self._session = time.strftime('%Y_%m_%d_%H_%M_%S', time.localtime(now // 1_000_000_000)) \
+            + f'_{now // 1000 % 1_000_000:06d}'
+        self._records_per_segment = max(1, (segment_size - SEGMENT_HEADER.size) // RECORD.size)
+        self._index_interval = index_interval
+        self._flush_interval = flush_interval
+        self._pending = deque()
+        self._segment_number = 0
+        self._segment_file = None
+        self._index_file = None
+        self._segment_records = 0
+        self.recorded_frames = 0
+        self._should_stop = threading.Event()
+        self._thread = threading.Thread(target=self._write_loop, name='frame-log-writer', daemon=True)
+        self._thread.start()
+
+    @property
+    def directory(self) -> Path:
+        return self._directory
+
+    def record(self, direction: FrameDirection, client_id: int, data: bytes) -> None:
+        """
+        Queues a frame for writing, safe to call from an event loop.
+        :param direction: whether the frame came from a client or goes to clients
+        :param client_id: id of the client that sent the frame, 0 if not applicable
+        :param data: raw encoded frame
+        """
+        self._pending.append((time.monotonic_ns(), direction, client_id, data))
+
+    def close(self) -> None:
+        """
+        Writes all queued records and closes the current segment.
+        """
+        self._should_stop.set()
+        self._thread.join()
+
+    def _write_loop(self) -> None:
+        while not self._should_stop.wait(self._flush_interval):
+            self._write_pending()
+        self._write_pending()
+        self._close_segment()
+
+    def _write_pending(self) -> None:
+        if not self._pending:
+            return
+        chunk = []
+        while self._pending:
+            if self._segment_file is None or self._segment_records == self._records_per_segment:
+                self._write_chunk(chunk)
+                chunk = []
+                self._open_segment()
+            timestamp, direction, client_id, data = self._pending.popleft()
+            if self._segment_records % self._index_interval == 0:
+                offset = SEGMENT_HEADER.size + self._segment_records * RECORD.size
+                self._index_file.write(INDEX_ENTRY.pack(timestamp, offset))
+            chunk.append(RECORD.pack(timestamp, direction, client_id, data))
+            self._segment_records += 1
+            self.recorded_frames += 1
+        self._write_chunk(chunk)
+        self._segment_file.flush()
+        self._index_file.flush()
+
+    def _write_chunk(self, chunk: List[bytes]) -> None:
+        if chunk:
+            self._segment_file.write(b''.join(chunk))
+
+    def _open_segment(self) -> None:
+        self._close_segment()
+        base = self._directory / f'{self._session}_{self._segment_number:05d}'
+        self._segment_number += 1
+        # an existing recording is never overwritten
+        self._segment_file = open(base.with_suffix(SEGMENT_SUFFIX), 'xb')
+        self._index_file = open(base.with_suffix(INDEX_SUFFIX), 'xb')
+        self._segment_file.write(SEGMENT_HEADER.pack(SEGMENT_MAGIC, time.time_ns(), time.monotonic_ns()))
+        self._segment_records = 0
+
+    def _close_segment(self) -> None:
+        if self._segment_file is not None:
+            self._segment_file.close()
+            self._index_file.close()
+            self._segment_file = None
+            self._index_file = None
+
+
+class FrameLogSegment:
+    """
+    Single recorded segment together with its sparse time index.
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        with open(path, 'rb') as segment_file:
+            magic, self.wall_clock_start, self.monotonic_start = SEGMENT_HEADER.unpack(
+                segment_file.read(SEGMENT_HEADER.size))
+        if magic != SEGMENT_MAGIC:
+            raise ValueError(f'{path} is not a frame log segment')
+        self.record_count = (path.stat().st_size - SEGMENT_HEADER.size) // RECORD.size
+        index_data = path.with_suffix(INDEX_SUFFIX).read_bytes()
+        index_data = index_data[:len(index_data) - len(index_data) % INDEX_ENTRY.size]
+        entries = list(INDEX_ENTRY.iter_unpack(index_data))
+        self.index_timestamps = [timestamp for timestamp, _ in entries]
+        self.index_offsets = [offset for _, offset in entries]
+        # the index is flushed after the records, a segment cut off by a crash may have records but no entry
+        self.first_timestamp: Optional[int] = self.index_timestamps[0] if self.index_timestamps \
+            else next((record[0] for record in self.records()), None)
+
+    def offset_before(self, timestamp: int) -> int:
+        """
+        Byte offset of the last indexed record not newer than timestamp.
+        """
+        position = bisect_right(self.index_timestamps, timestamp) - 1
+        return self.index_offsets[position] if position >= 0 else SEGMENT_HEADER.size
+
+    def records(self, offset: int = SEGMENT_HEADER.size,
+                chunk_records: int = 4096) -> Iterator[Tuple[int, int, int, bytes]]:
+        with open(self.path, 'rb') as segment_file:
+            segment_file.seek(offset)
+            while True:
+                chunk = segment_file.read(chunk_records * RECORD.size)
+                chunk = chunk[:len(chunk) - len(chunk) % RECORD.size]
+                if not chunk:
+                    return
+                yield from RECORD.iter_unpack(chunk)
+
+
+class FrameLogReader:
+    """
+    Reads segments written by FrameLogWriter in recording order.
+    :param directory: directory containing the recorded segments
+    :param session:   session prefix of the segments, None for the newest session
+    """
+
+    def __init__(self, directory: str, session: Optional[str] = None) -> None:
+        paths = sorted(Path(directory).glob('*' + SEGMENT_SUFFIX))
+        if session is None and paths:
+            session = paths[-1].stem.rsplit('_', 1)[0]
+        paths = [path for path in paths if path.stem.rsplit('_', 1)[0] == session]
+        self.session = session
+        self.segments = [FrameLogSegment(path) for path in paths]
+        self.segments = [segment for segment in self.segments if segment.record_count]
+        if not self.segments:
+            raise FileNotFoundError(f'No recorded frames found in {directory}')
+
+    @property
+    def first_timestamp(self) -> int:
+        return self.segments[0].first_timestamp
+
+    def records(self, start: Optional[int] = None) -> Iterator[Tuple[int, int, int, bytes]]:
+        """
+        Yields (timestamp ns, direction, client id, frame) tuples.
+        :param start: monotonic ns timestamp to seek to, None for the beginning
+        """
+        first_segment = 0
+        if start is not None:
+            starts = [segment.first_timestamp for segment in self.segments]
+            first_segment = max(0, bisect_right(starts, start) - 1)
+
+        for segment in self.segments[first_segment:]:
+            offset = SEGMENT_HEADER.size
+            if start is not None:
+                offset = segment.offset_before(start)
+            for record in segment.records(offset):
+                if start is not None and record[0] < start:
+                    continue
+                yield record
@@ -0,0 +1,82 @@
+from enum import IntEnum
+from typing import BinaryIO, Iterator, Tuple
+import struct
+import time
+
+from communication_library import ids
+from communication_library.frame import Frame
+
+
+class TraceDirection(IntEnum):
+    RECEIVED = 0
+    SENT = 1
+
+
+# magic, wall clock ns and monotonic ns at the moment the trace was opened
+TRACE_HEADER = struct.Struct('<8sQQ')
+TRACE_MAGIC = b'AGHTRC01'
+# monotonic ns timestamp, direction, frame fields without the payload, raw payload
+TRACE_RECORD = struct.Struct('<QB8B4s')
+# payload of every data type packed into 4 bytes
+PAYLOAD_STRUCTS = {int(ids.DataTypeID.NO_DATA): struct.Struct('<4x'),
+                   int(ids.DataTypeID.UINT32): struct.Struct('<I'),
+                   int(ids.DataTypeID.UINT16): struct.Struct('<H2x'),
+                   int(ids.DataTypeID.UINT8): struct.Struct('<B3x'),
+                   int(ids.DataTypeID.INT32): struct.Struct('<i'),
+                   int(ids.DataTypeID.INT16): struct.Struct('<h2x'),
+                   int(ids.DataTypeID.INT8): struct.Struct('<b3x'),
+                   int(ids.DataTypeID.FLOAT): struct.Struct('<f'),
+                   int(ids.DataTypeID.INT16X2): struct.Struct('<hh'),
+                   int(ids.DataTypeID.UINT16INT16): struct.Struct('<Hh')}
+
+
+class FrameTraceWriter:
+    """
+    Compact binary trace of frames, a faster alternative to logging every frame as text.
+    A record is 22 bytes packed with struct, without any enum lookups or string formatting;
+    read_trace() turns a trace back into frames.
+    :param path:        trace file, overwritten
+    :param buffer_size: bytes buffered before the file is written
+    """
+
+    def __init__(self, path: str, buffer_size: int = 1024 * 1024) -> None:
+        self._file: BinaryIO = open(path, 'wb', buffering=buffer_size)
+        self._file.write(TRACE_HEADER.pack(TRACE_MAGIC, time.time_ns(), time.monotonic_ns()))
+        self.traced_frames = 0
+
+    def trace(self, direction: TraceDirection, frame: Frame) -> None:
+        payload = PAYLOAD_STRUCTS[frame.data_type].pack(*frame.payload)
+        self._file.write(TRACE_RECORD.pack(time.monotonic_ns(), direction,
+                                           frame.destination, frame.priority, frame.action, frame.source,
+                                           frame.device_type, frame.device_id, frame.data_type, frame.operation,
+                                           payload))
+        self.traced_frames += 1
+
+    def close(self) -> None:
+        self._file.close()
+
+
+def read_trace(path: str) -> Iterator[Tuple[int, TraceDirection, Frame]]:
+    """
+    Yields (wall clock ns, direction, frame) for every record of a trace.
+    """
+    with open(path, 'rb') as trace_file:
+        magic, wall_start, monotonic_start = TRACE_HEADER.unpack(trace_file.read(TRACE_HEADER.size))
+        if magic != TRACE_MAGIC:
+            raise ValueError(f'{path} is not a frame trace')
+        data = trace_file.read()
+    # a record cut off by an interrupted write is skipped
+    usable = len(data) - len(data) % TRACE_RECORD.size
+    for timestamp, direction, *values, payload in TRACE_RECORD.iter_unpack(data[:usable]):
+        data_type = values[6]
+        yield (wall_start + timestamp - monotonic_start, TraceDirection(direction),
+               Frame(*values, payload=PAYLOAD_STRUCTS[data_type].unpack(payload)))
+
+
+if __name__ == '__main__':
+    import sys
+    from datetime import datetime
+
+    for wall_time, trace_direction, traced_frame in read_trace(sys.argv[1]):
+        print(f'{datetime.fromtimestamp(wall_time / 1e9).isoformat(timespec="microseconds")} '
+              f'{trace_direction.name.lower():<8} {traced_frame.as_mono_str()}')
@@ -16,6 +16,8 @@ class DeviceID(IntEnum):
     SERVO = 0x00
     RELAY = 0x01
     SENSOR = 0x02
+    PROXY = 0x03 # control frames exchanged with the proxy itself, destination BoardID.PROXY
+    SIMULATOR = 0x04 # control frames of the rocket simulator, device_id selects the rocket
 
 
 @unique
@@ -65,10 +67,25 @@ class _RelayOperationID(IntEnum):
 class _SensorOperationID(IntEnum):
     READ = 0x01
 
+@unique
+class _ProxyOperationID(IntEnum):
+    PING = 0x01 # payload: token echoed back in the ACK
+    SESSION_OPEN = 0x02 # ACK payload: id of the new resumable session
+    SESSION_RESUME = 0x03 # payload: session id, followed by SESSION_SEQUENCE
+    SESSION_SEQUENCE = 0x04 # payload: sequence number of the last received frame
+    CREDIT = 0x05 # payload: frames the peer may send, requested window in the first request
+
+@unique
+class _SimulatorOperationID(IntEnum):
+    CHECKPOINT_SAVE = 0x01 # payload: index of the checkpoint name in the simulator's checkpoint file
+    CHECKPOINT_RESTORE = 0x02 # payload: index of the checkpoint name in the simulator's checkpoint file
+
 class OperationID(Enum):
     SERVO = _ServoOperationID
     RELAY = _RelayOperationID 
     SENSOR = _SensorOperationID
+    PROXY = _ProxyOperationID
+    SIMULATOR = _SimulatorOperationID
 
 
 class AckStatus(IntEnum):
@@ -0,0 +1,52 @@
+import atexit
+import logging
+import queue
+import sys
+from logging.handlers import QueueHandler, QueueListener
+from typing import List, TextIO
+
+
+_listeners: List[QueueListener] = []
+
+
+class DeferredQueueHandler(QueueHandler):
+    """
+    Queue handler passing records on unformatted, so the message, e.g. str() of a
+    frame given as a logging argument, is built by the listener thread. Arguments
+    must not change after the call, frames are immutable.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+def setup_queue_logging(logger: logging.Logger, fmt: str, stream: TextIO = None,
+                        level: int = logging.DEBUG) -> QueueListener:
+    """
+    Connects the logger to a console handler running on a background thread.
+    Logging only puts the record in a queue, so slow console output never stalls
+    the caller. Queued records are written out when the program exits.
+    :param logger: logger to set up
+    :param fmt:    format of the console lines
+    :param stream: console stream, stdout by default
+    :param level:  level of the logger
+    """
+    log_queue = queue.SimpleQueue()
+    console_handler = logging.StreamHandler(stream if stream is not None else sys.stdout)
+    console_handler.setFormatter(logging.Formatter(fmt=fmt))
+    listener = QueueListener(log_queue, console_handler, respect_handler_level=True)
+    listener.start()
+    _listeners.append(listener)
+
+    logger.setLevel(level)
+    logger.addHandler(DeferredQueueHandler(log_queue))
+    return listener
+
+
+@atexit.register
+def stop_queue_logging() -> None:
+    """
+    Writes out all queued records and stops the listener threads.
+    """
+    while _listeners:
+        _listeners.pop().stop()
@@ -0,0 +1,81 @@
+from bisect import bisect_left
+from typing import Dict, Iterable, List, Optional
+
+
+def format_labels(labels: Optional[Dict[str, object]]) -> str:
+    """
+    Formats labels in Prometheus text exposition format.
+    """
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{value}"' for name, value in labels.items()) + '}'
+
+
+class LatencyHistogram:
+    """
+    Fixed bucket histogram of durations in seconds, cheap enough to be
+    updated on every frame.
+    :param buckets: upper bounds of the buckets in seconds, ascending
+    """
+    DEFAULT_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005,
+                       0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                       0.1, 0.25, 0.5, 1.0, 2.5)
+
+    def __init__(self, buckets: Iterable[float] = DEFAULT_BUCKETS) -> None:
+        self.buckets = tuple(buckets)
+        # last slot counts values above the highest bucket
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.max = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+        if value > self.max:
+            self.max = value
+
+    def merge(self, other: 'LatencyHistogram') -> None:
+        assert self.buckets == other.buckets, 'Cannot merge histograms with different buckets'
+        self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+        self.sum += other.sum
+        self.count += other.count
+        self.max = max(self.max, other.max)
+
+    def reset(self) -> None:
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.max = 0.0
+
+    @property
+    def mean(self) -> float:
+        return self.sum / self.count if self.count else 0.0
+
+    def quantile(self, q: float) -> float:
+        """
+        Upper bound of the bucket containing the q-th quantile,
+        capped at the observed maximum.
+        """
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets, self.counts):
+            cumulative += bucket_count
+            if cumulative >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def prometheus_lines(self, name: str, labels: Optional[Dict[str, object]] = None) -> List[str]:
+        labels = dict(labels or {})
+        lines = []
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets, self.counts):
+            cumulative += bucket_count
+            lines.append(f'{name}_bucket{format_labels({**labels, "le": bound})} {cumulative}')
+        lines.append(f'{name}_bucket{format_labels({**labels, "le": "+Inf"})} {self.count}')
+        lines.append(f'{name}_sum{format_labels(labels)} {self.sum}')
+        lines.append(f'{name}_count{format_labels(labels)} {self.count}')
+        return lines
@@ -1,4 +1,6 @@
 import struct
+from dataclasses import fields
+from typing import Tuple
 
 import bitstruct
 from crccheck.crc import Crc32Mpeg2
@@ -9,13 +11,46 @@ from communication_library.frame import Frame
 from communication_library.ids import HEADER_ID
 
 
+def _values_layout() -> Tuple[Tuple[int, int], ...]:
+    # After bit reversal of every byte the little endian bitstruct packing
+    # places each field at a fixed bit offset of a little endian integer
+    layout = []
+    offset = 0
+    for f in fields(Frame):
+        if f.name == 'payload':
+            continue
+        bits = f.metadata['bits']
+        layout.append((offset, (1 << bits) - 1))
+        offset += bits
+    return tuple(layout)
+
+
+# every byte value with its bit order reversed, for bytes.translate()
+_REVERSED_BITS = bytes(int(f'{byte:08b}'[::-1], 2) for byte in range(256))
+
+
 class GroundStationProtocol:
     """
     AGH Space Systems main ground station protocol for rocket communication.
     """
     HEADER_BYTE_LENGTH = 1
+    VALUES_BYTE_LENGTH = 5
     PAYLOAD_BYTE_LENGTH = 4
     CRC_BYTE_LENGTH = 4
+    _VALUES_LAYOUT = _values_layout()
+    _DATA_TYPE_INDEX = [f.name for f in fields(Frame)].index('data_type')
+    # bitstruct formats parsed once instead of on every frame
+    _HEADER_FORMAT = bitstruct.compile(f'<u{HEADER_BYTE_LENGTH*8}')
+    _VALUES_FORMAT = bitstruct.compile('<' + Frame.values_format_str())
+    _PAYLOAD_FORMATS = {}
+
+    @classmethod
+    def _payload_format(cls, data_type: int):
+        payload_format = cls._PAYLOAD_FORMATS.get(data_type)
+        if payload_format is None:
+            payload_format = bitstruct.compile('<' + Frame.payload_format_str(data_type))
+            cls._PAYLOAD_FORMATS[data_type] = payload_format
+        return payload_format
 
     @classmethod
     def encode(cls, frame: Frame) -> bytes:
@@ -24,17 +59,18 @@ class GroundStationProtocol:
         except bitstruct.Error as err:
             raise ProtocolError(f'Encoding {frame} to bytes failed:' + str(err))
 
-        data = bytes(cls._reverse_bits(byte) for byte in data)
+        data = data.translate(_REVERSED_BITS)
         crc = cls.calculate_crc(data)
         return data + crc
 
     @classmethod
     def _pack(cls, frame: Frame) -> bytes:
-        values = tuple(v for k, v in frame.as_dict().items() if k != 'payload')
+        values = (frame.destination, frame.priority, frame.action, frame.source,
+                  frame.device_type, frame.device_id, frame.data_type, frame.operation)
 
-        header = bitstruct.pack(f'<u{cls.HEADER_BYTE_LENGTH*8}', HEADER_ID)
-        values = bitstruct.pack('<' + Frame.values_format_str(), *values)
-        payload = bitstruct.pack('<' + Frame.payload_format_str(frame.data_type), *frame.payload)
+        header = cls._HEADER_FORMAT.pack(HEADER_ID)
+        values = cls._VALUES_FORMAT.pack(*values)
+        payload = cls._payload_format(frame.data_type).pack(*frame.payload)
         return header + values + payload
 
     @classmethod
@@ -43,7 +79,7 @@ class GroundStationProtocol:
         if crc != cls.calculate_crc(data):
             raise ChecksumMismatchError
 
-        data = bytes(cls._reverse_bits(byte) for byte in data)
+        data = data.translate(_REVERSED_BITS)
         try:
             return cls._unpack(data)
         except bitstruct.Error as err:
@@ -54,11 +90,23 @@ class GroundStationProtocol:
         data, payload = data[:-cls.PAYLOAD_BYTE_LENGTH], data[-cls.PAYLOAD_BYTE_LENGTH:]
         _, values = data[:cls.HEADER_BYTE_LENGTH], data[cls.HEADER_BYTE_LENGTH:]
 
-        values = bitstruct.unpack('<' + Frame.values_format_str(), values)
-        data_type = Frame(*values).data_type
-        payload = bitstruct.unpack('<' + Frame.payload_format_str(data_type), payload)
+        values = cls._VALUES_FORMAT.unpack(values)
+        data_type = values[cls._DATA_TYPE_INDEX]
+        payload = cls._payload_format(data_type).unpack(payload)
         return Frame(*values, payload=payload)
 
+    @classmethod
+    def peek_values(cls, data: bytes) -> Tuple[int, ...]:
+        """
+        Reads frame values straight from encoded bytes without crc check
+        and payload decoding. Meant for routing frames without a full decode.
+        :param data: encoded frame, header byte included
+        :return: values in Frame field order, payload excluded
+        """
+        start = cls.HEADER_BYTE_LENGTH
+        packed = int.from_bytes(data[start:start + cls.VALUES_BYTE_LENGTH], 'little')
+        return tuple((packed >> offset) & mask for offset, mask in cls._VALUES_LAYOUT)
+
     @classmethod
     def calculate_crc(cls, data: bytes,
                       skip_padding: bool = False,
@@ -0,0 +1,113 @@
+from multiprocessing import shared_memory
+from typing import List, Optional, Tuple
+import struct
+
+
+class BroadcastRing:
+    """
+    Single producer, multiple consumer ring of frames in shared memory.
+    The producer never waits for consumers, a consumer that falls more than
+    capacity records behind loses the oldest ones and is told how many.
+    Every record carries the id of the client the frame originated from,
+    0 for frames coming from the station.
+    :param capacity: number of records kept in the ring
+    :param name:     name of an existing ring to attach to, None creates a new one
+    """
+    # published records count, capacity
+    HEADER = struct.Struct('<QQ')
+    SEQUENCE = struct.Struct('<Q')
+    # raw frame, origin client id
+    RECORD = struct.Struct('<14sI')
+
+    def __init__(self, capacity: int = 65536, name: Optional[str] = None) -> None:
+        if name is None:
+            size = self.HEADER.size + capacity * self.RECORD.size
+            self._memory = shared_memory.SharedMemory(create=True, size=size)
+            self.HEADER.pack_into(self._memory.buf, 0, 0, capacity)
+        else:
+            self._memory = shared_memory.SharedMemory(name=name)
+        _, self.capacity = self.HEADER.unpack_from(self._memory.buf, 0)
+        self._sequence = self.published
+
+    def __getstate__(self):
+        return {'name': self.name}
+
+    def __setstate__(self, state):
+        self.__init__(name=state['name'])
+
+    @property
+    def name(self) -> str:
+        return self._memory.name
+
+    @property
+    def published(self) -> int:
+        return self.SEQUENCE.unpack_from(self._memory.buf, 0)[0]
+
+    def _record_offset(self, sequence: int) -> int:
+        return self.HEADER.size + (sequence % self.capacity) * self.RECORD.size
+
+    def publish(self, data: bytes, origin: int = 0) -> None:
+        """
+        Appends a frame to the ring, must be called from a single process only.
+        """
+        self.RECORD.pack_into(self._memory.buf, self._record_offset(self._sequence), data, origin)
+        self._sequence += 1
+        # record is written before the sequence makes it visible to readers
+        self.SEQUENCE.pack_into(self._memory.buf, 0, self._sequence)
+
+    def reader(self) -> 'BroadcastRingReader':
+        return BroadcastRingReader(self)
+
+    def close(self) -> None:
+        self._memory.close()
+
+    def unlink(self) -> None:
+        self._memory.unlink()
+
+
+class BroadcastRingReader:
+    """
+    Cursor of a single consumer, starts at the newest published record.
+    """
+
+    def __init__(self, ring: BroadcastRing) -> None:
+        self._ring = ring
+        self._cursor = ring.published
+        self.lost_records = 0
+
+    @property
+    def pending(self) -> int:
+        return self._ring.published - self._cursor
+
+    def read(self, max_records: int = 1024) -> List[Tuple[bytes, int]]:
+        """
+        Returns up to max_records (frame, origin client id) tuples in publish order.
+        """
+        ring = self._ring
+        published = ring.published
+        if published == self._cursor:
+            return []
+        # the oldest slot is the next one the producer overwrites
+        if published - self._cursor >= ring.capacity:
+            self._skip(published + 1 - ring.capacity)
+
+        count = min(published - self._cursor, max_records)
+        buffer = ring._memory.buf
+        records = [ring.RECORD.unpack_from(buffer, ring._record_offset(self._cursor + i))
+                   for i in range(count)]
+
+        # records overwritten by the producer while they were copied are discarded,
+        # including the one that may be in the middle of being written
+        overwritten = ring.published + 1 - ring.capacity - self._cursor
+        start = self._cursor
+        self._cursor += count
+        if overwritten > 0:
+            self.lost_records += min(overwritten, count)
+            records = records[overwritten:]
+            if start + overwritten > self._cursor:
+                self._skip(start + overwritten)
+        return records
+
+    def _skip(self, sequence: int) -> None:
+        self.lost_records += sequence - self._cursor
+        self._cursor = sequence
@@ -126,6 +126,8 @@ class TcpTransport(Transport):
         except ValueError:
             raise TransportError('Socket parameters are incorrect')
 
+        # bytes left from a previous connection would misalign frames
+        self._receive_cache.clear()
         self._socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         self._socket.connect((address, port))
         self._socket.settimeout(0)
@@ -201,6 +203,20 @@ class TcpTransport(Transport):
         # Return requested amount of bytes
         return bytes(self._receive_cache.popleft() for _ in range(number_of_bytes))
 
+    def wait_readable(self, timeout: Optional[float], number_of_bytes: int = 1) -> bool:
+        """
+        Blocks until number_of_bytes can be read without waiting or the timeout passes.
+        :param timeout: seconds to wait at most, None for forever
+        :param number_of_bytes: bytes that have to be available, e.g. a whole frame
+        :return: True if data is available, False on timeout
+        """
+        if len(self._receive_cache) >= number_of_bytes:
+            return True
+        if not self._socket_open:
+            raise ClosedTransportError('Reading from a closed socket')
+        readable, _, _ = select.select([self._socket], [], [], timeout)
+        return bool(readable)
+
     @property
     def read_buffer_size(self) -> int:
         """
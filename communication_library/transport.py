@@ -1,3 +1,4 @@
+from typing import Optional
 from abc import ABC, abstractmethod
 from enum import IntEnum
 
@@ -74,6 +75,10 @@ class Transport(ABC):
     def read(self, number_of_bytes: int) -> bytes:
         pass
 
+    @abstractmethod
+    def wait_readable(self, timeout: Optional[float], number_of_bytes: int = 1) -> bool:
+        pass
+
     @property
     @abstractmethod
     def read_buffer_size(self) -> int:
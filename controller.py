@@ -1,16 +1,33 @@
+import logging
 import sys
 import threading
-from time import sleep, time
+from time import perf_counter, sleep, time
 import yaml
-from communication_library.exceptions import TransportTimeoutError, UnknownCommand, UnregisteredCallbackError, WrongOperationOrderCLI
+from communication_library.exceptions import (ClosedTransportError, TransportError, TransportTimeoutError,
+                                              UnknownCommand, WrongOperationOrderCLI)
 from communication_library.frame import ids, Frame
 from communication_library.communication_manager import CommunicationManager, TransportType
 from communication_library.tcp_transport import TcpSettings
+from communication_library.log_pipeline import setup_queue_logging
+from communication_library.metrics import LatencyHistogram
+from telemetry_store import TelemetryStore
+from dashboard import SensorDashboard
 from argparse import ArgumentParser
 import traceback
 from nicegui import ui
 
 class Controller:
+    # commands allowed in flight before the proxy returns credits
+    FLOW_WINDOW = 64
+    # seconds between rocket status summaries, FEED frames can arrive thousands of times per second
+    STATUS_INTERVAL = 1.0
+    # seconds the receive thread waits for frames before checking should_keep_running
+    RECEIVE_WAIT = 0.1
+    # samples of history kept per sensor and servo, 1 MB per channel
+    TELEMETRY_CAPACITY = 65536
+    # seconds between attempts to connect again after the proxy connection is lost
+    RECONNECT_DELAY = 1.0
+
     def __init__(self, proxy_address, proxy_port, keep_running = True, print_logs = True, hardware_config: str = 'simulator_config.yaml'):
         
         with open(hardware_config, 'r') as config_file:
@@ -18,7 +35,11 @@ class Controller:
         
         self.manager = CommunicationManager()
         self.manager.change_transport_type(TransportType.TCP)
-        self.manager.connect(TcpSettings(address=proxy_address, port=proxy_port))
+        self.transport_settings = TcpSettings(address=proxy_address, port=proxy_port)
+        self.manager.connect(self.transport_settings)
+        # frames sent while the connection is down are kept by the proxy and resent after reconnect()
+        self.manager.open_session()
+        self.manager.enable_flow_control(self.FLOW_WINDOW)
 
         self.rocket_status = {
             "sensors": {},
@@ -27,7 +48,16 @@ class Controller:
         }
 
         self._initialize_from_controller()
+        # history of every sensor and servo, rocket_status holds only the latest values
+        self.telemetry = {
+            "sensors": TelemetryStore(self.config["devices"]["sensor"], self.TELEMETRY_CAPACITY),
+            "servos": TelemetryStore(self.config["devices"]["servo"], self.TELEMETRY_CAPACITY)
+        }
         self.print_logs = print_logs
+        self._logger = logging.getLogger("controller")
+        if not self._logger.handlers:
+            setup_queue_logging(self._logger, '[%(asctime)s] [%(levelname)s] %(message)s')
+        self._last_status_print = 0.0
 
         self.sensor_id_map = {cfg["device_id"]: name
                               for name, cfg in self.config["devices"]["sensor"].items()}
@@ -42,6 +72,12 @@ class Controller:
         self.relay_name_to_id = {name: cfg["device_id"]
                          for name, cfg in self.config["devices"]["relay"].items()}
 
+        # time from frames becoming readable to the end of their processing
+        self.receive_latency = LatencyHistogram()
+        # perf_counter() when the frames being processed became readable
+        self.frame_received_at = 0.0
+        # called on the receive thread with every frame from the rocket, after rocket_status is updated
+        self._frame_listeners = []
         self.should_keep_running = keep_running
         self._receive_thread = threading.Thread(target=self._receive_loop, daemon=True)
         self._receive_thread.start()
@@ -74,8 +110,7 @@ class Controller:
             operation=ids.OperationID.SERVO.value.POSITION,
             payload=(position,)
         )
-        self.manager.push(frame)
-        self.manager.send()
+        self._send(frame)
 
     def toggle_relay(self, device_id: int, state: bool):
         operation_id = (ids.OperationID.RELAY.value.OPEN if state 
@@ -98,67 +133,136 @@ class Controller:
             payload=()
         )
         
-        self.manager.push(frame)
-        self.manager.send()
+        self._send(frame)
         self.rocket_status["relays"][self.relay_id_map[device_id]] = state
 
+    def _send(self, frame: Frame):
+        # commands come from the GUI, the procedure and the receive thread (flushing held back frames),
+        # the send lock keeps the push and flush of one command together
+        with self.manager.send_lock:
+            self.manager.push(frame)
+            self._flush()
+
+    def _flush(self):
+        # a socket not writable right now raises ClosedTransportError, the frames stay buffered
+        # and go out with the next flush, e.g. when the proxy returns credits
+        try:
+            self.manager.flush()
+        except TransportError as e:
+            self._logger.warning(f"Sending commands failed, {self.manager.buffered_frames} kept buffered: {e}")
+
+    def add_frame_listener(self, listener):
+        self._frame_listeners = self._frame_listeners + [listener]
+
+    def remove_frame_listener(self, listener):
+        self._frame_listeners = [known for known in self._frame_listeners if known != listener]
+
     def _receive_loop(self):
         
         while self.should_keep_running:
             try:
-                frame = self.manager.receive()
-                self._process_frame(frame)
-                
+                # select() wakes the thread as soon as a frame arrives, no polling
+                if not self.manager.wait_for_frame(self.RECEIVE_WAIT):
+                    continue
+                ready_at = perf_counter()
+                self.frame_received_at = ready_at
+                frames = self.manager.receive_frames()
+
             except TransportTimeoutError:
-                sleep(0.5)
                 continue
-                
-            except UnregisteredCallbackError as e:
-                frame = e.frame
-                self._process_frame(frame)
-                
+
+            except ClosedTransportError:
+                # a write refused by a full socket raises the same error, only a closed socket is reconnected
+                if not self.manager.is_connected:
+                    self._reconnect()
+                continue
+
             except KeyboardInterrupt:
                 sys.exit()
 
-    def _process_frame(self, frame: Frame):
-        if frame.action == ids.ActionID.FEED:
-            if frame.device_type == ids.DeviceID.SENSOR:
-                sensor_name = self.sensor_id_map.get(frame.device_id)
-                if sensor_name: self.rocket_status["sensors"][sensor_name] = frame.data
+            for frame in frames:
+                if frame.destination == ids.BoardID.PROXY:
+                    # commands held back for lack of credits
+                    self._flush()
+                    continue
+                self._process_frame(frame)
+                self.receive_latency.observe(perf_counter() - ready_at)
 
-            elif frame.device_type == ids.DeviceID.SERVO:
-                servo_name = self.servo_id_map.get(frame.device_id)
-                if servo_name: self.rocket_status["servos"][servo_name] = frame.data
+    def _reconnect(self):
+        self._logger.warning("Connection to the proxy lost, reconnecting")
+        while self.should_keep_running:
+            try:
+                self.manager.reconnect(self.transport_settings)
+            except (OSError, TransportError) as e:
+                self._logger.debug(f"Reconnecting failed: {e}")
+                sleep(self.RECONNECT_DELAY)
+                continue
+            self._logger.info(f"Reconnected to the proxy, session {self.manager.session_id}")
+            return
 
+    def _process_frame(self, frame: Frame):
         if frame.action == ids.ActionID.FEED:
-            if self.print_logs: self.print_rocket_status()
+            self._process_feed(frame)
+        # the list is replaced, never modified, so iterating needs no lock
+        for listener in self._frame_listeners:
+            # listeners send commands from this thread, a failed write must not stop receiving
+            try:
+                listener(frame)
+            except TransportError as e:
+                self._logger.error(f"Frame listener {listener} failed: {e}")
+
+    def _process_feed(self, frame: Frame):
+        now = time()
+        if frame.device_type == ids.DeviceID.SENSOR:
+            sensor_name = self.sensor_id_map.get(frame.device_id)
+            if sensor_name:
+                value = frame.data
+                self.rocket_status["sensors"][sensor_name] = value
+                self.telemetry["sensors"].append(sensor_name, now, value)
+
+        elif frame.device_type == ids.DeviceID.SERVO:
+            servo_name = self.servo_id_map.get(frame.device_id)
+            if servo_name:
+                value = frame.data
+                self.rocket_status["servos"][servo_name] = value
+                self.telemetry["servos"].append(servo_name, now, value)
+
+        if self.print_logs:
+            if now >= self._last_status_print + self.STATUS_INTERVAL:
+                self._last_status_print = now
+                self.print_rocket_status()
 
     def print_rocket_status(self):
         try:
-            print("=== ROCKET STATUS  ===")
-
-            print("SENSORS:")
+            lines = ["=== ROCKET STATUS  ===", "SENSORS:"]
             for name, value in sorted(self.rocket_status["sensors"].items()):
-                print(f"  - {name:<20} : {value:.3f}")
+                lines.append(f"  - {name:<20} : {value:.3f}")
 
-            print("\nSERVOS:")
+            lines.append("\nSERVOS:")
             for name, value in sorted(self.rocket_status["servos"].items()):
-                print(f"  - {name:<20} : {value}")
+                lines.append(f"  - {name:<20} : {value}")
 
-            print("\nRELAYS:")
+            lines.append("\nRELAYS:")
             for name, value in sorted(self.rocket_status["relays"].items()):
                 value = "CLOSED" if value == False else "OPEN"
-                print(f"  - {name:<20} : {value}")
+                lines.append(f"  - {name:<20} : {value}")
 
-            print("=" * 30)
+            lines.append("=" * 30)
+            # a single record instead of many print calls, the console is handled by the logging thread
+            self._logger.info("\n".join(lines))
         except Exception as e:
-            print(f"Error printing rocket status: {e}")
+            self._logger.error(f"Error printing rocket status: {e}")
 
     def close(self):
         self.should_keep_running = False
         if hasattr(self, '_receive_thread') and self._receive_thread.is_alive():
             self._receive_thread.join(timeout=3.0)
         self.manager.disconnect()
+        if self.receive_latency.count:
+            self._logger.info(f"Receive latency: {self.receive_latency.count} frames, "
+                              f"mean {self.receive_latency.mean * 1e6:.0f} us, "
+                              f"p99 {self.receive_latency.quantile(0.99) * 1e6:.0f} us, "
+                              f"max {self.receive_latency.max * 1e6:.0f} us")
 
     def validate_change(self, type, name, value):
         if type == 'servo' and name == 'fuel_intake' and value == 0:
@@ -249,6 +353,8 @@ def main_gui(controller):
                         on_change=lambda e, n=name: refresh_slider(n)
                     ).props('label-always')
 
+        SensorDashboard(controller).build()
+
         ui.run(title='Rocket Controller', host='0.0.0.0', port=8082, reload=False)
 
     except KeyboardInterrupt:
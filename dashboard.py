@@ -0,0 +1,100 @@
+from time import time
+from typing import Dict, List, Tuple
+
+from nicegui import ui
+
+from telemetry_store import TelemetryChannel
+
+
+class SensorDashboard:
+    """
+    Live charts and gauges of every sensor from the hardware config, fed from the
+    controller's telemetry history. The receive thread only appends to the history;
+    the browser is updated by one timer at a fixed rate, so however many FEED frames
+    arrive, at most fps updates per second are sent, and only for sensors with new samples.
+    Chart histories are downsampled with LTTB to a fixed number of points.
+    The dashboard is built on the shared auto-index page, so every connected browser
+    gets the same updates, computed once.
+    :param controller: controller with the telemetry history
+    :param fps:        browser updates per second
+    :param window:     seconds of history on the charts
+    :param points:     points per chart line sent to the browser
+    """
+
+    def __init__(self, controller, fps: float = 10.0, window: float = 60.0, points: int = 200) -> None:
+        self.controller = controller
+        self.fps = fps
+        self.window = window
+        self.points = points
+        self.sensors = controller.config["devices"]["sensor"]
+        self._gauges: Dict[str, ui.echart] = {}
+        self._charts: Dict[str, ui.echart] = {}
+        # appended count and displayed value of every sensor at the last update
+        self._pushed_samples: Dict[str, int] = {}
+        self._pushed_values: Dict[str, float] = {}
+
+    def _gauge_options(self, name: str) -> dict:
+        settings = self.sensors[name]
+        low, high = settings.get("range", (0, 100))
+        return {
+            "series": [{
+                "type": "gauge",
+                "min": low,
+                "max": high,
+                "progress": {"show": True},
+                "detail": {"valueAnimation": False, "formatter": "{value} " + settings.get("units", "")},
+                "data": [{"value": 0, "name": name}],
+            }],
+            "animation": False,
+        }
+
+    def _chart_options(self, name: str) -> dict:
+        return {
+            "xAxis": {"type": "time"},
+            "yAxis": {"type": "value", "scale": True, "name": self.sensors[name].get("units", "")},
+            "series": [{"type": "line", "showSymbol": False, "data": []}],
+            "grid": {"left": 50, "right": 20, "top": 30, "bottom": 30},
+            "animation": False,
+        }
+
+    def build(self) -> None:
+        with ui.card().classes('w-full'):
+            ui.label("Sensors").classes('text-lg font-bold mb-4')
+            for name in self.sensors:
+                with ui.row().classes('w-full no-wrap items-center'):
+                    self._gauges[name] = ui.echart(self._gauge_options(name)).classes('w-64 h-64')
+                    self._charts[name] = ui.echart(self._chart_options(name)).classes('grow h-64')
+        ui.timer(1.0 / self.fps, self.refresh)
+
+    def chart_data(self, channel: TelemetryChannel, now: float) -> List[Tuple[float, float]]:
+        """
+        Downsampled chart line of the last window seconds: timestamps in milliseconds
+        and values rounded to keep the update small.
+        """
+        timestamps, values = channel.downsample(self.points, now - self.window, method='lttb')
+        return list(zip((timestamps * 1000).round().tolist(), values.round(3).tolist()))
+
+    def changed(self) -> List[str]:
+        """
+        Sensors with samples appended since the last update.
+        """
+        history = self.controller.telemetry["sensors"]
+        return [name for name in self.sensors
+                if history[name].appended != self._pushed_samples.get(name, 0)]
+
+    def refresh(self) -> None:
+        history = self.controller.telemetry["sensors"]
+        now = time()
+        for name in self.changed():
+            channel = history[name]
+            self._pushed_samples[name] = channel.appended
+            value = round(channel.latest()[1], 2)
+            if value != self._pushed_values.get(name):
+                self._pushed_values[name] = value
+                gauge = self._gauges[name]
+                gauge.options["series"][0]["data"][0]["value"] = value
+                gauge.update()
+
+            chart = self._charts[name]
+            chart.options["series"][0]["data"] = self.chart_data(channel, now)
+            chart.update()
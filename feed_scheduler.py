@@ -0,0 +1,141 @@
+from typing import Callable, Dict, List, Optional
+
+from communication_library.frame import ids, Frame
+from communication_library.metrics import LatencyHistogram
+
+
+class FeedDevice:
+    """
+    Single device sent in FEED frames. Frame fields other than the payload
+    are resolved from the config once, rate and calibration too.
+    :param name:             name of the device in the config
+    :param frame_fields:     Frame arguments without the payload
+    :param rate:             frames per second, 0 to never send
+    :param rates:            frames per second in given SimulationState values, override rate
+    :param calibration:      (a, b, scale), sent value = scale * (a * value + b)
+    :param recording:        whether sent values are written to the recording
+    """
+
+    def __init__(self, name: str, frame_fields: dict, rate: float, rates: dict,
+                 calibration=(1.0, 0.0, 1.0), recording: bool = False, units: str = '') -> None:
+        self.name = name
+        self.frame_fields = frame_fields
+        self.rate = rate
+        self.rates = rates
+        self.a, self.b, self.scale = calibration
+        self.recording = recording
+        self.units = units
+        self.last_sent = FeedScheduler.NEVER
+        self.last_interval = None
+
+    def interval(self, state: str) -> Optional[float]:
+        rate = self.rates.get(state, self.rate)
+        return 1.0 / rate if rate > 0 else None
+
+    def calibrated(self, value):
+        if self.frame_fields['data_type'] == ids.DataTypeID.FLOAT:
+            return self.scale * (self.a * value + self.b)
+        return int(round(self.scale * (self.a * value + self.b)))
+
+    def frame(self, value) -> Frame:
+        return Frame(**self.frame_fields, payload=(value,))
+
+
+class FeedScheduler:
+    """
+    Decides which devices are due for a FEED frame. Every device has its own rate,
+    optionally depending on the state of the rocket, and sensors have their
+    calibration from the config applied.
+    :param config:           hardware config with the devices
+    :param default_interval: seconds between frames of devices without a rate in the config
+    :param recorder:         called with (device name, sent value, units) for recorded sensors
+    """
+    NEVER = float('-inf')
+
+    def __init__(self, config: dict, default_interval: float,
+                 recorder: Callable[[str, object, str], None] = None) -> None:
+        default_rate = 1.0 / default_interval if default_interval > 0 else 0.0
+        self.recorder = recorder
+        self.devices: List[FeedDevice] = []
+        # liczba pominiętych wysyłek, gdy pętla nie nadążała z zadaną częstotliwością
+        self.missed_sends = 0
+        # opóźnienie wysyłki względem harmonogramu urządzenia
+        self.jitter = LatencyHistogram()
+
+        for name, settings in config['devices']['sensor'].items():
+            self.devices.append(self._device(name, settings, ids.DeviceID.SENSOR,
+                                             ids.DataTypeID[settings['data_type'].upper()],
+                                             ids.OperationID.SENSOR.value.READ, default_rate))
+        for name, settings in config['devices']['servo'].items():
+            self.devices.append(self._device(name, settings, ids.DeviceID.SERVO, ids.DataTypeID.INT16,
+                                             ids.OperationID.SERVO.value.POSITION, default_rate))
+
+    @staticmethod
+    def _device(name, settings, device_type, data_type, operation, default_rate) -> FeedDevice:
+        frame_fields = dict(destination=ids.BoardID.SOFTWARE,
+                            priority=ids.PriorityID.LOW,
+                            action=ids.ActionID.FEED,
+                            source=ids.BoardID[settings['board'].upper()],
+                            device_type=device_type,
+                            device_id=settings['device_id'],
+                            data_type=data_type,
+                            operation=operation)
+        rates = {state.upper(): float(rate) for state, rate in (settings.get('rates') or {}).items()}
+        calibration = (float(settings.get('a', 1)), float(settings.get('b', 0)), float(settings.get('scale', 1)))
+        return FeedDevice(name, frame_fields, float(settings.get('rate', default_rate)), rates,
+                          calibration, bool(settings.get('recording', False)), settings.get('units', ''))
+
+    def check_states(self, states) -> None:
+        """
+        Raises ValueError for rate profiles of states the rocket never enters, which would never be used.
+        :param states: names of the states the simulation can be in
+        """
+        for device in self.devices:
+            unknown = sorted(set(device.rates) - set(states))
+            if unknown:
+                raise ValueError(f'Feed rates of {device.name}: unknown states {", ".join(unknown)}')
+
+    def detach(self, names) -> Dict[str, FeedDevice]:
+        """
+        Removes devices from the schedule, e.g. sensors sent by another source, and returns them by name.
+        """
+        detached = {device.name: device for device in self.devices if device.name in names}
+        self.devices = [device for device in self.devices if device.name not in detached]
+        return detached
+
+    def shortest_interval(self, state: str) -> Optional[float]:
+        intervals = [interval for interval in (device.interval(state) for device in self.devices)
+                     if interval is not None]
+        return min(intervals, default=None)
+
+    def due_frames(self, now: float, state: str, values: dict) -> List[Frame]:
+        """
+        FEED frames of all devices due at now.
+        :param state:  SimulationState value selecting the rate profile
+        :param values: current value per device name, missing devices send 0
+        """
+        frames = []
+        for device in self.devices:
+            # interwał liczony od ostatniej wysyłki, zmiana stanu od razu zmienia częstotliwość
+            interval = device.interval(state)
+            if interval is None or now < device.last_sent + interval:
+                continue
+
+            value = device.calibrated(values.get(device.name, 0))
+            frames.append(device.frame(value))
+            if device.recording and self.recorder is not None:
+                self.recorder(device.name, value, device.units)
+
+            late = now - device.last_sent - interval
+            if interval == device.last_interval:
+                self.jitter.observe(late)
+            if interval != device.last_interval or late >= interval:
+                # po zmianie częstotliwości harmonogram zaczyna się od nowa, bez liczenia pominiętych
+                if interval == device.last_interval:
+                    self.missed_sends += int(late / interval)
+                device.last_sent = now
+                device.last_interval = interval
+            else:
+                # bez dryfu, kolejna wysyłka wypada w stałym odstępie od poprzedniej
+                device.last_sent += interval
+        return frames
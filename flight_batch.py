@@ -0,0 +1,484 @@
+import csv
+import logging
+import time
+from argparse import ArgumentParser
+
+import numpy as np
+
+from simulation_clock import VirtualClock
+from tcp_simulator import SimulationState, StandaloneMock
+
+
+# numer stanu w tablicy stanów = pozycja w SimulationState
+STATE_CODES = {state: code for code, state in enumerate(SimulationState)}
+IDLE = STATE_CODES[SimulationState.IDLE]
+FILLING_OXIDIZER = STATE_CODES[SimulationState.FILLING_OXIDIZER]
+OXIDIZER_FILLED = STATE_CODES[SimulationState.OXIDIZER_FILLED]
+FILLING_FUEL = STATE_CODES[SimulationState.FILLING_FUEL]
+FUEL_FILLED = STATE_CODES[SimulationState.FUEL_FILLED]
+FLIGHT = STATE_CODES[SimulationState.FLIGHT]
+APOGEE = STATE_CODES[SimulationState.APOGEE]
+PARACHUTE_DEPLOYED = STATE_CODES[SimulationState.PARACHUTE_DEPLOYED]
+FREEFALL = STATE_CODES[SimulationState.FREEFALL]
+EXPLOSION = STATE_CODES[SimulationState.EXPLOSION]
+LANDED = STATE_CODES[SimulationState.LANDED]
+
+EXPLOSION_REASONS = ('none',
+                     'tank_overpressure',
+                     'valve_imbalance',
+                     'engine_flooded',
+                     'single_propellant',
+                     'intake_open',
+                     'ignition_overpressure',
+                     'parachute_under_thrust')
+REASON_CODES = {reason: code for code, reason in enumerate(EXPLOSION_REASONS)}
+
+GRAVITY = 9.81
+
+# parametry procedury startowej, domyślne zakresy losowania
+PARAMETER_RANGES = {
+    # ciśnienie utleniacza, przy którym kończy się podgrzewanie [bar]
+    'ignition_pressure': (35.0, 75.0),
+    # czas od osiągnięcia ciśnienia do otwarcia zaworu głównego paliwa, grzałka dalej działa [s]
+    'ignition_delay': (0.0, 5.0),
+    # opóźnienie otwarcia zaworu głównego utleniacza względem zaworu paliwa [s]
+    'valve_skew': (0.0, 1.5),
+    # opóźnienie zapalnika względem zaworu głównego paliwa, ujemne = przed zaworami [s]
+    'igniter_delay': (-0.5, 1.5),
+    # czas od zapłonu do otwarcia spadochronu [s]
+    'parachute_time': (0.0, 60.0),
+}
+
+
+def sample_parameters(size: int, ranges: dict = None, seed: int = None) -> dict:
+    """
+    Uniformly sampled procedure parameters for size scenarios.
+    :param ranges: (low, high) per parameter, missing ones use PARAMETER_RANGES
+    """
+    rng = np.random.default_rng(seed)
+    ranges = {**PARAMETER_RANGES, **(ranges or {})}
+    return {name: rng.uniform(low, high, size) for name, (low, high) in ranges.items()}
+
+
+class FlightBatch:
+    """
+    Many independent rockets simulated together with NumPy arrays, one element per rocket.
+    Every step applies the transition and explosion rules of StandaloneMock.update_physics
+    to all rockets at once with masks. The controller follows flight_procedure.yaml,
+    its timing given per rocket by the PARAMETER_RANGES parameters.
+    :param parameters: array (or scalar) per procedure parameter
+    """
+    # tablice z elementem na rakietę, w trakcie run() zostają w nich tylko rakiety jeszcze w locie
+    _ARRAYS = ('state', 'reason', 'crashed', 'ignition_failed',
+               'fuel_level', 'oxidizer_level', 'oxidizer_pressure', 'altitude', 'angle',
+               'velocity', 'max_altitude', 'thrust_multiplier',
+               'fuel_intake', 'oxidizer_intake', 'heater',
+               'pressure_reached_time', 'fuel_main_open_time', 'oxidizer_main_open_time',
+               'igniter_start_time', 'ignition_time', 'apogee_reached_time')
+
+    def __init__(self, parameters: dict) -> None:
+        arrays = {name: np.asarray(parameters[name], dtype=float) for name in PARAMETER_RANGES}
+        self.size = max(array.size for array in arrays.values())
+        self.parameters = {name: np.broadcast_to(array, self.size) for name, array in arrays.items()}
+        n = self.size
+
+        self.time = 0.0
+        self.state = np.full(n, IDLE, dtype=np.int8)
+        self.reason = np.zeros(n, dtype=np.int8)
+        self.crashed = np.zeros(n, dtype=bool)
+        self.ignition_failed = np.zeros(n, dtype=bool)
+
+        self.fuel_level = np.zeros(n)
+        self.oxidizer_level = np.zeros(n)
+        self.oxidizer_pressure = np.zeros(n)
+        self.altitude = np.zeros(n)
+        self.angle = np.full(n, 2.0)
+        self.velocity = np.zeros(n)
+        self.max_altitude = np.zeros(n)
+        self.thrust_multiplier = np.ones(n)
+
+        # stan urządzeń ustawiany przez procedurę
+        self.fuel_intake = np.zeros(n, dtype=bool)
+        self.oxidizer_intake = np.ones(n, dtype=bool)
+        self.heater = np.zeros(n, dtype=bool)
+
+        # NaN = zdarzenie jeszcze nie nastąpiło
+        self.pressure_reached_time = np.full(n, np.nan)
+        self.fuel_main_open_time = np.full(n, np.nan)
+        self.oxidizer_main_open_time = np.full(n, np.nan)
+        self.igniter_start_time = np.full(n, np.nan)
+        self.ignition_time = np.full(n, np.nan)
+        self.apogee_reached_time = np.full(n, np.nan)
+
+    @property
+    def finished(self) -> bool:
+        return bool(np.isin(self.state, (EXPLOSION, LANDED)).all())
+
+    def _explode(self, mask: np.ndarray, reason: str) -> None:
+        self.state[mask] = EXPLOSION
+        self.reason[mask] = REASON_CODES[reason]
+
+    def _apply_procedure(self, state: np.ndarray) -> None:
+        # kontroler reaguje na odczyty w tym samym kroku, w którym zmienił się stan
+        self.oxidizer_intake[state >= OXIDIZER_FILLED] = False
+        self.fuel_intake[state == OXIDIZER_FILLED] = True
+        self.fuel_intake[state >= FUEL_FILLED] = False
+        self.heater[state == FUEL_FILLED] = True
+
+        reached = self.heater & np.isnan(self.pressure_reached_time) & (
+            self.oxidizer_pressure >= self.parameters['ignition_pressure'])
+        self.pressure_reached_time[reached] = self.time
+        fuel_main = self.pressure_reached_time[reached] + self.parameters['ignition_delay'][reached]
+        self.fuel_main_open_time[reached] = fuel_main
+        self.oxidizer_main_open_time[reached] = fuel_main + self.parameters['valve_skew'][reached]
+        # zapalnik nie może zostać włączony przed odczytem ciśnienia, na który czeka procedura
+        self.igniter_start_time[reached] = np.maximum(self.time, fuel_main + self.parameters['igniter_delay'][reached])
+
+    def step(self, dt: float) -> None:
+        self.time += dt
+        t = self.time
+        state = self.state.copy()
+        self._apply_procedure(state)
+        parachute = t >= self.ignition_time + self.parameters['parachute_time']
+        pressure = self.oxidizer_pressure
+
+        m = state == IDLE
+        self.state[m & self.oxidizer_intake] = FILLING_OXIDIZER
+
+        m = state == FILLING_OXIDIZER
+        filling = m & self.oxidizer_intake
+        self.oxidizer_level[filling] = np.minimum(100.0, self.oxidizer_level[filling] + dt * 10.0)
+        pressure[filling] = np.minimum(40.0, pressure[filling] + dt * 2.0)
+        venting = m & ~self.oxidizer_intake & (self.oxidizer_level < 100.0)
+        pressure[venting] = np.maximum(0.0, pressure[venting] - dt * 1.0)
+        self.state[m & (self.oxidizer_level >= 100.0)] = OXIDIZER_FILLED
+
+        m = np.isin(state, (OXIDIZER_FILLED, FILLING_FUEL, FUEL_FILLED))
+        heated = m & self.heater
+        pressure[heated] = np.minimum(90.0, pressure[heated] + dt * 2.5)
+        cooled = m & ~self.heater
+        pressure[cooled] = np.maximum(30.0, pressure[cooled] - dt * 1.0)
+        overpressure = heated & (pressure >= 90.0)
+        self._explode(overpressure, 'tank_overpressure')
+
+        self.state[(state == OXIDIZER_FILLED) & ~overpressure & self.fuel_intake] = FILLING_FUEL
+
+        m = (state == FILLING_FUEL) & ~overpressure
+        filling = m & self.fuel_intake
+        self.fuel_level[filling] = np.minimum(100.0, self.fuel_level[filling] + dt * 10.0)
+        self.state[m & (self.fuel_level >= 100.0)] = FUEL_FILLED
+
+        m = (state == FUEL_FILLED) & ~overpressure
+        self._ignite(m, t)
+
+        self._fly(state == FLIGHT, parachute, t, dt)
+
+        m = state == APOGEE
+        self.angle[m] = np.minimum(180.0, self.angle[m] + dt * 20.0)
+        deployed = m & parachute
+        self.state[deployed] = PARACHUTE_DEPLOYED
+        # >= jak w simulator_model.yaml, integrator kończy odcinek dokładnie 10 s po apogeum
+        late = m & ~deployed & (t - self.apogee_reached_time >= 10.0)
+        self.state[late] = FREEFALL
+        falling = m & ~deployed & ~late
+        self.velocity[falling] -= GRAVITY * dt
+        self.altitude[falling] += self.velocity[falling] * dt
+
+        m = state == PARACHUTE_DEPLOYED
+        self.velocity[m] = np.maximum(-5.0, self.velocity[m] - GRAVITY * dt)
+        self.altitude[m] += self.velocity[m] * dt
+        self.angle[m] = np.where(self.angle[m] > 0, np.maximum(0.0, self.angle[m] - dt * 30.0),
+                                 np.minimum(0.0, self.angle[m] + dt * 30.0))
+        landed = m & (self.altitude <= 0)
+        self.state[landed] = LANDED
+
+        m = state == FREEFALL
+        self.velocity[m] -= GRAVITY * dt
+        self.altitude[m] += self.velocity[m] * dt
+        self.angle[m] = np.minimum(180.0, self.angle[m] + dt * 20.0)
+        # spadochron rozrywa się powyżej 30 m/s, przekaźnik zostaje włączony
+        self.state[m & parachute & (np.abs(self.velocity) <= 30.0)] = PARACHUTE_DEPLOYED
+        crashed = m & (self.altitude <= 0)
+        self.state[crashed] = LANDED
+        self.crashed[crashed] = True
+
+        touchdown = landed | crashed
+        self.altitude[touchdown] = 0.0
+        self.velocity[touchdown] = 0.0
+
+    def _ignite(self, m: np.ndarray, t: float) -> None:
+        fuel_main = self.fuel_main_open_time
+        oxidizer_main = self.oxidizer_main_open_time
+        igniter = self.igniter_start_time
+        ignited = m & (t >= fuel_main) & (t >= oxidizer_main) & (t >= igniter)
+
+        rules = (('valve_imbalance', np.abs(fuel_main - oxidizer_main) > 1.0),
+                 ('engine_flooded', (np.abs(igniter - fuel_main) > 1.0) | (np.abs(igniter - oxidizer_main) > 1.0)),
+                 ('single_propellant', igniter < np.minimum(fuel_main, oxidizer_main)),
+                 ('intake_open', self.fuel_intake | self.oxidizer_intake))
+        for reason, broken in rules:
+            self._explode(ignited & broken, reason)
+            ignited &= ~broken
+
+        pressure = self.oxidizer_pressure
+        # zapłon się nie udał, zapalnik jest wyłączany, a procedura nie próbuje ponownie
+        failed = ignited & (pressure < 40.0)
+        self.igniter_start_time[failed] = np.inf
+        self.ignition_failed[failed] = True
+        ignited &= ~failed
+
+        self._explode(ignited & (pressure > 65.0), 'ignition_overpressure')
+        ignited &= pressure <= 65.0
+
+        deviation = np.minimum(np.abs(pressure[ignited] - 55.0), np.abs(pressure[ignited] - 65.0))
+        optimal = pressure[ignited] >= 55.0
+        self.thrust_multiplier[ignited] = np.where(optimal, 1.0,
+                                                   np.maximum(0.5, 1.0 - (deviation / 15.0) * 0.5))
+        self.state[ignited] = FLIGHT
+        self.ignition_time[ignited] = t
+
+    def _fly(self, m: np.ndarray, parachute: np.ndarray, t: float, dt: float) -> None:
+        burning = m & (self.fuel_level > 0)
+        coasting = m & ~burning
+
+        self._explode(burning & parachute, 'parachute_under_thrust')
+        burning &= ~parachute
+        self.fuel_level[burning] = np.maximum(0.0, self.fuel_level[burning] - dt * 8.0)
+        self.oxidizer_level[burning] = np.maximum(0.0, self.oxidizer_level[burning] - dt * 8.0)
+        self.oxidizer_pressure[burning] = np.maximum(30.0, self.oxidizer_pressure[burning] - dt * 3.0)
+        self.velocity[burning] += (15.0 * self.thrust_multiplier[burning] - GRAVITY) * dt
+        self.altitude[burning] += self.velocity[burning] * dt
+        self.angle[burning] = np.minimum(30.0, self.angle[burning] + dt * 2.0)
+
+        # spadochron otwarty powyżej 30 m/s rozrywa się, lot balistyczny trwa dalej
+        deployed = coasting & parachute & (self.velocity <= 30.0)
+        self.state[deployed] = PARACHUTE_DEPLOYED
+        coasting &= ~deployed
+        self.velocity[coasting] -= GRAVITY * dt
+        self.altitude[coasting] += self.velocity[coasting] * dt
+        self.angle[coasting] = np.minimum(90.0, self.angle[coasting] + dt * 15.0)
+        self.max_altitude[coasting] = np.maximum(self.max_altitude[coasting], self.altitude[coasting])
+
+        apogee = coasting & (self.velocity <= 0) & np.isnan(self.apogee_reached_time)
+        self.apogee_reached_time[apogee] = t
+        self.state[apogee] = APOGEE
+
+    def run(self, dt: float = 0.1, timeout: float = 600.0, compact_every: int = 50) -> 'FlightBatch':
+        """
+        Steps until every rocket exploded or landed, or until timeout.
+        Every compact_every steps finished rockets are dropped from the arrays
+        once they are a quarter of them, results are put back at the end.
+        """
+        full_arrays = {name: getattr(self, name) for name in self._ARRAYS}
+        full_parameters = self.parameters
+        index = np.arange(self.size)
+        steps = 0
+        while self.time < timeout and not self.finished:
+            self.step(dt)
+            steps += 1
+            if steps % compact_every:
+                continue
+            active = ~np.isin(self.state, (EXPLOSION, LANDED))
+            if active.mean() < 0.75:
+                for name, array in full_arrays.items():
+                    array[index] = getattr(self, name)
+                index = index[active]
+                for name in self._ARRAYS:
+                    setattr(self, name, getattr(self, name)[active])
+                self.parameters = {name: array[active] for name, array in self.parameters.items()}
+
+        for name, array in full_arrays.items():
+            array[index] = getattr(self, name)
+            setattr(self, name, array)
+        self.parameters = full_parameters
+        return self
+
+    @property
+    def safe(self) -> np.ndarray:
+        """
+        Rockets that landed on the parachute.
+        """
+        return (self.state == LANDED) & ~self.crashed
+
+    def outcomes(self) -> np.ndarray:
+        """
+        Outcome of every rocket: landed, crash_landing, explosion or unfinished.
+        """
+        result = np.full(self.size, 'unfinished', dtype=object)
+        result[self.safe] = 'landed'
+        result[(self.state == LANDED) & self.crashed] = 'crash_landing'
+        result[self.state == EXPLOSION] = 'explosion'
+        return result
+
+    def outcome_counts(self) -> dict:
+        counts = {'landed': int(self.safe.sum()),
+                  'crash_landing': int(((self.state == LANDED) & self.crashed).sum()),
+                  'unfinished': int((~np.isin(self.state, (EXPLOSION, LANDED))).sum())}
+        exploded = self.reason[self.state == EXPLOSION]
+        for code, reason in enumerate(EXPLOSION_REASONS[1:], start=1):
+            counts[f'explosion_{reason}'] = int((exploded == code).sum())
+        return counts
+
+
+def procedure_steps(parameters: dict) -> list:
+    """
+    Steps of flight_procedure.yaml with the timing of one scenario, as FlightBatch runs them,
+    for StandaloneMock.run_procedure. The parachute is opened parachute_time after the last
+    ignition command instead of the apogee.
+    :param parameters: value per procedure parameter
+    """
+    steps = [{'servo': 'oxidizer_intake', 'position': 0},
+             {'until': {'sensor': 'oxidizer_level', 'above': 100}},
+             {'servo': 'oxidizer_intake', 'position': 100},
+             {'servo': 'fuel_intake', 'position': 0},
+             {'until': {'sensor': 'fuel_level', 'above': 100}},
+             {'servo': 'fuel_intake', 'position': 100},
+             {'relay': 'oxidizer_heater', 'state': 1},
+             {'until': {'sensor': 'oxidizer_pressure', 'above': parameters['ignition_pressure']}}]
+    fuel_main = parameters['ignition_delay']
+    commands = sorted([(fuel_main, {'servo': 'fuel_main', 'position': 0}),
+                       (fuel_main + parameters['valve_skew'], {'servo': 'oxidizer_main', 'position': 0}),
+                       (max(0.0, fuel_main + parameters['igniter_delay']), {'relay': 'igniter', 'state': 1})],
+                      key=lambda command: command[0])
+    elapsed = 0.0
+    for offset, command in commands:
+        if offset > elapsed:
+            steps.append({'wait': offset - elapsed})
+            elapsed = offset
+        steps.append(command)
+    steps.append({'wait': parameters['parachute_time']})
+    steps.append({'relay': 'parachute', 'state': 1})
+    return steps
+
+
+def aligned_parameters(parameters: dict, dt: float) -> dict:
+    """
+    Timing parameters rounded to the physics step, so both simulations send the commands in the same steps.
+    The relative timings are then moved below the step by a different small margin each, so that no
+    difference lands exactly on a threshold of the explosion rules, where rounding would decide the outcome.
+    """
+    margins = {'valve_skew': 2e-6, 'igniter_delay': 3e-6, 'parachute_time': 4e-6}
+    aligned = dict(parameters)
+    for name in ('ignition_delay', 'valve_skew', 'igniter_delay', 'parachute_time'):
+        aligned[name] = np.round(np.asarray(parameters[name]) / dt) * dt - margins.get(name, 0.0)
+    aligned['ignition_delay'] = np.maximum(0.0, aligned['ignition_delay'])
+    return aligned
+
+
+def compare_with_model(parameters: dict, dt: float = 0.1, timeout: float = 600.0,
+                       hardware_config: str = 'simulator_config.yaml', model: str = 'simulator_model.yaml',
+                       tolerance: float = 1e-3) -> list:
+    """
+    Runs the scenarios in FlightBatch and one by one in StandaloneMock on a VirtualClock with the
+    YAML model, and compares their outcomes and maximum altitudes. The batch repeats the rules and
+    rates of the model, so a change of the model not carried over to the batch shows up here.
+    :param parameters: array per procedure parameter, best aligned to dt with aligned_parameters()
+    :param tolerance:  allowed relative difference of the maximum altitude
+    :return: (scenario, batch outcome and altitude, model outcome and altitude) of every mismatch
+    """
+    batch = FlightBatch(parameters).run(dt, timeout)
+    outcomes = batch.outcomes()
+    mismatches = []
+    for index in range(batch.size):
+        scenario = {name: float(array[index]) for name, array in batch.parameters.items()}
+        mock = StandaloneMock(None, 0, hardware_config, 1, True, False, 1.0, False,
+                              clock=VirtualClock(), model=model)
+        result = mock.run_procedure(procedure_steps(scenario), dt, timeout)
+        states = [state for _, state in result['transitions']]
+        if result['state'] == SimulationState.EXPLOSION.value:
+            outcome = 'explosion'
+        elif result['state'] != SimulationState.LANDED.value:
+            outcome = 'unfinished'
+        elif states[-2] == SimulationState.FREEFALL.value:
+            outcome = 'crash_landing'
+        else:
+            outcome = 'landed'
+        altitude = batch.max_altitude[index]
+        if outcome != outcomes[index] or abs(altitude - result['max_altitude']) > tolerance * max(1.0, altitude):
+            mismatches.append((scenario, (outcomes[index], float(altitude)), (outcome, result['max_altitude'])))
+    return mismatches
+
+
+def envelope_table(parameters: dict, safe: np.ndarray, rows: str, columns: str, bins: int):
+    """
+    Share of safe landings for every combination of rows x columns parameter bins.
+    :return: row bin edges, column bin edges and a (bins, bins) array, NaN for empty cells
+    """
+    row_edges = np.linspace(parameters[rows].min(), parameters[rows].max(), bins + 1)
+    column_edges = np.linspace(parameters[columns].min(), parameters[columns].max(), bins + 1)
+    row_index = np.clip(np.searchsorted(row_edges, parameters[rows], side='right') - 1, 0, bins - 1)
+    column_index = np.clip(np.searchsorted(column_edges, parameters[columns], side='right') - 1, 0, bins - 1)
+    cells = row_index * bins + column_index
+    totals = np.bincount(cells, minlength=bins * bins)
+    safe_counts = np.bincount(cells, weights=safe, minlength=bins * bins)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        rates = (safe_counts / totals).reshape(bins, bins)
+    return row_edges, column_edges, rates
+
+
+def parse_range(text: str):
+    name, bounds = text.split('=', 1)
+    low, high = bounds.split(':', 1)
+    if name not in PARAMETER_RANGES:
+        raise ValueError(f'Unknown parameter {name}, expected one of: {", ".join(PARAMETER_RANGES)}')
+    return name, (float(low), float(high))
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description='Monte-Carlo sweep of the launch procedure timing.')
+    parser.add_argument('--scenarios', default=100000, type=int)
+    parser.add_argument('--seed', default=None, type=int)
+    parser.add_argument('--range', default=[], action='append', type=parse_range, dest='ranges',
+                        help='Sampling range of a parameter as name=low:high, can be repeated.')
+    parser.add_argument('--rows', default='ignition_pressure', choices=list(PARAMETER_RANGES))
+    parser.add_argument('--columns', default='parachute_time', choices=list(PARAMETER_RANGES))
+    parser.add_argument('--bins', default=8, type=int)
+    parser.add_argument('--physics-step', default=0.1, type=float)
+    parser.add_argument('--timeout', default=600.0, type=float,
+                        help='Simulated seconds after which unfinished flights are stopped.')
+    parser.add_argument('--output', default=None, help='CSV file for the safe envelope table.')
+    parser.add_argument('--check', default=0, type=int,
+                        help='Number of scenarios also run in StandaloneMock with the YAML model to compare outcomes.')
+    parser.add_argument('--hardware-config', default='simulator_config.yaml')
+    parser.add_argument('--model', default='simulator_model.yaml')
+    cl_args = parser.parse_args()
+
+    if cl_args.check:
+        check_parameters = aligned_parameters(sample_parameters(cl_args.check, dict(cl_args.ranges), cl_args.seed),
+                                              cl_args.physics_step)
+        # komunikaty symulatora z każdego scenariusza zasłoniłyby wynik porównania
+        logging.disable(logging.CRITICAL)
+        mismatches = compare_with_model(check_parameters, cl_args.physics_step, cl_args.timeout,
+                                        cl_args.hardware_config, cl_args.model)
+        logging.disable(logging.NOTSET)
+        for scenario, (batch_outcome, batch_altitude), (model_outcome, model_altitude) in mismatches:
+            print(f'Mismatch: batch {batch_outcome} {batch_altitude:.2f} m, '
+                  f'model {model_outcome} {model_altitude:.2f} m, parameters {scenario}')
+        print(f'{cl_args.check - len(mismatches)} of {cl_args.check} scenarios agree with the model')
+        if mismatches:
+            raise SystemExit(1)
+
+    parameters = sample_parameters(cl_args.scenarios, dict(cl_args.ranges), cl_args.seed)
+    start = time.perf_counter()
+    batch = FlightBatch(parameters).run(cl_args.physics_step, cl_args.timeout)
+    print(f'{batch.size} scenarios, {batch.time:.1f} s simulated in {time.perf_counter() - start:.2f} s')
+    for outcome, count in batch.outcome_counts().items():
+        if count:
+            print(f'  {outcome:<32} {count:>8} ({count / batch.size:.1%})')
+
+    row_edges, column_edges, rates = envelope_table(parameters, batch.safe, cl_args.rows,
+                                                    cl_args.columns, cl_args.bins)
+    column_labels = [f'{low:.1f}-{high:.1f}' for low, high in zip(column_edges, column_edges[1:])]
+    row_labels = [f'{low:.1f}-{high:.1f}' for low, high in zip(row_edges, row_edges[1:])]
+    width = max(len(label) for label in column_labels + row_labels) + 1
+    print(f'\nSafe landings [%], rows: {cl_args.rows}, columns: {cl_args.columns}')
+    print(' ' * width + ''.join(f'{label:>{width}}' for label in column_labels))
+    for label, row in zip(row_labels, rates):
+        print(f'{label:>{width}}' + ''.join(f'{rate * 100:>{width}.0f}' for rate in row))
+
+    if cl_args.output is not None:
+        with open(cl_args.output, 'w', newline='') as output_file:
+            writer = csv.writer(output_file)
+            writer.writerow([f'{cl_args.rows} \\ {cl_args.columns}'] + column_labels)
+            for label, row in zip(row_labels, rates):
+                writer.writerow([label] + [f'{rate:.4f}' for rate in row])
@@ -0,0 +1,192 @@
+from typing import Dict, List, Optional, Tuple
+
+
+# dokładność, z jaką wyznaczany jest moment zdarzenia [s]
+EVENT_TOLERANCE = 1e-9
+
+
+class MotionRegime:
+    """
+    Continuous part of a state: derivatives of sensors and rocket attributes,
+    their limits and the events a step must stop at.
+    :param guard:       compiled expression choosing the regime, None always applies
+    :param derivatives: (name, compiled expression) of d/dt of every variable, in the order they are updated
+    :param limits:      (low, high) per variable, None for no bound
+    :param events:      compiled expressions, an event occurs when one falls from positive to zero or below
+    """
+
+    def __init__(self, guard, derivatives: List[tuple], limits: Dict[str, tuple], events: list) -> None:
+        self.guard = guard
+        self.derivatives = derivatives
+        self.names = [name for name, _ in derivatives]
+        self.limits = limits
+        self.events = events
+
+    def clamp(self, name: str, value: float) -> float:
+        low, high = self.limits.get(name, (None, None))
+        if low is not None and value < low:
+            return low
+        if high is not None and value > high:
+            return high
+        return value
+
+    def rate(self, context, name: str, code, values: dict) -> float:
+        rate = context.evaluate(code)
+        # zmienna na granicy nie przekracza jej, dopóki pochodna wypycha ją na zewnątrz
+        return 0.0 if self.pinned(name, rate, values) else rate
+
+    def pinned(self, name: str, rate: float, values: dict) -> bool:
+        low, high = self.limits.get(name, (None, None))
+        return (low is not None and values[name] <= low and rate < 0) or \
+            (high is not None and values[name] >= high and rate > 0)
+
+    def event_values(self, context, values: dict) -> List[float]:
+        result = [context.evaluate(code) for code in self.events]
+        for name, (low, high) in self.limits.items():
+            if low is not None:
+                result.append(values[name] - low)
+            if high is not None:
+                result.append(high - values[name])
+        return result
+
+
+class SemiImplicitEuler:
+    """
+    One update per physics tick, every variable taking the already updated values of the
+    ones listed before it (velocity before altitude). Events are checked by the rules at
+    the end of the tick, so transitions overshoot by up to one tick.
+    """
+    name = 'euler'
+
+    def advance(self, context, regime: MotionRegime, start: float, duration: float) -> Tuple[dict, float]:
+        values = context.motion_values(regime)
+        context.overlay = values
+        context.now = start
+        try:
+            for name, code in regime.derivatives:
+                rate = regime.rate(context, name, code, values)
+                values[name] = regime.clamp(name, values[name] + rate * duration)
+        finally:
+            context.overlay = None
+        return values, duration
+
+
+class RungeKutta4:
+    """
+    Classic fourth order Runge-Kutta with steps of at most max_step seconds.
+    A step crossing an event is shortened by bisection, so transitions happen at the event.
+    :param max_step: longest single step in seconds
+    """
+    name = 'rk4'
+
+    def __init__(self, max_step: float = 0.5) -> None:
+        self.max_step = max_step
+        self._pinned = set()
+
+    def derivatives(self, context, regime: MotionRegime, values: dict, time: float) -> List[float]:
+        context.overlay = values
+        context.now = time
+        # granice sprawdzane są tylko na początku odcinka (self._pinned), w trakcie kroku pilnują ich zdarzenia,
+        # inaczej etapy pośrednie przekraczające granicę psułyby dokładność kroku
+        return [0.0 if name in self._pinned else context.evaluate(code) for name, code in regime.derivatives]
+
+    def step(self, context, regime: MotionRegime, values: dict, time: float, h: float) -> dict:
+        names = regime.names
+        start = [values[name] for name in names]
+
+        def shifted(rates, factor):
+            return {**values, **{name: x + factor * h * k for name, x, k in zip(names, start, rates)}}
+
+        k1 = self.derivatives(context, regime, values, time)
+        k2 = self.derivatives(context, regime, shifted(k1, 0.5), time + h / 2)
+        k3 = self.derivatives(context, regime, shifted(k2, 0.5), time + h / 2)
+        k4 = self.derivatives(context, regime, shifted(k3, 1.0), time + h)
+        result = dict(values)
+        for index, name in enumerate(names):
+            result[name] = start[index] + h / 6 * (k1[index] + 2 * k2[index] + 2 * k3[index] + k4[index])
+        return result
+
+    def next_step(self, context, regime: MotionRegime, values: dict, time: float,
+                  h: float) -> Tuple[dict, float]:
+        """
+        Accepted step from values, returns the new values and the step length taken.
+        """
+        return self.step(context, regime, values, time, h), h
+
+    def advance(self, context, regime: MotionRegime, start: float, duration: float) -> Tuple[dict, float]:
+        values = context.motion_values(regime)
+        context.overlay = values
+        context.now = start
+        self._pinned = {name for name, code in regime.derivatives
+                        if regime.pinned(name, context.evaluate(code), values)}
+        armed = [value > 0 for value in regime.event_values(context, values)]
+        elapsed = 0.0
+        try:
+            while elapsed < duration - EVENT_TOLERANCE:
+                h = min(self.max_step, duration - elapsed)
+                new_values, h = self.next_step(context, regime, values, start + elapsed, h)
+                if self._crossed(context, regime, new_values, start + elapsed + h, armed):
+                    new_values, h = self._locate(context, regime, values, start + elapsed, h, new_values, armed)
+                    return self._clamped(regime, new_values), elapsed + h
+                values = self._clamped(regime, new_values)
+                elapsed += h
+            return values, duration
+        finally:
+            context.overlay = None
+
+    @staticmethod
+    def _clamped(regime: MotionRegime, values: dict) -> dict:
+        return {name: regime.clamp(name, value) for name, value in values.items()}
+
+    @staticmethod
+    def _crossed(context, regime: MotionRegime, values: dict, time: float, armed: List[bool]) -> bool:
+        context.overlay = values
+        context.now = time
+        return any(was_armed and value <= 0
+                   for was_armed, value in zip(armed, regime.event_values(context, values)))
+
+    def _locate(self, context, regime, values, time, h, crossed_values, armed) -> Tuple[dict, float]:
+        # bisekcja długości kroku, zwracany jest koniec przedziału, w którym zdarzenie już zaszło
+        low, high = 0.0, h
+        while high - low > EVENT_TOLERANCE:
+            middle = (low + high) / 2
+            middle_values = self.step(context, regime, values, time, middle)
+            if self._crossed(context, regime, middle_values, time + middle, armed):
+                high, crossed_values = middle, middle_values
+            else:
+                low = middle
+        return crossed_values, high
+
+
+class AdaptiveRungeKutta4(RungeKutta4):
+    """
+    Fourth order Runge-Kutta with the step size chosen by step doubling, so the step
+    grows while the motion is smooth and shrinks where it is not. Events as in RungeKutta4.
+    :param max_step:  longest single step in seconds
+    :param tolerance: allowed error of a step, relative to the magnitude of the variables
+    """
+    name = 'adaptive'
+
+    def __init__(self, max_step: float = 10.0, tolerance: float = 1e-6) -> None:
+        super().__init__(max_step)
+        self.tolerance = tolerance
+        self._h: Optional[float] = None
+
+    def next_step(self, context, regime: MotionRegime, values: dict, time: float,
+                  h: float) -> Tuple[dict, float]:
+        h = min(h, self._h or h)
+        while True:
+            full = self.step(context, regime, values, time, h)
+            half = self.step(context, regime, values, time, h / 2)
+            half = self.step(context, regime, half, time + h / 2, h / 2)
+            error = max((abs(full[name] - half[name]) / (self.tolerance * (1.0 + abs(half[name])))
+                         for name in regime.names), default=0.0)
+            if error <= 1.0:
+                self._h = h * min(5.0, 0.9 * error ** -0.2) if error > 0 else h * 5.0
+                # ekstrapolacja Richardsona obu wyników
+                return {name: value + (half[name] - full[name]) / 15 if name in regime.names else value
+                        for name, value in half.items()}, h
+            h *= max(0.1, 0.9 * error ** -0.25)
+
+
+INTEGRATORS = {integrator.name: integrator for integrator in (SemiImplicitEuler, RungeKutta4, AdaptiveRungeKutta4)}
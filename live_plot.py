@@ -0,0 +1,166 @@
+import multiprocessing
+import struct
+import time
+from multiprocessing import shared_memory
+from typing import Optional, Tuple
+
+from matplotlib import pyplot as plt
+import numpy as np
+
+
+class SampleRing:
+    """
+    Single producer ring of (time, value) samples in shared memory, read by the
+    renderer process. The producer never waits, the renderer sees the newest capacity samples.
+    :param capacity: number of samples kept
+    :param name:     name of an existing ring to attach to, None creates a new one
+    """
+    # zapisane próbki, pojemność, flaga zakończenia
+    HEADER = struct.Struct('<QQQ')
+    COUNT = struct.Struct('<Q')
+
+    def __init__(self, capacity: int = 100000, name: Optional[str] = None) -> None:
+        if name is None:
+            self._memory = shared_memory.SharedMemory(create=True, size=self.HEADER.size + capacity * 16)
+            self.HEADER.pack_into(self._memory.buf, 0, 0, capacity, 0)
+        else:
+            self._memory = shared_memory.SharedMemory(name=name)
+        _, self.capacity, _ = self.HEADER.unpack_from(self._memory.buf, 0)
+        self._samples = np.ndarray((self.capacity, 2), dtype=np.float64,
+                                   buffer=self._memory.buf, offset=self.HEADER.size)
+        self._count = self.published
+
+    @property
+    def name(self) -> str:
+        return self._memory.name
+
+    @property
+    def published(self) -> int:
+        return self.COUNT.unpack_from(self._memory.buf, 0)[0]
+
+    @property
+    def finished(self) -> bool:
+        return bool(self.HEADER.unpack_from(self._memory.buf, 0)[2])
+
+    def push(self, sample_time: float, value: float) -> None:
+        self._samples[self._count % self.capacity] = (sample_time, value)
+        self._count += 1
+        # próbka jest zapisana, zanim licznik udostępni ją rendererowi
+        self.COUNT.pack_into(self._memory.buf, 0, self._count)
+
+    def finish(self) -> None:
+        self.HEADER.pack_into(self._memory.buf, 0, self._count, self.capacity, 1)
+
+    def snapshot(self) -> Tuple[int, np.ndarray]:
+        """
+        Number of samples published so far and a copy of the kept ones, oldest first.
+        """
+        count = self.published
+        if count <= self.capacity:
+            return count, self._samples[:count].copy()
+        start = count % self.capacity
+        return count, np.concatenate((self._samples[start:], self._samples[:start]))
+
+    def close(self) -> None:
+        # widok numpy trzyma bufor, musi zniknąć przed zamknięciem pamięci
+        del self._samples
+        self._memory.close()
+
+    def unlink(self) -> None:
+        self._memory.unlink()
+
+
+def _expanded(low: float, high: float, value_low: float, value_high: float) -> Tuple[float, float]:
+    # zakres rośnie z zapasem, żeby pełne przerysowanie było rzadkie
+    span = max(value_high - value_low, 1.0)
+    return min(low, value_low - 0.25 * span), max(high, value_high + 0.25 * span)
+
+
+def run_renderer(ring_name: str, max_fps: float) -> None:
+    """
+    Renderer process: draws the samples of the ring as one line artist, using blitting
+    and at most max_fps frames per second, until its window is closed.
+    """
+    ring = SampleRing(name=ring_name)
+    fig, ax = plt.subplots()
+    ax.set_ylabel("Velocity [m/s]")
+    ax.set_xlabel("Time [s]")
+    ax.set_title("Rocket velocity / time")
+    ax.grid(True)
+    ax.set_xlim(0.0, 10.0)
+    ax.set_ylim(-10.0, 10.0)
+    line, = ax.plot([], [], 'o', color='red', markersize=3, animated=True, label='velocity')
+    ax.legend(loc='upper right')
+
+    background = None
+
+    def on_draw(_event):
+        # pełne przerysowanie (np. zmiana osi lub okna) odświeża tło do blittingu
+        nonlocal background
+        background = fig.canvas.copy_from_bbox(fig.bbox)
+        ax.draw_artist(line)
+
+    fig.canvas.mpl_connect('draw_event', on_draw)
+    plt.show(block=False)
+    fig.canvas.draw()
+
+    drawn = 0
+    finished_shown = False
+    frame_interval = 1.0 / max_fps
+    while plt.fignum_exists(fig.number):
+        frame_start = time.perf_counter()
+        count, samples = ring.snapshot()
+        if count != drawn and len(samples):
+            drawn = count
+            line.set_data(samples[:, 0], samples[:, 1])
+            x_low, x_high = ax.get_xlim()
+            y_low, y_high = ax.get_ylim()
+            new_x = _expanded(x_low, x_high, samples[:, 0].min(), samples[:, 0].max())
+            new_y = _expanded(y_low, y_high, samples[:, 1].min(), samples[:, 1].max())
+            outside = (samples[:, 0].min() < x_low or samples[:, 0].max() > x_high or
+                       samples[:, 1].min() < y_low or samples[:, 1].max() > y_high)
+            if outside or background is None:
+                ax.set_xlim(*new_x)
+                ax.set_ylim(*new_y)
+                fig.canvas.draw()
+            else:
+                fig.canvas.restore_region(background)
+                ax.draw_artist(line)
+                fig.canvas.blit(fig.bbox)
+        elif ring.finished and not finished_shown:
+            finished_shown = True
+            ax.set_title("Rocket velocity / time (simulation ended)")
+            fig.canvas.draw()
+        fig.canvas.flush_events()
+        time.sleep(max(0.0, frame_interval - (time.perf_counter() - frame_start)))
+    ring.close()
+
+
+class LivePlot:
+    """
+    Velocity/time plot of the simulator drawn by a separate renderer process.
+    push() only writes the sample to shared memory, so plotting never blocks the simulation.
+    :param capacity: number of newest samples shown
+    :param max_fps:  frames per second drawn at most
+    """
+
+    def __init__(self, capacity: int = 100000, max_fps: float = 20.0) -> None:
+        self.ring = SampleRing(capacity)
+        self.process = multiprocessing.Process(target=run_renderer, args=(self.ring.name, max_fps),
+                                               name='live-plot', daemon=True)
+        self.process.start()
+
+    def push(self, sample_time: float, value: float) -> None:
+        self.ring.push(sample_time, value)
+
+    def close(self, wait: bool = True) -> None:
+        """
+        Ends the plot, with wait the window stays open until the user closes it.
+        """
+        self.ring.finish()
+        if wait:
+            self.process.join()
+        elif self.process.is_alive():
+            self.process.terminate()
+        self.ring.close()
+        self.ring.unlink()
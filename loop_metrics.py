@@ -0,0 +1,61 @@
+import json
+import os
+import time
+from typing import Dict, List
+
+from communication_library.metrics import LatencyHistogram
+
+
+class LoopMetrics:
+    """
+    Timing of the simulator loop: physics tick duration, lag of ticks behind their
+    intended cadence, time from receiving a frame to sending its ACK and feed jitter.
+    :param feed_jitter: histogram of feed send delays, filled by the FeedScheduler
+    """
+    DESCRIPTIONS = {'tick_duration': 'Time spent in one physics tick',
+                    'tick_lag': 'Delay of a physics tick behind its intended start',
+                    'ack_latency': 'Time from receiving a command frame to sending the response',
+                    'feed_jitter': 'Delay of a FEED frame behind its schedule'}
+
+    def __init__(self, feed_jitter: LatencyHistogram) -> None:
+        self.histograms: Dict[str, LatencyHistogram] = {'tick_duration': LatencyHistogram(),
+                                                        'tick_lag': LatencyHistogram(),
+                                                        'ack_latency': LatencyHistogram(),
+                                                        'feed_jitter': feed_jitter}
+        self.started = time.time()
+
+    def observe(self, name: str, value: float) -> None:
+        self.histograms[name].observe(value)
+
+    def summary(self) -> List[str]:
+        lines = []
+        for name, histogram in self.histograms.items():
+            lines.append(f'{name}: n={histogram.count} mean={histogram.mean * 1000:.3f} ms '
+                         f'p50={histogram.quantile(0.5) * 1000:.3f} ms p99={histogram.quantile(0.99) * 1000:.3f} ms '
+                         f'max={histogram.max * 1000:.3f} ms')
+        return lines
+
+    def as_dict(self) -> dict:
+        """
+        All histograms as plain data, quantiles are bucket upper bounds in seconds.
+        """
+        return {'started': self.started,
+                'duration': time.time() - self.started,
+                'histograms': {name: {'description': self.DESCRIPTIONS[name],
+                                      'count': histogram.count,
+                                      'sum': histogram.sum,
+                                      'mean': histogram.mean,
+                                      'p50': histogram.quantile(0.5),
+                                      'p90': histogram.quantile(0.9),
+                                      'p99': histogram.quantile(0.99),
+                                      'max': histogram.max,
+                                      'buckets': list(histogram.buckets),
+                                      'counts': histogram.counts}
+                               for name, histogram in self.histograms.items()}}
+
+    def write(self, path: str) -> None:
+        # zapis przez plik tymczasowy, przerwany zapis nie zostawia niepełnego pliku
+        temporary_path = path + '.tmp'
+        with open(temporary_path, 'w') as metrics_file:
+            json.dump(self.as_dict(), metrics_file, indent=2)
+        os.replace(temporary_path, path)
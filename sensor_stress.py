@@ -0,0 +1,194 @@
+import math
+from typing import List, Optional, Tuple
+
+import numpy as np
+import yaml
+
+from communication_library.frame import ids, Frame
+from feed_scheduler import FeedDevice, FeedScheduler
+
+
+class NoiseModel:
+    """
+    Error added to the simulated value of a sensor, generated in blocks of samples.
+    :param noise:       standard deviation of white noise
+    :param drift:       constant drift in units per second
+    :param random_walk: standard deviation of the random walk after one second
+    :param dropout:     probability that a sample is lost
+    :param burst:       mean number of samples lost in a row once a dropout starts
+    """
+
+    def __init__(self, noise: float = 0.0, drift: float = 0.0, random_walk: float = 0.0,
+                 dropout: float = 0.0, burst: float = 1.0) -> None:
+        self.noise = noise
+        self.drift = drift
+        self.random_walk = random_walk
+        self.dropout = dropout
+        self.burst = max(1.0, burst)
+
+    def offsets(self, rng: np.random.Generator, count: int, period: float,
+                walk: float) -> Tuple[np.ndarray, float]:
+        """
+        Random errors of count consecutive samples, the constant drift is added by the stream.
+        :param walk: value of the random walk before the block
+        :return: errors and the value of the random walk after the block
+        """
+        result = np.zeros(count)
+        if self.noise:
+            result += rng.normal(0.0, self.noise, count)
+        if self.random_walk:
+            steps = walk + np.cumsum(rng.normal(0.0, self.random_walk * math.sqrt(period), count))
+            result += steps
+            walk = float(steps[-1])
+        return result, walk
+
+    def kept(self, rng: np.random.Generator, count: int, dropped_before: bool) -> np.ndarray:
+        """
+        Mask of count samples which are not lost. Losses come in bursts: a dropout starts with
+        the probability giving the requested overall loss and lasts on average burst samples.
+        :param dropped_before: whether the sample before the block was lost
+        """
+        if not self.dropout:
+            return np.ones(count, dtype=bool)
+        # łańcuch Markowa o dwóch stanach, długości serii mają rozkład geometryczny
+        p_end = 1.0 / self.burst
+        p_start = min(1.0, self.dropout * p_end / (1.0 - self.dropout)) if self.dropout < 1.0 else 1.0
+        lost = dropped_before
+        # seria trwająca z poprzedniego bloku może skończyć się od razu
+        lengths = [rng.geometric(p_end if lost else p_start) - 1]
+        states = [lost]
+        total = lengths[0]
+        while total < count:
+            lost = not lost
+            run = int(rng.geometric(p_end if lost else p_start))
+            lengths.append(run)
+            states.append(lost)
+            total += run
+        return ~np.repeat(np.array(states), lengths)[:count]
+
+
+class StressStream:
+    """
+    Samples of one sensor at a fixed rate. Errors are generated block_size samples at a time,
+    so per sample only a slice of arrays is taken.
+    :param device:     feed device of the sensor, gives the frame fields and calibration
+    :param rate:       samples per second
+    :param model:      noise model of the sensor
+    :param rng:        random generator shared by the streams
+    :param block_size: samples generated at once
+    """
+
+    def __init__(self, device: FeedDevice, rate: float, model: NoiseModel, rng: np.random.Generator,
+                 block_size: int = 4096) -> None:
+        self.device = device
+        self.rate = rate
+        self.period = 1.0 / rate
+        self.model = model
+        self.rng = rng
+        self.block_size = block_size
+        self.float_payload = device.frame_fields['data_type'] == ids.DataTypeID.FLOAT
+        self.started: Optional[float] = None
+        self.emitted = 0
+        self.dropped = 0
+        self.skipped = 0
+        self._offsets = np.empty(0)
+        self._kept = np.empty(0, dtype=bool)
+        self._position = 0
+        self._walk = 0.0
+
+    def _refill(self) -> None:
+        self._offsets, self._walk = self.model.offsets(self.rng, self.block_size, self.period, self._walk)
+        self._kept = self.model.kept(self.rng, self.block_size,
+                                     bool(len(self._kept)) and not self._kept[-1])
+        self._position = 0
+
+    def due(self, now: float, value: float, max_backlog: float) -> np.ndarray:
+        """
+        Calibrated values of the samples due at now, lost ones left out.
+        Samples older than max_backlog seconds are skipped instead of sent in one burst.
+        """
+        if self.started is None:
+            self.started = now
+        count = int((now - self.started) * self.rate) + 1 - self.emitted - self.skipped
+        limit = max(1, int(max_backlog * self.rate))
+        if count > limit:
+            self.skipped += count - limit
+            count = limit
+
+        parts = []
+        while count > 0:
+            if self._position >= len(self._offsets):
+                self._refill()
+            taken = min(count, len(self._offsets) - self._position)
+            window = slice(self._position, self._position + taken)
+            block = value + self._offsets[window]
+            if self.model.drift:
+                first = self.emitted + self.skipped
+                block += self.model.drift * self.period * np.arange(first, first + taken)
+            parts.append(block[self._kept[window]])
+            self.dropped += taken - int(np.count_nonzero(self._kept[window]))
+            self._position += taken
+            self.emitted += taken
+            count -= taken
+        if not parts:
+            return np.empty(0)
+
+        values = self.device.scale * (self.device.a * np.concatenate(parts) + self.device.b)
+        return values if self.float_payload else np.rint(values)
+
+    def frames(self, values: np.ndarray) -> List[Frame]:
+        fields = self.device.frame_fields
+        cast = float if self.float_payload else int
+        return [Frame(**fields, payload=(cast(value),)) for value in values.tolist()]
+
+
+class SensorStress:
+    """
+    Stress mode of the simulator: sensors from the stress config are sent as high rate
+    streams with noise, drift and dropout instead of their normal FEED frames.
+    :param config:         stress config (see stress_config.yaml) or path to it
+    :param feed_scheduler: normal feed of the simulator, the stressed sensors are detached from it
+    """
+
+    def __init__(self, config, feed_scheduler: FeedScheduler) -> None:
+        if not isinstance(config, dict):
+            with open(config, 'r') as config_file:
+                config = yaml.safe_load(config_file)
+        devices = feed_scheduler.detach(config['sensors'])
+        rng = np.random.default_rng(config.get('seed'))
+        block_size = int(config.get('block_size', 4096))
+        # najdłuższa zaległość wysyłana po przestoju pętli, starsze próbki są pomijane
+        self.max_backlog = float(config.get('max_backlog', 0.1))
+        self.streams: List[StressStream] = []
+        for name, settings in config['sensors'].items():
+            if name not in devices:
+                raise ValueError(f'Stress config: unknown sensor {name}')
+            model = NoiseModel(**{key: float(value) for key, value in settings.items() if key != 'rate'})
+            self.streams.append(StressStream(devices[name], float(settings['rate']), model, rng, block_size))
+
+    @property
+    def names(self) -> List[str]:
+        return [stream.device.name for stream in self.streams]
+
+    @property
+    def sent(self) -> int:
+        return sum(stream.emitted - stream.dropped for stream in self.streams)
+
+    @property
+    def dropped(self) -> int:
+        return sum(stream.dropped for stream in self.streams)
+
+    @property
+    def skipped(self) -> int:
+        return sum(stream.skipped for stream in self.streams)
+
+    def due_frames(self, now: float, values: dict) -> List[Frame]:
+        """
+        FEED frames of all stream samples due at now, based on the current sensor values.
+        """
+        frames = []
+        for stream in self.streams:
+            samples = stream.due(now, values.get(stream.device.name, 0.0), self.max_backlog)
+            if len(samples):
+                frames.extend(stream.frames(samples))
+        return frames
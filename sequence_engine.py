@@ -0,0 +1,261 @@
+import logging
+import threading
+from time import perf_counter
+from typing import Callable, FrozenSet, Optional, Tuple
+
+import yaml
+
+from communication_library.frame import ids, Frame
+from communication_library.metrics import LatencyHistogram
+
+
+class Condition:
+    """
+    Compiled condition of a procedure step, e.g. {'sensor': 'oxidizer_level', 'above': 100}
+    or {'ack': 'fuel_intake'}. Sensor conditions are evaluated only when a frame of one of
+    their trigger sensors arrives, ACK conditions when an ACK or NACK of their device arrives.
+    'velocity' is the rate of change of altitude over VELOCITY_WINDOW seconds of history.
+    """
+    VELOCITY_WINDOW = 0.5
+
+    def __init__(self, spec: dict, controller) -> None:
+        self.description = ', '.join(f'{key}: {value}' for key, value in spec.items())
+        self.triggers: FrozenSet[str] = frozenset()
+        self.ack_key: Optional[Tuple[int, int]] = None
+        self.predicate: Callable[[], bool] = lambda: False
+
+        if 'ack' in spec:
+            name = spec['ack']
+            if name in controller.servo_name_to_id:
+                self.ack_key = (ids.DeviceID.SERVO, controller.servo_name_to_id[name])
+            elif name in controller.relay_name_to_id:
+                self.ack_key = (ids.DeviceID.RELAY, controller.relay_name_to_id[name])
+            else:
+                raise ValueError(f'Procedure: unknown device {name} in {spec}')
+            return
+
+        name = spec['sensor']
+        if name == 'velocity':
+            altitude = controller.telemetry["sensors"]["altitude"]
+            self.triggers = frozenset(['altitude'])
+
+            def read():
+                return altitude.slope(self.VELOCITY_WINDOW)
+        elif name in controller.rocket_status["sensors"]:
+            sensors = controller.rocket_status["sensors"]
+            self.triggers = frozenset([name])
+
+            def read():
+                return sensors[name]
+        else:
+            raise ValueError(f'Procedure: unknown sensor {name} in {spec}')
+
+        # progi są stałymi domknięcia, ten sam warunek co condition_met w tcp_simulator.py
+        above = spec.get('above')
+        below = spec.get('below')
+        if above is not None and below is not None:
+            self.predicate = lambda: above <= read() <= below
+        elif above is not None:
+            self.predicate = lambda: read() >= above
+        elif below is not None:
+            self.predicate = lambda: read() <= below
+        else:
+            raise ValueError(f'Procedure: condition {spec} needs above or below')
+
+
+class Step:
+    """
+    Compiled procedure step: a command, {'until': condition} or {'wait': seconds}.
+    until steps may have 'timeout' in seconds and 'on_timeout': 'abort' (default) or 'continue'.
+    """
+
+    def __init__(self, index: int, spec: dict, controller) -> None:
+        self.index = index
+        self.action: Optional[Callable[[], None]] = None
+        self.condition: Optional[Condition] = None
+        self.timeout: Optional[float] = spec.get('timeout')
+        self.abort_on_timeout = spec.get('on_timeout', 'abort') == 'abort'
+
+        if 'until' in spec:
+            self.condition = Condition(spec['until'], controller)
+            self.description = f"until {self.condition.description}"
+        elif 'wait' in spec:
+            self.timeout = float(spec['wait'])
+            self.abort_on_timeout = False
+            self.description = f"wait {self.timeout} s"
+        elif 'servo' in spec:
+            device_id = controller.servo_name_to_id[spec['servo']]
+            position = int(spec['position'])
+            self.action = lambda: controller.set_servo(device_id, position)
+            self.description = f"servo {spec['servo']} to {position}"
+        elif 'relay' in spec:
+            device_id = controller.relay_name_to_id[spec['relay']]
+            state = bool(spec['state'])
+            self.action = lambda: controller.toggle_relay(device_id, state)
+            self.description = f"relay {spec['relay']} {'open' if state else 'closed'}"
+        else:
+            raise ValueError(f'Procedure: unknown step {spec}')
+
+
+class SequenceEngine:
+    """
+    Runs a declarative procedure (see launch_procedure.yaml) on the controller's receive thread.
+    The procedure is compiled into predicates which are evaluated only when a frame they depend on
+    arrives, so the commands of the next steps are sent right after the frame meeting the condition
+    is processed, without polling. Timeouts and wait steps are handled by the thread calling run().
+    When a step times out, an awaited command is answered with NACK or an abort_when condition
+    becomes true, the abort steps are sent and the procedure ends.
+    Commands of both threads, like those of the GUI, go through the communication manager's send lock,
+    held while a group of consecutive commands is sent so other commands cannot get between them.
+    :param controller: connected controller
+    :param procedure:  procedure dict or path to its YAML file
+    """
+    RUNNING = 'running'
+    DONE = 'done'
+    ABORTED = 'aborted'
+
+    def __init__(self, controller, procedure) -> None:
+        if not isinstance(procedure, dict):
+            with open(procedure, 'r') as procedure_file:
+                procedure = yaml.safe_load(procedure_file)
+        self.controller = controller
+        self.steps = [Step(index, spec, controller) for index, spec in enumerate(procedure['steps'])]
+        self.abort_when = [Condition(spec, controller) for spec in procedure.get('abort_when') or []]
+        self.abort_steps = [Step(index, spec, controller) for index, spec in enumerate(procedure.get('abort') or [])]
+        assert all(step.action is not None for step in self.abort_steps), 'Abort steps can only be commands'
+
+        self.state: Optional[str] = None
+        self.abort_reason: Optional[str] = None
+        # time from the frame meeting a condition arriving to the next commands being sent
+        self.reaction_latency = LatencyHistogram()
+        self._current = 0
+        self._deadline: Optional[float] = None
+        self._changed = threading.Condition()
+        self._logger = logging.getLogger("controller.sequence")
+
+    @property
+    def current_step(self) -> Optional[Step]:
+        return self.steps[self._current] if self._current < len(self.steps) else None
+
+    def start(self) -> None:
+        with self._changed:
+            self.state = self.RUNNING
+            self.controller.add_frame_listener(self.on_frame)
+            self._logger.info(f"Procedure started, {len(self.steps)} steps")
+            self._advance(self._current)
+
+    def run(self, timeout: float = None) -> str:
+        """
+        Starts the procedure and waits until it is done or aborted, handling step timeouts.
+        :param timeout: seconds after which the procedure is aborted, None to wait without a limit
+        :return: DONE or ABORTED
+        """
+        self.start()
+        end = None if timeout is None else perf_counter() + timeout
+        try:
+            with self._changed:
+                while self.state == self.RUNNING:
+                    now = perf_counter()
+                    if end is not None and now >= end:
+                        self._abort(f"procedure timeout of {timeout} s")
+                        break
+                    if self._deadline is not None and now >= self._deadline:
+                        self._expire()
+                        continue
+                    deadlines = [deadline for deadline in (self._deadline, end) if deadline is not None]
+                    # czekanie przerywa zmiana kroku w wątku odbiorczym albo najbliższy termin
+                    self._changed.wait(min(deadlines) - now if deadlines else None)
+        finally:
+            self.controller.remove_frame_listener(self.on_frame)
+        if self.state == self.DONE:
+            self._logger.info("Procedure done")
+        return self.state
+
+    def on_frame(self, frame: Frame) -> None:
+        """
+        Frame listener of the controller, called on the receive thread after rocket_status is updated.
+        """
+        with self._changed:
+            if self.state != self.RUNNING:
+                return
+            if frame.action == ids.ActionID.FEED:
+                if frame.device_type != ids.DeviceID.SENSOR:
+                    return
+                name = self.controller.sensor_id_map.get(frame.device_id)
+                for condition in self.abort_when:
+                    if name in condition.triggers and condition.predicate():
+                        self._abort(f"abort condition {condition.description}")
+                        return
+                step = self.current_step
+                if step.condition is not None and name in step.condition.triggers and step.condition.predicate():
+                    self._condition_met(step)
+
+            elif frame.action in (ids.ActionID.ACK, ids.ActionID.NACK):
+                step = self.current_step
+                if step.condition is None or step.condition.ack_key != (frame.device_type, frame.device_id):
+                    return
+                if frame.action == ids.ActionID.NACK:
+                    self._abort(f"NACK in step {step.index} ({step.description})")
+                else:
+                    self._condition_met(step)
+
+    def _condition_met(self, step: Step) -> None:
+        met_at = perf_counter()
+        self._advance(step.index + 1)
+        sent_at = perf_counter()
+        received_at = self.controller.frame_received_at
+        self.reaction_latency.observe(sent_at - received_at)
+        self._logger.info(f"Step {step.index} ({step.description}) met, next commands sent "
+                          f"{(sent_at - met_at) * 1e6:.0f} us after the condition and "
+                          f"{(sent_at - received_at) * 1e6:.0f} us after the frame arrived")
+
+    def _advance(self, index: int) -> None:
+        """
+        Sends the commands from step index on up to the first step which has to wait.
+        Conditions already met when their step starts are passed at once.
+        """
+        with self.controller.manager.send_lock:
+            while index < len(self.steps):
+                step = self.steps[index]
+                if step.action is not None:
+                    step.action()
+                    self._logger.info(f"Step {index}: {step.description}")
+                elif step.condition is not None and step.condition.ack_key is None and step.condition.predicate():
+                    self._logger.info(f"Step {index} ({step.description}) already met")
+                else:
+                    break
+                index += 1
+
+        self._current = index
+        if index == len(self.steps):
+            self.state = self.DONE
+            self._deadline = None
+        else:
+            step = self.steps[index]
+            self._deadline = None if step.timeout is None else perf_counter() + step.timeout
+        self._changed.notify_all()
+
+    def _expire(self) -> None:
+        step = self.current_step
+        if step.abort_on_timeout:
+            self._abort(f"timeout of step {step.index} ({step.description})")
+            return
+        if step.condition is not None:
+            self._logger.warning(f"Step {step.index} ({step.description}) timed out, continuing")
+        self._advance(step.index + 1)
+
+    def _abort(self, reason: str) -> None:
+        self.state = self.ABORTED
+        self.abort_reason = reason
+        self._deadline = None
+        self._logger.error(f"Procedure aborted: {reason}")
+        with self.controller.manager.send_lock:
+            for step in self.abort_steps:
+                step.action()
+                self._logger.info(f"Abort step {step.index}: {step.description}")
+        self._changed.notify_all()
+
+    def latency_summary(self) -> str:
+        return (f"{self.reaction_latency.count} reactions, "
+                f"mean {self.reaction_latency.mean * 1e6:.0f} us, "
+                f"max {self.reaction_latency.max * 1e6:.0f} us")
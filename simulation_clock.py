@@ -0,0 +1,42 @@
+import time
+
+
+class WallClock:
+    """
+    Simulation time following the wall clock, sped up or slowed down by time_multiplier.
+    :param time_multiplier: simulated seconds passing per wall clock second
+    :param blocking:        whether sleep() pauses, a process hosting many rockets cannot pause for one
+    """
+
+    def __init__(self, time_multiplier: float = 1.0, blocking: bool = True) -> None:
+        self.time_multiplier = time_multiplier
+        self.blocking = blocking
+        self._start = time.perf_counter()
+
+    def now(self) -> float:
+        return (time.perf_counter() - self._start) * self.time_multiplier
+
+    def sleep(self, seconds: float) -> None:
+        if self.blocking:
+            time.sleep(seconds / self.time_multiplier)
+
+
+class VirtualClock:
+    """
+    Simulation time moved forward only by advance(), nothing ever blocks,
+    so a run depends only on its inputs and takes as long as the computation.
+    :param start: initial simulation time in seconds
+    """
+
+    def __init__(self, start: float = 0.0) -> None:
+        self._now = start
+
+    def now(self) -> float:
+        return self._now
+
+    def sleep(self, seconds: float) -> None:
+        # pauses only give a person time to read the output, simulated time stands still
+        pass
+
+    def advance(self, seconds: float) -> None:
+        self._now += seconds
@@ -0,0 +1,211 @@
+from typing import Callable, Dict, List, Optional, Set
+
+import yaml
+
+from integrators import MotionRegime
+
+
+# funkcje dostępne w wyrażeniach modelu
+EXPRESSION_BUILTINS = {'min': min, 'max': max, 'abs': abs, 'round': round}
+RULE_KEYS = {'when', 'set', 'info', 'warning', 'error', 'then', 'else', 'goto', 'message', 'level',
+             'explode', 'finish', 'stop', 'use', 'integrate'}
+REGIME_KEYS = {'when', 'derivatives', 'limits', 'events'}
+
+
+class ModelContext:
+    """
+    Names visible to the expressions of a model: sensors, dt, now and the
+    attributes of the simulated rocket (velocity, igniter_start_time, ...).
+    is_open(servo) and relay(name) test the devices.
+    :param rocket: StandaloneMock the model is run for
+    """
+
+    def __init__(self, rocket) -> None:
+        self.rocket = rocket
+        self.dt = 0.0
+        # czas symulacji widziany przez wyrażenia, None = bieżący czas zegara
+        self.now: Optional[float] = None
+        # wartości zmiennych ciągłych w trakcie kroku integratora, przesłaniają czujniki i atrybuty
+        self.overlay: Optional[dict] = None
+        # wynik integratora dla bieżącego odcinka, zapisywany regułą z integrate
+        self.pending_motion: dict = {}
+        self.globals = {'__builtins__': EXPRESSION_BUILTINS,
+                        'is_open': rocket.is_servo_open,
+                        'relay': lambda name: rocket.relays[name] == 1}
+
+    def __getitem__(self, name: str):
+        if self.overlay is not None and name in self.overlay:
+            return self.overlay[name]
+        sensors = self.rocket.sensors
+        if name in sensors:
+            return sensors[name]
+        if name == 'dt':
+            return self.dt
+        if name == 'now':
+            return self.rocket.clock.now() if self.now is None else self.now
+        try:
+            return getattr(self.rocket, name)
+        except AttributeError:
+            raise KeyError(name) from None
+
+    def __setitem__(self, name: str, value) -> None:
+        if name in self.rocket.sensors:
+            self.rocket.sensors[name] = value
+        else:
+            setattr(self.rocket, name, value)
+
+    def evaluate(self, code):
+        return eval(code, self.globals, self)
+
+    def motion_values(self, regime: MotionRegime) -> dict:
+        # wartości spoza granic (np. prędkość w chwili otwarcia spadochronu) są od razu do nich przycinane
+        return {name: regime.clamp(name, self[name]) for name in regime.names}
+
+    def commit_motion(self) -> None:
+        for name, value in self.pending_motion.items():
+            self[name] = value
+
+
+# reguła zwraca True, gdy kończy bieżący krok fizyki
+Rule = Callable[[ModelContext], bool]
+
+
+class SimulationModel:
+    """
+    States, guards, rates and failure rules of the simulation read from YAML and
+    compiled once into a table of rule lists per state. A physics tick runs only
+    the rules of the current state, states without rules cost nothing.
+    :param model:  path to the model file or the already loaded dict
+    :param states: names of all states the rules may go to
+    """
+
+    def __init__(self, model, states) -> None:
+        if not isinstance(model, dict):
+            with open(model, 'r') as model_file:
+                model = yaml.safe_load(model_file)
+        self._state_names = set(states)
+        # stany zdefiniowane w modelu albo będące celem przejścia
+        self.states: Set[str] = set()
+        self._blocks = model.get('blocks', {})
+
+        self.initial_sensors: Dict[str, float] = dict(model['sensors'])
+        # urządzenie, którego otwarcie zapisuje swój czas w atrybucie rakiety (None po zamknięciu)
+        self.servo_timers: Dict[str, str] = dict(model.get('timers', {}).get('servo', {}))
+        self.relay_timers: Dict[str, str] = dict(model.get('timers', {}).get('relay', {}))
+        self.plotted_states = set()
+        self.rules: Dict[str, List[Rule]] = {}
+        self.motion: Dict[str, List[MotionRegime]] = {}
+        for state, spec in model['states'].items():
+            self._check_state(state, f'states.{state}')
+            if spec.get('plot_vt'):
+                self.plotted_states.add(state)
+            self.rules[state] = self._compile_rules(spec.get('rules', []), f'states.{state}')
+            self.motion[state] = [self._compile_regime(regime, f'states.{state}.motion[{index}]')
+                                  for index, regime in enumerate(spec.get('motion', []))]
+
+    def regime(self, state: str, context: ModelContext) -> Optional[MotionRegime]:
+        """
+        First motion regime of the state whose guard holds, None when nothing moves.
+        """
+        for regime in self.motion.get(state, ()):
+            if regime.guard is None or context.evaluate(regime.guard):
+                return regime
+        return None
+
+    def _compile_regime(self, regime: dict, where: str) -> MotionRegime:
+        unknown = set(regime) - REGIME_KEYS
+        if unknown:
+            raise ValueError(f'{where}: unknown keys {", ".join(sorted(unknown))}')
+        guard = self._expression(regime['when'], where) if 'when' in regime else None
+        derivatives = [(name, self._expression(expression, f'{where}.derivatives.{name}'))
+                       for name, expression in regime['derivatives'].items()]
+        limits = {}
+        for name, (low, high) in (regime.get('limits') or {}).items():
+            if name not in regime['derivatives']:
+                raise ValueError(f'{where}: limit of {name}, which has no derivative')
+            limits[name] = (None if low is None else float(low), None if high is None else float(high))
+        events = [self._expression(expression, f'{where}.events') for expression in regime.get('events', [])]
+        return MotionRegime(guard, derivatives, limits, events)
+
+    def _check_state(self, state: str, where: str) -> None:
+        if state not in self._state_names:
+            raise ValueError(f'{where}: unknown state {state}')
+        self.states.add(state)
+
+    def _compile_rules(self, rules: list, where: str) -> List[Rule]:
+        compiled = []
+        for index, rule in enumerate(rules):
+            rule_where = f'{where}[{index}]'
+            if 'use' in rule:
+                if rule['use'] not in self._blocks:
+                    raise ValueError(f'{rule_where}: unknown block {rule["use"]}')
+                compiled.extend(self._compile_rules(self._blocks[rule['use']], f'blocks.{rule["use"]}'))
+            else:
+                compiled.append(self._compile_rule(rule, rule_where))
+        return compiled
+
+    @staticmethod
+    def _expression(expression, where: str):
+        try:
+            return compile(str(expression), where, 'eval')
+        except SyntaxError as err:
+            raise ValueError(f'{where}: invalid expression {expression!r}: {err.msg}') from None
+
+    def _messages(self, messages, where: str) -> list:
+        if isinstance(messages, str):
+            messages = [messages]
+        # komunikaty są f-stringami, mogą odwoływać się do tych samych nazw co wyrażenia
+        return [self._expression('f' + repr(message), where) for message in messages]
+
+    def _compile_rule(self, rule: dict, where: str) -> Rule:
+        unknown = set(rule) - RULE_KEYS
+        if unknown:
+            raise ValueError(f'{where}: unknown keys {", ".join(sorted(unknown))}')
+
+        guard = self._expression(rule['when'], where) if 'when' in rule else None
+        assignments = [(name, self._expression(expression, f'{where}.set.{name}'))
+                       for name, expression in rule.get('set', {}).items()]
+        logs = [(level, code) for level in ('info', 'warning', 'error') if level in rule
+                for code in self._messages(rule[level], where)]
+        then_rules = self._compile_rules(rule.get('then', []), f'{where}.then')
+        else_rules = self._compile_rules(rule.get('else', []), f'{where}.else')
+        goto = rule.get('goto')
+        if goto is not None:
+            self._check_state(goto, where)
+        goto_message = self._messages(rule['message'], where)[0] if 'message' in rule else None
+        goto_level = rule.get('level', 'info')
+        explode = self._messages(rule['explode'], where)[0] if 'explode' in rule else None
+        finish = bool(rule.get('finish'))
+        stop = bool(rule.get('stop'))
+        integrate = bool(rule.get('integrate'))
+
+        def run(context: ModelContext) -> bool:
+            if guard is not None and not context.evaluate(guard):
+                return run_all(else_rules, context)
+
+            rocket = context.rocket
+            if integrate:
+                context.commit_motion()
+            for name, code in assignments:
+                context[name] = context.evaluate(code)
+            for level, code in logs:
+                getattr(rocket._logger, level)(context.evaluate(code))
+            if run_all(then_rules, context):
+                return True
+            if goto is not None:
+                rocket.enter_state(goto, context.evaluate(goto_message) if goto_message else None, goto_level)
+            if explode is not None:
+                rocket.explode(context.evaluate(explode))
+                return True
+            if finish:
+                rocket.finish()
+            return stop
+
+        return run
+
+
+def run_all(rules: List[Rule], context: ModelContext) -> bool:
+    for rule in rules:
+        if rule(context):
+            return True
+    return False
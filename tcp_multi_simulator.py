@@ -0,0 +1,208 @@
+import copy
+import sys
+import time
+from argparse import ArgumentParser
+
+import yaml
+
+from communication_library.frame import ids
+from communication_library.communication_manager import CommunicationManager, TransportType
+from communication_library.exceptions import ClosedTransportError, TransportTimeoutError, UnregisteredCallbackError
+from communication_library.tcp_transport import TcpSettings
+from simulation_clock import WallClock
+from simulation_model import SimulationModel
+from tcp_simulator import StandaloneMock, SimulationState
+
+import logging
+
+
+DEVICE_TYPES = {'servo': ids.DeviceID.SERVO,
+                'relay': ids.DeviceID.RELAY,
+                'sensor': ids.DeviceID.SENSOR}
+# device_id ma 6 bitów
+DEVICE_ID_LIMIT = 64
+
+
+def namespaced_configs(configs: list, count: int, shared: bool = False) -> list:
+    """
+    Configs of count rockets, taken from configs in turn. Every rocket gets its
+    own range of device ids on its boards, so frames of different rockets never collide.
+    :param shared: keep the device ids as they are, rockets then share the namespace
+    """
+    next_free = {}
+    result = []
+    for index in range(count):
+        config = copy.deepcopy(configs[index % len(configs)])
+        if shared:
+            result.append(config)
+            continue
+        boards = {settings['board'].upper()
+                  for devices in config['devices'].values() for settings in devices.values()}
+        offset = max(next_free.get(board, 0) for board in boards)
+        span = 1 + max(settings['device_id']
+                       for devices in config['devices'].values() for settings in devices.values())
+        if offset + span > DEVICE_ID_LIMIT:
+            raise ValueError(f'Device ids of boards {", ".join(sorted(boards))} are exhausted after {index} rockets')
+        for devices in config['devices'].values():
+            for settings in devices.values():
+                settings['device_id'] += offset
+        for board in boards:
+            next_free[board] = offset + span
+        result.append(config)
+    return result
+
+
+class MultiRocketSimulator:
+    """
+    Hosts many independent StandaloneMock rockets in one process, sharing a single
+    proxy connection. Physics of all rockets is stepped in one pass, their due feed
+    frames are encoded together and sent with one write per loop, and commands
+    are routed to the rockets owning the addressed device.
+    """
+    PHYSICS_INTERVAL = 0.1
+
+    def __init__(self, proxy_address: str, proxy_port: int, configs: list,
+                 feed_send_interval: float, verbose: bool, time_multiplier: float,
+                 flow_window: int = 0, model='simulator_model.yaml') -> None:
+        self.manager = CommunicationManager()
+        self.manager.change_transport_type(TransportType.TCP)
+        self.manager.connect(TcpSettings(address=proxy_address, port=proxy_port))
+        if flow_window:
+            self.manager.enable_flow_control(flow_window)
+
+        # model kompilowany raz, reguły są wspólne dla wszystkich rakiet
+        model = SimulationModel(model, [state.name for state in SimulationState])
+        self.rockets = [StandaloneMock(None, 0, config, feed_send_interval, False, verbose, time_multiplier,
+                                       False, clock=WallClock(time_multiplier, blocking=False),
+                                       name=f'rocket-{index + 1}', model=model)
+                        for index, config in enumerate(configs)]
+        self._routes = {}
+        for rocket in self.rockets:
+            for device_kind, devices in rocket.config['devices'].items():
+                for settings in devices.values():
+                    key = (DEVICE_TYPES[device_kind], settings['device_id'])
+                    self._routes.setdefault(key, []).append(rocket)
+        # ramki sterujące symulatorem (punkty kontrolne) wybierają rakietę numerem w device_id
+        for index, rocket in enumerate(self.rockets):
+            self._routes[(ids.DeviceID.SIMULATOR, index)] = [rocket]
+
+        self.sent_frames = 0
+        self._logger = logging.getLogger("main")
+        self._logger.info(f'Simulating {len(self.rockets)} rockets connected to {proxy_address}:{proxy_port}')
+
+    @property
+    def running_rockets(self) -> list:
+        return [rocket for rocket in self.rockets if rocket.should_run]
+
+    def handle_frame(self, frame) -> None:
+        rockets = [rocket for rocket in self._routes.get((frame.device_type, frame.device_id), ())
+                   if rocket.should_run]
+        if not rockets:
+            self._logger.warning(f'No running rocket owns the device of frame {frame}')
+        for rocket in rockets:
+            for response_frame in rocket.handle_frame(frame):
+                self.manager.push(response_frame)
+
+    def receive_frames(self, max_frames: int = 1024) -> int:
+        for received in range(max_frames):
+            try:
+                frame = self.manager.receive()
+            except TransportTimeoutError:
+                return received
+            except UnregisteredCallbackError as e:
+                frame = e.frame
+            if frame.destination != ids.BoardID.PROXY:
+                self.handle_frame(frame)
+        return max_frames
+
+    def push_feed_frames(self) -> int:
+        # ramki czekają jeszcze na kredyty od proxy, zaległe urządzenia zostaną wysłane później
+        if self.manager.buffered_frames:
+            return 0
+        now = time.perf_counter()
+        pushed = 0
+        for rocket in self.running_rockets:
+            for frame in rocket.feed_frames(now):
+                self.manager.push(frame)
+                pushed += 1
+        return pushed
+
+    def send_frames(self) -> None:
+        try:
+            self.sent_frames += self.manager.flush()
+        except (TransportTimeoutError, ClosedTransportError):
+            # gniazdo nie przyjmuje danych (pełny bufor), ramki zostają w buforze do następnej próby
+            pass
+
+    def print_status(self) -> None:
+        states = {}
+        for rocket in self.rockets:
+            states[rocket.state.value] = states.get(rocket.state.value, 0) + 1
+        summary = ', '.join(f'{state}: {count}' for state, count in sorted(states.items()))
+        missed = sum(rocket.feed_scheduler.missed_sends for rocket in self.rockets)
+        self._logger.info(f'Rockets by state: {summary}; frames sent: {self.sent_frames}, '
+                          f'feed frames missed: {missed}')
+
+    def receive_send_loop(self) -> None:
+        last_physics_tick = last_status_print = time.perf_counter()
+        while self.running_rockets:
+            current_time = time.perf_counter()
+            idle = True
+
+            if current_time > last_physics_tick + self.PHYSICS_INTERVAL:
+                for rocket in self.running_rockets:
+                    rocket.tick_physics()
+                last_physics_tick = current_time
+                idle = False
+
+            if current_time > last_status_print + 1.0:
+                self.print_status()
+                last_status_print = current_time
+
+            if self.receive_frames():
+                idle = False
+
+            if self.push_feed_frames():
+                idle = False
+
+            self.send_frames()
+            if idle:
+                time.sleep(0.001)
+        self.print_status()
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description='Simulates many rockets in one process for load testing.')
+    parser.add_argument('--proxy-address', default="127.0.0.1")
+    parser.add_argument('--proxy-port', default=3001, type=int)
+    parser.add_argument('--rockets', default=8, type=int)
+    parser.add_argument('--hardware-config', default=[], action='append',
+                        help='Config of the rockets, can be repeated, configs are assigned to rockets in turn.')
+    parser.add_argument('--model', default='simulator_model.yaml',
+                        help='YAML model with the states, transitions and failure rules of the simulation.')
+    parser.add_argument('--shared-device-ids', default=False, action='store_true',
+                        help='All rockets use the device ids of their config, allows more rockets than '
+                             'the device id space holds, commands then reach every rocket with the device.')
+    parser.add_argument('--feed-interval', default=0.1, type=float)
+    parser.add_argument('--time-multiplier', default=1.0, type=float)
+    parser.add_argument('--verbose', default=False, action='store_true')
+    parser.add_argument('--flow-window', default=1024, type=int,
+                        help='Credit window asked from the proxy, 0 disables flow control.')
+    cl_args = parser.parse_args()
+
+    configs = []
+    for path in cl_args.hardware_config or ['simulator_config.yaml']:
+        with open(path, 'r') as config_file:
+            configs.append(yaml.safe_load(config_file))
+    try:
+        configs = namespaced_configs(configs, cl_args.rockets, cl_args.shared_device_ids)
+    except ValueError as err:
+        parser.error(str(err))
+
+    simulator = MultiRocketSimulator(cl_args.proxy_address, cl_args.proxy_port, configs, cl_args.feed_interval,
+                                     cl_args.verbose, cl_args.time_multiplier, cl_args.flow_window,
+                                     cl_args.model)
+    try:
+        simulator.receive_send_loop()
+    except KeyboardInterrupt:
+        sys.exit()
@@ -1,20 +1,140 @@
 import asyncio
 import logging
 from communication_library.protocol import GroundStationProtocol
-from communication_library.ids import HEADER_ID
+from communication_library.ids import HEADER_ID, ActionID, BoardID, DeviceID, OperationID, PriorityID, DataTypeID
+from communication_library.frame import Frame
+from communication_library.exceptions import ChecksumMismatchError, ProtocolError
+from communication_library.frame_log import FrameLogWriter, FrameLogReader, FrameDirection
+from communication_library.metrics import LatencyHistogram, format_labels
+from communication_library.shm_ring import BroadcastRing
+from communication_library.log_pipeline import setup_queue_logging, stop_queue_logging
 from collections import deque
 from pathlib import Path
 from os.path import join
-import sys
+import time
+import multiprocessing
+import os
+import signal
+import queue
+import secrets
+from itertools import islice
 from datetime import datetime
 from argparse import ArgumentParser
 
 
+FRAME_LENGTH = 14
+
+
+def feed_key(data):
+    """
+    Returns (source, device_type, device_id, operation) of a FEED frame,
+    None for any other action.
+    """
+    _, _, action, source, device_type, device_id, _, operation = GroundStationProtocol.peek_values(data)
+    if action != ActionID.FEED:
+        return None
+    return source, device_type, device_id, operation
+
+
+def is_control_frame(data):
+    return GroundStationProtocol.peek_values(data)[0] == BoardID.PROXY
+
+
+def control_frame(operation, action=ActionID.SERVICE, data_type=DataTypeID.NO_DATA, payload=()):
+    return Frame(destination=BoardID.PROXY,
+                 priority=PriorityID.HIGH,
+                 action=action,
+                 source=BoardID.PROXY,
+                 device_type=DeviceID.PROXY,
+                 device_id=0,
+                 data_type=data_type,
+                 operation=operation,
+                 payload=payload)
+
+
+class ProxySession:
+    """
+    Resumable session of a client. Every non-control frame written to the client
+    gets the next sequence number and is kept in a bounded buffer, so a client
+    reconnecting with the sequence number of its last received frame only gets
+    the frames it missed. While no client is attached frames keep being buffered.
+    """
+
+    def __init__(self, session_id, capacity):
+        self.session_id = session_id
+        self.frames = deque(maxlen=capacity)
+        self.last_sequence = 0
+        self.client = None
+        self.detached_at = None
+
+    def append(self, data):
+        for offset in range(0, len(data), FRAME_LENGTH):
+            frame = data[offset:offset + FRAME_LENGTH]
+            if is_control_frame(frame):
+                continue
+            self.frames.append(frame)
+            self.last_sequence += 1
+
+    def frames_after(self, sequence):
+        """
+        Frames with sequence numbers above the given one joined together,
+        None if some of them are no longer buffered.
+        """
+        oldest_kept = self.last_sequence - len(self.frames)
+        if not oldest_kept <= sequence <= self.last_sequence:
+            return None
+        missed = self.last_sequence - sequence
+        return b''.join(islice(self.frames, len(self.frames) - missed, None))
+
+
+class TrafficStats:
+    """
+    Counters of a single proxy client or of traffic exchanged with the station.
+    Frames "in" are received by the proxy, frames "out" are written by it.
+    """
+
+    def __init__(self):
+        self.frames_in = 0
+        self.bytes_in = 0
+        self.frames_out = 0
+        self.bytes_out = 0
+        self.dropped_frames = 0
+        self.header_resyncs = 0
+        self.peak_queue_depth = 0
+        # time from entering the proxy to the end of the write to the client
+        self.forward_latency = LatencyHistogram()
+
+    def merge(self, other: 'TrafficStats'):
+        self.frames_in += other.frames_in
+        self.bytes_in += other.bytes_in
+        self.frames_out += other.frames_out
+        self.bytes_out += other.bytes_out
+        self.dropped_frames += other.dropped_frames
+        self.header_resyncs += other.header_resyncs
+        self.peak_queue_depth = max(self.peak_queue_depth, other.peak_queue_depth)
+        self.forward_latency.merge(other.forward_latency)
+
+
 class ProxyClient:
-    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter,
+                 conflate_feed: bool = False, client_id: int = 0):
+        self.client_id = client_id
         self.reader = reader
         self.writer = writer
         self.send_queue = deque()
+        self.conflate_feed = conflate_feed
+        # FEED frames waiting in send_queue are represented by their key,
+        # the newest frame for that key is kept here
+        self._feed_slots = {}
+        self.conflated_frames = 0
+        self.stats = TrafficStats()
+        # frames the client may send without waiting, 0 when flow control is off
+        self.credit_window = 0
+        # frames received since the last credit grant
+        self.credits_to_return = 0
+        self.session: ProxySession = None
+        # session id announced with SESSION_RESUME, waiting for SESSION_SEQUENCE
+        self.resume_session_id = None
         self._should_stop = False
 
     @property
@@ -27,21 +147,54 @@ class ProxyClient:
     def stop(self):
         self._should_stop = True
 
-    def push_data_to_send(self, data):
-        self.send_queue.append(data)
+    # Queue entries are (ingress ns, frame), or (None, key) for conflated FEED slots
+    def push_data_to_send(self, data, ingress=None):
+        if ingress is None:
+            ingress = time.perf_counter_ns()
+        if self.conflate_feed:
+            key = feed_key(data)
+            if key is not None:
+                if key in self._feed_slots:
+                    self._feed_slots[key] = (ingress, data)
+                    self.conflated_frames += 1
+                    return
+                self._feed_slots[key] = (ingress, data)
+                self._append_to_queue((None, key))
+                return
+        self._append_to_queue((ingress, data))
+
+    # Several frames sent with a single write, never conflated
+    def push_batch_to_send(self, data):
+        self._append_to_queue((time.perf_counter_ns(), data))
+
+    def _append_to_queue(self, entry):
+        self.send_queue.append(entry)
+        if len(self.send_queue) > self.stats.peak_queue_depth:
+            self.stats.peak_queue_depth = len(self.send_queue)
 
     def get_data_to_send(self):
-        return self.send_queue.popleft()
+        ingress, item = self.send_queue.popleft()
+        if ingress is None:
+            return self._feed_slots.pop(item)
+        return ingress, item
+
+    def discard_queued(self):
+        self.send_queue.clear()
+        self._feed_slots.clear()
 
     async def write(self, data):
         self.writer.write(data)
         await self.writer.drain()
+        self.stats.frames_out += len(data) // FRAME_LENGTH
+        self.stats.bytes_out += len(data)
 
     async def readexactly(self, amount):
         return await self.reader.readexactly(amount)
 
 
 class Proxy:
+    # Seconds between credit grants sent to clients using flow control
+    CREDIT_GRANT_INTERVAL = 0.01
 
     def __init__(self, name):
         self.name = name
@@ -49,34 +202,67 @@ class Proxy:
         self.tcp_address = None
         self.tcp_port = None
         self.mirror_frames = False
+        self.conflate_feed = False
+        self.conflated_frames = 0
+        self.send_feed_snapshot = False
+        self._feed_snapshot = {}
+        self._recorder = None
+        self._next_client_id = 1
+        self._client_id_step = 1
+        self.reuse_port = False
+        self.session_capacity = 0
+        self.session_timeout = 0.0
+        self._sessions = {}
+        self.credit_window = 0
+        self.credit_backlog_limit = 0
         self.clients = {}
+        # traffic of clients that already disconnected
+        self.removed_clients_stats = TrafficStats()
+        self.station_stats = TrafficStats()
+        self._interval_latency = LatencyHistogram()
         self.setup_loggers()
         self._logger = logging.getLogger(self.name)
         self._send_queue = deque()
         self._external_receive_queue = deque()
         self._external_listeners: list[Proxy] = []
 
-    def push_data_to_send(self, data):
-        self._send_queue.append(data)
+    # Queue entries are (client id, ingress ns, frame), the ingress time
+    # of a client frame is carried to the listeners forwarding it
+    def push_data_to_send(self, data, client_id=0, ingress=None):
+        if ingress is None:
+            ingress = time.perf_counter_ns()
+        self._send_queue.append((client_id, ingress, data))
 
     def get_data_to_send(self):
         return self._send_queue.popleft()
 
-    def push_external_data_to_forward(self, data):
-        return self._external_receive_queue.append(data)
+    # skip_client is the id of a client that must not get the frame back
+    def push_external_data_to_forward(self, data, skip_client=None, ingress=None):
+        if ingress is None:
+            ingress = time.perf_counter_ns()
+        return self._external_receive_queue.append((ingress, data, skip_client))
 
     def get_external_data_to_forward(self):
         return self._external_receive_queue.popleft()
 
+    @property
+    def forward_backlog(self):
+        queued_for_clients = max((len(client.send_queue) for client in self.clients.values()), default=0)
+        return len(self._external_receive_queue) + queued_for_clients
+
+    # Frames received from clients and not yet delivered by the listeners
+    @property
+    def flow_backlog(self):
+        return len(self._send_queue) + max((listener.forward_backlog for listener in self._external_listeners),
+                                           default=0)
+
     def register_external_listener(self, listener):
         self._external_listeners.append(listener)
 
     def setup_loggers(self):
         logger_main = logging.getLogger(self.name)
-        logger_main.setLevel(logging.DEBUG)
 
         fmt = f'[%(asctime)s] [%(levelname)s] [{self.name.upper()}] %(message)s'
-        log_formatter = logging.Formatter(fmt=fmt)
 
         #log_file_path = Path(sys.argv[0]).resolve().parent
         #while log_file_path.name != 'rocket_ground_station':
@@ -87,17 +273,14 @@ class Proxy:
         #    join(str(log_file_path),
         #         f'Proxy_{datetime.now().strftime("%Y_%m_%d_%H_%M_%S")}.log'))
 
-        console_handler = logging.StreamHandler(sys.stdout)
-
-        #file_handler.setFormatter(log_formatter)
-        console_handler.setFormatter(log_formatter)
-        #logger_main.addHandler(file_handler)
-        logger_main.addHandler(console_handler)
+        # printing happens on the QueueListener thread, the event loop only puts records in the queue
+        setup_queue_logging(logger_main, fmt)
 
     def add_client(self, reader, writer: asyncio.StreamWriter):
-        client = ProxyClient(reader, writer)
+        client = ProxyClient(reader, writer, self.conflate_feed, self._next_client_id)
+        self._next_client_id += self._client_id_step
         self.clients.update({client.get_key(): client})
-        self._logger.info('Added new client')
+        self._logger.info(f'Added new client {client.client_id}')
         return client
 
     def remove_client(self, client):
@@ -105,7 +288,15 @@ class Proxy:
         if key in self.clients:
             client.stop()
             self.clients.pop(key)
-            self._logger.info('Removed client')
+            self.conflated_frames += client.conflated_frames
+            if client.session is not None:
+                self.detach_session(client)
+            client.stats.dropped_frames += len(client.send_queue)
+            self.removed_clients_stats.merge(client.stats)
+            self._logger.info(f'Removed client {client.client_id}')
+            if client.conflated_frames:
+                self._logger.info(f'Conflated {client.conflated_frames} feed frames for removed client, '
+                                  f'{self.conflated_frames} in total')
 
     def set_tcp_server_options(self, address, port):
         self.tcp_address = address
@@ -116,6 +307,106 @@ class Proxy:
         self.mirror_frames = state
         self._logger.info(f'Frame mirroring set to: {self.mirror_frames}')
 
+    # Client ids first, first + step, ... keep ids unique across several proxies
+    def set_client_id_range(self, first, step):
+        self._next_client_id = first
+        self._client_id_step = step
+
+    # Keep resumable client sessions with a buffer of capacity frames for timeout seconds after disconnecting
+    def set_sessions(self, capacity, timeout):
+        self.session_capacity = capacity
+        self.session_timeout = timeout
+        self._logger.info(f'Resumable sessions set to: {capacity} buffered frames, {timeout} s timeout')
+
+    # Grant clients asking for flow control at most window frames in flight, credits are
+    # withheld while more than backlog_limit frames wait to be delivered
+    def set_flow_control(self, window, backlog_limit):
+        self.credit_window = window
+        self.credit_backlog_limit = backlog_limit
+        self._logger.info(f'Flow control set to: {window} frames window, {backlog_limit} frames backlog limit')
+
+    def detach_session(self, client: ProxyClient):
+        session = client.session
+        # frames still waiting for the client are delivered on resume
+        while client.send_queue:
+            _, data = client.get_data_to_send()
+            session.append(data)
+        session.client = None
+        session.detached_at = time.monotonic()
+        client.session = None
+
+    async def expire_sessions(self):
+        while True:
+            await asyncio.sleep(1.0)
+            now = time.monotonic()
+            expired = [session for session in self._sessions.values()
+                       if session.client is None and now - session.detached_at > self.session_timeout]
+            for session in expired:
+                self._sessions.pop(session.session_id)
+                self._logger.info(f'Session {session.session_id} expired')
+
+    # Keep only the newest queued FEED frame per device for clients that fall behind
+    def set_feed_conflation(self, state):
+        self.conflate_feed = state
+        self._logger.info(f'Feed conflation set to: {self.conflate_feed}')
+
+    # Send the last FEED frame of every device to newly connected clients
+    def set_feed_snapshot(self, state):
+        self.send_feed_snapshot = state
+        self._feed_snapshot.clear()
+        self._logger.info(f'Feed snapshot for new clients set to: {self.send_feed_snapshot}')
+
+    # Record every forwarded frame to segmented binary files
+    def set_recorder(self, recorder: FrameLogWriter):
+        self._recorder = recorder
+        self._logger.info(f'Recording frames to: {recorder.directory}')
+
+    @property
+    def total_conflated_frames(self):
+        return self.conflated_frames + sum(client.conflated_frames for client in self.clients.values())
+
+    def stats_by_client(self):
+        """
+        Yields (client label, stats, current queue depth, conflated frames) for every
+        connected client, all disconnected clients together and the station side.
+        """
+        for client in self.clients.values():
+            yield str(client.client_id), client.stats, len(client.send_queue), client.conflated_frames
+        yield 'disconnected', self.removed_clients_stats, 0, self.conflated_frames
+        yield 'station', self.station_stats, len(self._external_receive_queue), 0
+
+    def log_summary(self, interval, previous):
+        """
+        Logs traffic since the previous summary.
+        :param interval: seconds since the previous summary
+        :param previous: (frames in, frames out) totals from the previous summary
+        :return: current (frames in, frames out) totals
+        """
+        frames_in = frames_out = dropped = resyncs = 0
+        queue_depth = peak_queue_depth = 0
+        for label, stats, depth, _ in self.stats_by_client():
+            if label == 'station':
+                continue
+            frames_in += stats.frames_in
+            frames_out += stats.frames_out
+            dropped += stats.dropped_frames
+            resyncs += stats.header_resyncs
+            queue_depth = max(queue_depth, depth)
+            peak_queue_depth = max(peak_queue_depth, stats.peak_queue_depth)
+
+        latency = self._interval_latency
+        self._logger.info(
+            f'{len(self.clients)} clients, '
+            f'in {(frames_in - previous[0]) / interval:.1f} frames/s, '
+            f'out {(frames_out - previous[1]) / interval:.1f} frames/s, '
+            f'queue {queue_depth} (peak {peak_queue_depth}), '
+            f'latency p50 {latency.quantile(0.5) * 1e3:.2f} ms, '
+            f'p99 {latency.quantile(0.99) * 1e3:.2f} ms, '
+            f'max {latency.max * 1e3:.2f} ms, '
+            f'dropped {dropped}, conflated {self.total_conflated_frames}, resyncs {resyncs}')
+        latency.reset()
+        return frames_in, frames_out
+
     # Handle receiving data from ground station and forwarding it to clients
     async def handle_station_receive(self):
         while True:
@@ -124,12 +415,28 @@ class Proxy:
                 await asyncio.sleep(0)
                 continue
 
-            data = self.get_external_data_to_forward()
+            ingress, data, skip_client = self.get_external_data_to_forward()
+            self.station_stats.frames_in += 1
+            self.station_stats.bytes_in += len(data)
+
+            if self._recorder is not None:
+                self._recorder.record(FrameDirection.TO_CLIENTS, 0, data)
+
+            if self.send_feed_snapshot and skip_client is None:
+                key = feed_key(data)
+                if key is not None:
+                    self._feed_snapshot[key] = data
+
+            for session in self._sessions.values():
+                if session.client is None:
+                    session.append(data)
 
             clients_to_drop = []
             for client in self.clients.values():
+                if client.client_id == skip_client:
+                    continue
                 try:
-                    client.push_data_to_send(data)
+                    client.push_data_to_send(data, ingress)
                 except ConnectionResetError:
                     clients_to_drop.append(client)
                     continue
@@ -143,10 +450,16 @@ class Proxy:
                 await asyncio.sleep(0)
                 continue
 
-            data = self.get_data_to_send()
+            _, ingress, data = self.get_data_to_send()
+            if not self._external_listeners:
+                # nothing to forward to, e.g. while replaying a recording
+                self.station_stats.dropped_frames += 1
+                continue
+            self.station_stats.frames_out += 1
+            self.station_stats.bytes_out += len(data)
 
             for listener in self._external_listeners:
-                listener.push_external_data_to_forward(data)
+                listener.push_external_data_to_forward(data, ingress=ingress)
 
     # Handle receiving data from client and send it to ground station
     async def handle_client_receive(self, client):
@@ -154,6 +467,7 @@ class Proxy:
             try:
                 header = await client.readexactly(1)
                 if header != bytes([HEADER_ID]):
+                    client.stats.header_resyncs += 1
                     self._logger.info('missing header')
                     await asyncio.sleep(0)
                     continue
@@ -166,16 +480,153 @@ class Proxy:
             except asyncio.IncompleteReadError:
                 break
 
-            self.push_data_to_send(header + raw_data)
+            ingress = time.perf_counter_ns()
+            client.stats.frames_in += 1
+            client.stats.bytes_in += len(header) + len(raw_data)
+
+            if is_control_frame(header + raw_data):
+                self.handle_control_frame(client, header + raw_data)
+                continue
+
+            self.push_data_to_send(header + raw_data, client.client_id, ingress)
+            if client.credit_window:
+                client.credits_to_return += 1
+
+            if self._recorder is not None:
+                self._recorder.record(FrameDirection.FROM_CLIENT, client.client_id, header + raw_data)
 
             if self.mirror_frames:
                 for remote_client in self.clients.values():
                     if client == remote_client:
                         continue
-                    remote_client.push_data_to_send(header + raw_data)
+                    remote_client.push_data_to_send(header + raw_data, ingress)
+                for session in self._sessions.values():
+                    if session.client is None:
+                        session.append(header + raw_data)
 
         self.remove_client(client)
 
+    # Handle frames addressed to the proxy itself, they are never forwarded
+    def handle_control_frame(self, client: ProxyClient, data):
+        try:
+            frame = self.protocol.decode(data)
+        except (ChecksumMismatchError, ProtocolError, ValueError):
+            self._logger.warning(f'Malformed control frame from client {client.client_id}')
+            return
+
+        if frame.device_type != DeviceID.PROXY or frame.action != ActionID.SERVICE:
+            self._logger.warning('Unsupported control frame from client %s: %s', client.client_id, frame)
+            return
+
+        operations = OperationID.PROXY.value
+        if frame.operation == operations.PING:
+            reply = Frame(**{**frame.as_dict(), 'action': ActionID.ACK})
+            client.push_data_to_send(self.protocol.encode(reply))
+        elif frame.operation == operations.SESSION_OPEN:
+            self.open_session(client)
+        elif frame.operation == operations.SESSION_RESUME:
+            client.resume_session_id = frame.data
+        elif frame.operation == operations.SESSION_SEQUENCE:
+            self.resume_session(client, client.resume_session_id, frame.data)
+            client.resume_session_id = None
+        elif frame.operation == operations.CREDIT:
+            self.start_flow_control(client, frame.data)
+        else:
+            self._logger.warning('Unsupported control frame from client %s: %s', client.client_id, frame)
+
+    # Reply carries the granted window, the client may send that many frames right away
+    def start_flow_control(self, client: ProxyClient, requested_window):
+        operation = OperationID.PROXY.value.CREDIT
+        if not self.credit_window:
+            client.push_data_to_send(self.protocol.encode(
+                control_frame(operation, ActionID.NACK, DataTypeID.UINT32, (requested_window,))))
+            return
+        window = min(requested_window, self.credit_window) if requested_window else self.credit_window
+        client.credit_window = window
+        client.credits_to_return = 0
+        client.push_data_to_send(self.protocol.encode(
+            control_frame(operation, ActionID.ACK, DataTypeID.UINT32, (window,))))
+        self._logger.info(f'Flow control started for client {client.client_id} with {window} frames window')
+
+    # Handle returning credits for frames already passed on, as long as the listeners keep up
+    async def handle_credit_grants(self):
+        operation = OperationID.PROXY.value.CREDIT
+        while True:
+            await asyncio.sleep(self.CREDIT_GRANT_INTERVAL)
+            if self.flow_backlog > self.credit_backlog_limit:
+                continue
+            for client in self.clients.values():
+                if not client.credits_to_return:
+                    continue
+                grant = control_frame(operation, ActionID.SERVICE, DataTypeID.UINT32, (client.credits_to_return,))
+                client.push_data_to_send(self.protocol.encode(grant))
+                client.credits_to_return = 0
+
+    # Session replies are written right away instead of being queued, every frame
+    # taken from the queue afterwards belongs to the session
+    def write_session_reply(self, client: ProxyClient, operation, action, session_id, missed=b''):
+        reply = control_frame(operation, action, DataTypeID.UINT32, (session_id,))
+        data = self.protocol.encode(reply) + missed
+        client.writer.write(data)
+        client.stats.frames_out += len(data) // FRAME_LENGTH
+        client.stats.bytes_out += len(data)
+
+    # Latest FEED frame of every device, for clients without the history
+    def feed_snapshot_data(self):
+        return b''.join(self._feed_snapshot.values()) if self.send_feed_snapshot else b''
+
+    def open_session(self, client: ProxyClient):
+        operation = OperationID.PROXY.value.SESSION_OPEN
+        if not self.session_capacity:
+            self.write_session_reply(client, operation, ActionID.NACK, 0)
+            return
+        if client.session is not None:
+            self.detach_session(client)
+
+        session_id = secrets.randbits(32)
+        while session_id in self._sessions:
+            session_id = secrets.randbits(32)
+        session = ProxySession(session_id, self.session_capacity)
+        self._sessions[session_id] = session
+        self.write_session_reply(client, operation, ActionID.ACK, session_id)
+        session.client = client
+        client.session = session
+        self._logger.info(f'Opened session {session_id} for client {client.client_id}')
+
+    def resume_session(self, client: ProxyClient, session_id, last_sequence):
+        operation = OperationID.PROXY.value.SESSION_RESUME
+        session = self._sessions.get(session_id)
+        if session is None:
+            self._logger.info(f'Client {client.client_id} tried to resume unknown session {session_id}')
+            # the client discarded the snapshot sent before the reply, it gets it again
+            self.write_session_reply(client, operation, ActionID.NACK, session_id or 0, self.feed_snapshot_data())
+            return
+
+        # previous connection may still look alive, the new one takes over
+        if session.client is not None and session.client is not client:
+            self.remove_client(session.client)
+        elif session.client is client:
+            self.detach_session(client)
+
+        missed = session.frames_after(last_sequence)
+        if missed is None:
+            self._logger.info(f'Session {session_id} cannot be resumed from frame {last_sequence}, '
+                              f'frames up to {session.last_sequence - len(session.frames)} are gone')
+            self._sessions.pop(session_id)
+            self.write_session_reply(client, operation, ActionID.NACK, session_id, self.feed_snapshot_data())
+            return
+
+        if client.session is not None:
+            self.detach_session(client)
+        # everything queued so far was buffered by the detached session as well
+        client.discard_queued()
+        self.write_session_reply(client, operation, ActionID.ACK, session_id, missed)
+        session.client = client
+        session.detached_at = None
+        client.session = session
+        self._logger.info(f'Client {client.client_id} resumed session {session_id}, '
+                          f'resent {len(missed) // FRAME_LENGTH} missed frames')
+
     # Handle sending data from ground station to client
     async def handle_client_send(self, client: ProxyClient):
         while not client.should_stop:
@@ -183,50 +634,642 @@ class Proxy:
                 await asyncio.sleep(0)
                 continue
 
-            data = client.get_data_to_send()
+            ingress, data = client.get_data_to_send()
+            # sequenced before writing, a failed write is resent on resume
+            if client.session is not None:
+                client.session.append(data)
 
             try:
                 await client.write(data)
             except ConnectionResetError:
                 break
 
+            latency = (time.perf_counter_ns() - ingress) / 1e9
+            client.stats.forward_latency.observe(latency)
+            self._interval_latency.observe(latency)
+
         self.remove_client(client)
 
     # Handle new TCP client
     async def handle_new_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
         client = self.add_client(reader, writer)
+        if self.send_feed_snapshot and self._feed_snapshot:
+            client.push_batch_to_send(self.feed_snapshot_data())
+            self._logger.info(f'Sent snapshot of {len(self._feed_snapshot)} feed frames to new client')
         asyncio.create_task(self.handle_client_receive(client))
         asyncio.create_task(self.handle_client_send(client))
 
     async def serve(self):
-        server = await asyncio.start_server(self.handle_new_client, self.tcp_address, self.tcp_port)
+        server = await asyncio.start_server(self.handle_new_client, self.tcp_address, self.tcp_port,
+                                            reuse_port=self.reuse_port)
         asyncio.create_task(self.handle_station_receive())
         asyncio.create_task(self.handle_station_send())
+        if self.session_capacity:
+            asyncio.create_task(self.expire_sessions())
+        if self.credit_window:
+            asyncio.create_task(self.handle_credit_grants())
         self._logger.info(f'Listening for tcp connections on socket: {self.tcp_address}:{self.tcp_port}')
         async with server:
             await server.serve_forever()
 
 
+class WorkerProxy(Proxy):
+    """
+    Software facing proxy running in a worker process. Frames from the station,
+    including frames mirrored from clients of other workers, come through
+    a shared memory broadcast ring. Frames of its own clients go to the
+    ingest process through the uplink queue.
+    """
+
+    # Seconds between ring polls while nothing is published
+    RING_IDLE_POLL = 0.0005
+
+    def __init__(self, name, ring: BroadcastRing, uplink):
+        super().__init__(name)
+        self._ring_reader = ring.reader()
+        self._uplink = uplink
+        self.reuse_port = True
+
+    async def handle_ring_receive(self):
+        while True:
+            records = self._ring_reader.read()
+            if not records:
+                await asyncio.sleep(self.RING_IDLE_POLL)
+                continue
+            for data, origin in records:
+                self.push_external_data_to_forward(data, origin or None)
+            if self._ring_reader.lost_records > self.station_stats.dropped_frames:
+                self._logger.warning(f'Fell behind the broadcast ring, '
+                                     f'lost {self._ring_reader.lost_records} frames in total')
+                self.station_stats.dropped_frames = self._ring_reader.lost_records
+            await asyncio.sleep(0)
+
+    async def handle_station_send(self):
+        while True:
+            if not self._send_queue:
+                await asyncio.sleep(0)
+                continue
+
+            client_id, ingress, data = self.get_data_to_send()
+            self.station_stats.frames_out += 1
+            self.station_stats.bytes_out += len(data)
+            # perf_counter_ns is a system-wide monotonic clock, so the ingest process can use it
+            self._uplink.put((client_id, ingress, data))
+
+    async def serve(self):
+        asyncio.create_task(self.handle_ring_receive())
+        await super().serve()
+
+
+class RingPublisher:
+    """
+    Ingest side of the multi-process mode. Registered as an external listener
+    of the hardware proxy it broadcasts hardware frames to all workers, frames
+    from worker clients are forwarded to the hardware and mirrored through the ring.
+    """
+
+    # Seconds a blocking uplink read waits, bounds the shutdown time
+    UPLINK_POLL = 0.5
+
+    def __init__(self, ring: BroadcastRing, uplink, hardware_proxy: Proxy, mirror_frames=True):
+        self.ring = ring
+        self.uplink = uplink
+        self.hardware_proxy = hardware_proxy
+        self.mirror_frames = mirror_frames
+        self._recorder = None
+
+    def set_recorder(self, recorder: FrameLogWriter):
+        self._recorder = recorder
+
+    def push_external_data_to_forward(self, data, skip_client=None, ingress=None):
+        if self._recorder is not None:
+            self._recorder.record(FrameDirection.TO_CLIENTS, 0, data)
+        self.ring.publish(data)
+
+    # Publishing never waits for the workers
+    @property
+    def forward_backlog(self):
+        return 0
+
+    def _get_uplink_frame(self):
+        try:
+            return self.uplink.get(timeout=self.UPLINK_POLL)
+        except queue.Empty:
+            return None
+
+    # Handle frames received by workers and send them to the hardware
+    async def handle_uplink(self):
+        event_loop = asyncio.get_running_loop()
+        while True:
+            item = await event_loop.run_in_executor(None, self._get_uplink_frame)
+            if item is None:
+                continue
+            client_id, ingress, data = item
+            if self._recorder is not None:
+                self._recorder.record(FrameDirection.FROM_CLIENT, client_id, data)
+            self.hardware_proxy.push_external_data_to_forward(data, ingress=ingress)
+            if self.mirror_frames:
+                self.ring.publish(data, client_id)
+
+
+class UpstreamLink:
+    """
+    Connects a relay proxy to the software port of another proxy as a single
+    client. Frames from upstream are served to the relay clients, frames of the
+    relay clients are sent upstream. Round trip time to the upstream proxy
+    is measured with PING control frames.
+    """
+
+    PING_INTERVAL = 1.0
+    RECONNECT_DELAY = 1.0
+    # Unanswered pings kept for matching replies
+    MAX_PENDING_PINGS = 16
+
+    def __init__(self, proxy: Proxy, address, port):
+        self.proxy = proxy
+        self.address = address
+        self.port = port
+        self.connected = False
+        self.stats = TrafficStats()
+        self.round_trip = LatencyHistogram()
+        self._send_queue = deque()
+        self._pings = {}
+        self._next_token = 0
+        self._logger = logging.getLogger(proxy.name)
+
+    # Called by the relay proxy for every frame of its clients,
+    # commands are not held back to be sent late after a reconnect
+    def push_external_data_to_forward(self, data, skip_client=None, ingress=None):
+        if not self.connected:
+            self.stats.dropped_frames += 1
+            return
+        self._send_queue.append(data)
+
+    @property
+    def forward_backlog(self):
+        return len(self._send_queue)
+
+    async def run(self):
+        while True:
+            try:
+                reader, writer = await asyncio.open_connection(self.address, self.port)
+            except OSError as err:
+                self._logger.warning(f'Upstream {self.address}:{self.port} unavailable: {err}')
+                await asyncio.sleep(self.RECONNECT_DELAY)
+                continue
+
+            self.connected = True
+            self._pings.clear()
+            self._send_queue.clear()
+            self._logger.info(f'Connected to upstream proxy {self.address}:{self.port}')
+            tasks = [asyncio.create_task(self._receive(reader)),
+                     asyncio.create_task(self._send(writer)),
+                     asyncio.create_task(self._ping())]
+            try:
+                await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                for task in tasks:
+                    task.cancel()
+                writer.close()
+                self.connected = False
+                self.stats.dropped_frames += len(self._send_queue)
+                self._send_queue.clear()
+            self._logger.warning(f'Lost connection to upstream proxy {self.address}:{self.port}')
+            await asyncio.sleep(self.RECONNECT_DELAY)
+
+    async def _receive(self, reader: asyncio.StreamReader):
+        while True:
+            try:
+                header = await reader.readexactly(1)
+                if header != bytes([HEADER_ID]):
+                    self.stats.header_resyncs += 1
+                    continue
+                data = header + await reader.readexactly(13)
+            except (ConnectionError, asyncio.IncompleteReadError):
+                return
+
+            self.stats.frames_in += 1
+            self.stats.bytes_in += len(data)
+            if is_control_frame(data):
+                self._handle_control_frame(data)
+                continue
+            self.proxy.push_external_data_to_forward(data)
+
+    async def _send(self, writer: asyncio.StreamWriter):
+        while True:
+            if not self._send_queue:
+                await asyncio.sleep(0)
+                continue
+
+            # everything queued goes out in a single write
+            batch = []
+            while self._send_queue:
+                batch.append(self._send_queue.popleft())
+            data = b''.join(batch)
+            try:
+                writer.write(data)
+                await writer.drain()
+            except ConnectionError:
+                self.stats.dropped_frames += len(batch)
+                return
+            self.stats.frames_out += len(batch)
+            self.stats.bytes_out += len(data)
+
+    async def _ping(self):
+        while True:
+            token = self._next_token
+            self._next_token = (self._next_token + 1) % 2 ** 32
+            self._pings[token] = time.perf_counter_ns()
+            if len(self._pings) > self.MAX_PENDING_PINGS:
+                self._pings.pop(next(iter(self._pings)))
+            ping = control_frame(OperationID.PROXY.value.PING, data_type=DataTypeID.UINT32, payload=(token,))
+            self._send_queue.appendleft(self.proxy.protocol.encode(ping))
+            await asyncio.sleep(self.PING_INTERVAL)
+
+    def _handle_control_frame(self, data):
+        try:
+            frame = self.proxy.protocol.decode(data)
+        except (ChecksumMismatchError, ProtocolError, ValueError):
+            return
+        if frame.operation == OperationID.PROXY.value.PING and frame.action == ActionID.ACK:
+            sent = self._pings.pop(frame.data, None)
+            if sent is not None:
+                self.round_trip.observe((time.perf_counter_ns() - sent) / 1e9)
+
+    def log_summary(self):
+        self._logger.info(f'Upstream {self.address}:{self.port} '
+                          f'{"connected" if self.connected else "disconnected"}, '
+                          f'round trip p50 {self.round_trip.quantile(0.5) * 1e3:.2f} ms, '
+                          f'p99 {self.round_trip.quantile(0.99) * 1e3:.2f} ms, '
+                          f'max {self.round_trip.max * 1e3:.2f} ms, '
+                          f'dropped {self.stats.dropped_frames}')
+
+
+def configure_software_proxy(proxy: Proxy, cl_args, port):
+    proxy.set_tcp_server_options(cl_args.tcp_address, port)
+    proxy.set_frame_mirroring(True)
+    proxy.set_feed_conflation(cl_args.conflate_feed)
+    # Software proxy receives hardware traffic on its station side, so it holds the snapshot
+    proxy.set_feed_snapshot(not cl_args.no_feed_snapshot)
+    proxy.set_sessions(cl_args.session_buffer, cl_args.session_timeout)
+    proxy.set_flow_control(cl_args.flow_window, cl_args.flow_backlog)
+
+
+# seconds between checks whether the ingest process of a worker is still alive
+WORKER_PARENT_POLL = 1.0
+
+
+def run_worker(index, ring: BroadcastRing, uplink, cl_args):
+    proxy = WorkerProxy(f'software-{index + 1}', ring, uplink)
+    configure_software_proxy(proxy, cl_args, int(cl_args.tcp_port))
+    # Mirroring is done by the ingest process so every worker sees the same order
+    proxy.set_frame_mirroring(False)
+    proxy.set_client_id_range(index + 1, cl_args.workers)
+
+    metrics_port = None
+    if cl_args.metrics_port is not None:
+        metrics_port = cl_args.metrics_port + index + 1
+    metrics = ProxyMetrics([proxy], cl_args.tcp_address, metrics_port, cl_args.metrics_log_interval)
+
+    async def watch_parent(parent_pid):
+        # a worker whose ingest process died would keep accepting clients without any traffic
+        while os.getppid() == parent_pid:
+            await asyncio.sleep(WORKER_PARENT_POLL)
+        logging.getLogger(proxy.name).info('Ingest process is gone, stopping the worker')
+
+    async def run_worker_proxy():
+        serving = asyncio.gather(proxy.serve(), metrics.serve())
+        watchdog = asyncio.ensure_future(watch_parent(os.getppid()))
+        await asyncio.wait([serving, watchdog], return_when=asyncio.FIRST_COMPLETED)
+        for task in (serving, watchdog):
+            task.cancel()
+        await asyncio.gather(serving, watchdog, return_exceptions=True)
+
+    try:
+        asyncio.run(run_worker_proxy())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        # worker processes end with os._exit(), atexit handlers do not run
+        stop_queue_logging()
+
+
+class ProxyMetrics:
+    """
+    Exposes proxy instrumentation in Prometheus text format over a local
+    HTTP endpoint and logs a periodic traffic summary.
+    """
+
+    def __init__(self, proxies, address='127.0.0.1', port=None, log_interval=0.0, upstream=None):
+        self.proxies = proxies
+        self.address = address
+        self.port = port
+        self.log_interval = log_interval
+        self.upstream: UpstreamLink = upstream
+
+    def collect(self):
+        families = {
+            'proxy_frames_total': ('counter', 'Frames received (in) and written (out) by the proxy', []),
+            'proxy_bytes_total': ('counter', 'Bytes received (in) and written (out) by the proxy', []),
+            'proxy_queue_depth': ('gauge', 'Frames currently waiting to be written', []),
+            'proxy_queue_depth_peak': ('gauge', 'Highest number of frames waiting to be written', []),
+            'proxy_dropped_frames_total': ('counter', 'Frames discarded because their client disconnected', []),
+            'proxy_conflated_frames_total': ('counter', 'Queued FEED frames replaced by newer ones', []),
+            'proxy_header_resyncs_total': ('counter', 'Bytes skipped while looking for a frame header', []),
+            'proxy_clients': ('gauge', 'Connected clients', []),
+            'proxy_forward_latency_seconds': ('histogram', 'Time from entering the proxy to the end of the client write', []),
+            'proxy_upstream_connected': ('gauge', 'Whether the relay is connected to its upstream proxy', []),
+            'proxy_upstream_round_trip_seconds': ('histogram', 'Round trip time of pings to the upstream proxy', []),
+        }
+        for proxy in self.proxies:
+            families['proxy_clients'][2].append(f'proxy_clients{format_labels({"proxy": proxy.name})} {len(proxy.clients)}')
+            for label, stats, depth, conflated in proxy.stats_by_client():
+                labels = {'proxy': proxy.name, 'client': label}
+                for direction, frames, data_bytes in (('in', stats.frames_in, stats.bytes_in),
+                                                      ('out', stats.frames_out, stats.bytes_out)):
+                    direction_labels = format_labels({**labels, 'direction': direction})
+                    families['proxy_frames_total'][2].append(f'proxy_frames_total{direction_labels} {frames}')
+                    families['proxy_bytes_total'][2].append(f'proxy_bytes_total{direction_labels} {data_bytes}')
+                for name, value in (('proxy_queue_depth', depth),
+                                    ('proxy_queue_depth_peak', stats.peak_queue_depth),
+                                    ('proxy_dropped_frames_total', stats.dropped_frames),
+                                    ('proxy_conflated_frames_total', conflated),
+                                    ('proxy_header_resyncs_total', stats.header_resyncs)):
+                    families[name][2].append(f'{name}{format_labels(labels)} {value}')
+                if label != 'station':
+                    families['proxy_forward_latency_seconds'][2].extend(
+                        stats.forward_latency.prometheus_lines('proxy_forward_latency_seconds', labels))
+
+        if self.upstream is not None:
+            labels = {'proxy': self.upstream.proxy.name, 'client': 'upstream'}
+            stats = self.upstream.stats
+            for direction, frames, data_bytes in (('in', stats.frames_in, stats.bytes_in),
+                                                  ('out', stats.frames_out, stats.bytes_out)):
+                direction_labels = format_labels({**labels, 'direction': direction})
+                families['proxy_frames_total'][2].append(f'proxy_frames_total{direction_labels} {frames}')
+                families['proxy_bytes_total'][2].append(f'proxy_bytes_total{direction_labels} {data_bytes}')
+            families['proxy_dropped_frames_total'][2].append(
+                f'proxy_dropped_frames_total{format_labels(labels)} {stats.dropped_frames}')
+            families['proxy_upstream_connected'][2].append(
+                f'proxy_upstream_connected{format_labels(labels)} {int(self.upstream.connected)}')
+            families['proxy_upstream_round_trip_seconds'][2].extend(
+                self.upstream.round_trip.prometheus_lines('proxy_upstream_round_trip_seconds', labels))
+
+        lines = []
+        for name, (metric_type, description, samples) in families.items():
+            if not samples:
+                continue
+            lines.append(f'# HELP {name} {description}')
+            lines.append(f'# TYPE {name} {metric_type}')
+            lines.extend(samples)
+        return '\n'.join(lines) + '\n'
+
+    # Handle a single HTTP request, every path returns the metrics
+    async def handle_request(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+                pass
+            body = self.collect().encode()
+            writer.write(b'HTTP/1.1 200 OK\r\n'
+                         b'Content-Type: text/plain; version=0.0.4\r\n'
+                         b'Content-Length: ' + str(len(body)).encode() + b'\r\n'
+                         b'Connection: close\r\n\r\n' + body)
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def log_summaries(self):
+        previous = {proxy.name: (0, 0) for proxy in self.proxies}
+        while True:
+            await asyncio.sleep(self.log_interval)
+            for proxy in self.proxies:
+                previous[proxy.name] = proxy.log_summary(self.log_interval, previous[proxy.name])
+            if self.upstream is not None:
+                self.upstream.log_summary()
+
+    async def serve(self):
+        if self.log_interval > 0:
+            asyncio.create_task(self.log_summaries())
+        if self.port is None:
+            return
+        server = await asyncio.start_server(self.handle_request, self.address, self.port)
+        async with server:
+            await server.serve_forever()
+
+
+class FrameReplay:
+    """
+    Serves frames recorded by FrameLogWriter to the clients of a proxy
+    as if they were coming from live hardware. Every pass starts once
+    at least one client is connected.
+    :param reader:      recorded session
+    :param speed:       pacing multiplier, 1.0 is real time, 0 sends as fast as clients can take it
+    :param start:       offset in seconds from the beginning of the recording
+    :param loop:        start over after the last recorded frame
+    :param max_backlog: frames queued in the proxy before an unpaced replay waits
+    """
+
+    # Frames due within this many seconds are forwarded without sleeping
+    SLEEP_THRESHOLD = 0.001
+    # Unpaced replay yields to the event loop after this many frames
+    YIELD_EVERY = 256
+
+    def __init__(self, reader: FrameLogReader, speed: float = 1.0, start: float = 0.0,
+                 loop: bool = False, max_backlog: int = 4096):
+        self.reader = reader
+        self.speed = speed
+        self.start = reader.first_timestamp + int(start * 1e9)
+        self.loop = loop
+        self.max_backlog = max_backlog
+
+    async def run(self, proxy: Proxy):
+        logger = logging.getLogger(proxy.name)
+        pacing = f'{self.speed}x' if self.speed > 0 else 'as fast as possible'
+        logger.info(f'Replaying session {self.reader.session} at {pacing}')
+        while True:
+            while not proxy.clients:
+                await asyncio.sleep(0.05)
+            replayed = await self._replay_once(proxy)
+            logger.info(f'Replay finished after {replayed} frames')
+            if not self.loop:
+                return
+            logger.info('Replay looping from start')
+
+    async def _replay_once(self, proxy: Proxy):
+        event_loop = asyncio.get_running_loop()
+        first_timestamp = None
+        wall_start = 0.0
+        replayed = 0
+        since_yield = 0
+        for timestamp, direction, _, data in self.reader.records(self.start):
+            if direction != FrameDirection.TO_CLIENTS:
+                continue
+            if first_timestamp is None:
+                first_timestamp = timestamp
+                wall_start = event_loop.time()
+
+            if self.speed > 0:
+                due = wall_start + (timestamp - first_timestamp) / 1e9 / self.speed
+                delay = due - event_loop.time()
+                if delay > self.SLEEP_THRESHOLD:
+                    await asyncio.sleep(delay)
+                    since_yield = 0
+            else:
+                while proxy.forward_backlog > self.max_backlog:
+                    await asyncio.sleep(0)
+                    since_yield = 0
+
+            proxy.push_external_data_to_forward(data)
+            replayed += 1
+            since_yield += 1
+            if since_yield >= self.YIELD_EVERY:
+                await asyncio.sleep(0)
+                since_yield = 0
+        return replayed
+
+
 if __name__ == '__main__':
     parser = ArgumentParser()
     parser.add_argument('--tcp-address', default="127.0.0.1")
     parser.add_argument('--tcp-port', default=3000)
+    parser.add_argument('--conflate-feed', default=False, action='store_true',
+                        help='Replace queued FEED frames with the newest ones for software clients that fall behind.')
+    parser.add_argument('--no-feed-snapshot', default=False, action='store_true',
+                        help='Do not send the last known FEED frame of every device to newly connected software clients.')
+    parser.add_argument('--record-dir', default=None,
+                        help='Record all frames passing through the software proxy to segmented binary files in this directory.')
+    parser.add_argument('--record-segment-mb', default=64, type=int,
+                        help='Maximum size of a single recording segment in megabytes.')
+    parser.add_argument('--replay-dir', default=None,
+                        help='Serve a recorded session to software clients instead of connecting hardware.')
+    parser.add_argument('--replay-speed', default=1.0, type=float,
+                        help='Replay pacing. 1.0 = real-time, 10.0 = 10x faster, 0 = as fast as possible.')
+    parser.add_argument('--replay-start', default=0.0, type=float,
+                        help='Start the replay this many seconds into the recording.')
+    parser.add_argument('--replay-loop', default=False, action='store_true',
+                        help='Start the replay over after reaching the end of the recording.')
+    parser.add_argument('--metrics-port', default=None, type=int,
+                        help='Expose proxy metrics in Prometheus text format on this local HTTP port.')
+    parser.add_argument('--metrics-log-interval', default=60.0, type=float,
+                        help='Seconds between traffic summaries in the log, 0 disables them.')
+    parser.add_argument('--workers', default=0, type=int,
+                        help='Spread software clients across this many worker processes, 0 serves them in this process.')
+    parser.add_argument('--ring-capacity', default=65536, type=int,
+                        help='Frames kept in the shared memory ring feeding the worker processes.')
+    parser.add_argument('--session-buffer', default=65536, type=int,
+                        help='Frames buffered per resumable client session, 0 disables sessions.')
+    parser.add_argument('--session-timeout', default=30.0, type=float,
+                        help='Seconds a disconnected session waits to be resumed.')
+    parser.add_argument('--flow-window', default=1024, type=int,
+                        help='Largest credit window granted to clients asking for flow control, 0 disables it.')
+    parser.add_argument('--flow-backlog', default=4096, type=int,
+                        help='Credits are withheld while more frames than this wait to be delivered.')
+    parser.add_argument('--upstream', default=None,
+                        help='Relay mode: connect to the software port of another proxy (address:port) '
+                             'and serve its traffic to local clients.')
     cl_args = parser.parse_args()
-    software_proxy = Proxy(name='software')
-    software_proxy.set_tcp_server_options(cl_args.tcp_address, int(cl_args.tcp_port))
-    software_proxy.set_frame_mirroring(True)
+    if cl_args.workers and cl_args.replay_dir is not None:
+        parser.error('--replay-dir cannot be used together with --workers')
+    if cl_args.upstream is not None and (cl_args.workers or cl_args.replay_dir is not None):
+        parser.error('--upstream cannot be used together with --workers or --replay-dir')
 
     hardware_proxy = Proxy(name='hardware')
     hardware_proxy.set_tcp_server_options(cl_args.tcp_address, int(cl_args.tcp_port) + 1)
     hardware_proxy.set_frame_mirroring(False)
+    hardware_proxy.set_flow_control(cl_args.flow_window, cl_args.flow_backlog)
+
+    recorder = None
+    if cl_args.record_dir is not None:
+        recorder = FrameLogWriter(cl_args.record_dir, segment_size=cl_args.record_segment_mb * 1024 * 1024)
+
+    if not cl_args.workers:
+        software_proxy = Proxy(name='software')
+        configure_software_proxy(software_proxy, cl_args, int(cl_args.tcp_port))
+        if recorder is not None:
+            software_proxy.set_recorder(recorder)
+
+    upstream = None
+    if cl_args.upstream is not None:
+        upstream_address, upstream_port = cl_args.upstream.rsplit(':', 1)
+        upstream = UpstreamLink(software_proxy, upstream_address, int(upstream_port))
+        software_proxy.register_external_listener(upstream)
+    elif not cl_args.workers and cl_args.replay_dir is None:
+        software_proxy.register_external_listener(hardware_proxy)
+        hardware_proxy.register_external_listener(software_proxy)
+
 
-    software_proxy.register_external_listener(hardware_proxy)
-    hardware_proxy.register_external_listener(software_proxy)
+    async def run_proxy_workers():
+        ring = BroadcastRing(cl_args.ring_capacity)
+        uplink = multiprocessing.Queue()
+        publisher = RingPublisher(ring, uplink, hardware_proxy)
+        if recorder is not None:
+            publisher.set_recorder(recorder)
+        hardware_proxy.register_external_listener(publisher)
+
+        workers = [multiprocessing.Process(target=run_worker, args=(index, ring, uplink, cl_args), daemon=True)
+                   for index in range(cl_args.workers)]
+        for worker in workers:
+            worker.start()
+
+        metrics = ProxyMetrics([hardware_proxy], cl_args.tcp_address,
+                               cl_args.metrics_port, cl_args.metrics_log_interval)
+        serving = asyncio.gather(hardware_proxy.serve(),
+                                 publisher.handle_uplink(),
+                                 metrics.serve())
+        # daemon processes are only stopped on a normal exit, a signal has to stop the workers here
+        loop = asyncio.get_running_loop()
+        for signal_number in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(signal_number, serving.cancel)
+        try:
+            await serving
+        except asyncio.CancelledError:
+            pass
+        finally:
+            for worker in workers:
+                worker.terminate()
+            for worker in workers:
+                worker.join(timeout=5.0)
+            ring.close()
+            ring.unlink()
 
 
     async def run_proxy():
+        if cl_args.workers:
+            await run_proxy_workers()
+            return
+
+        if upstream is not None:
+            metrics = ProxyMetrics([software_proxy], cl_args.tcp_address,
+                                   cl_args.metrics_port, cl_args.metrics_log_interval, upstream)
+            await asyncio.gather(software_proxy.serve(),
+                                 upstream.run(),
+                                 metrics.serve())
+            return
+
+        if cl_args.replay_dir is not None:
+            logging.getLogger(software_proxy.name).info('Replay mode: commands from clients are dropped')
+            replay = FrameReplay(FrameLogReader(cl_args.replay_dir),
+                                 cl_args.replay_speed,
+                                 cl_args.replay_start,
+                                 cl_args.replay_loop)
+            metrics = ProxyMetrics([software_proxy], cl_args.tcp_address,
+                                   cl_args.metrics_port, cl_args.metrics_log_interval)
+            await asyncio.gather(software_proxy.serve(),
+                                 replay.run(software_proxy),
+                                 metrics.serve())
+            return
+
+        metrics = ProxyMetrics([software_proxy, hardware_proxy], cl_args.tcp_address,
+                               cl_args.metrics_port, cl_args.metrics_log_interval)
         await asyncio.gather(software_proxy.serve(),
-                             hardware_proxy.serve())
+                             hardware_proxy.serve(),
+                             metrics.serve())
 
 
-    asyncio.run(run_proxy())
\ No newline at end of file
+    try:
+        asyncio.run(run_proxy())
+    finally:
+        if recorder is not None:
+            recorder.close()
\ No newline at end of file
@@ -3,7 +3,7 @@ import random
 import sys
 import time
 import os
-from matplotlib import pyplot as plt
+import csv
 import numpy as np
 import yaml
 from enum import Enum
@@ -12,8 +12,18 @@ from communication_library.frame import ids, Frame
 from communication_library.communication_manager import CommunicationManager, TransportType
 from communication_library.exceptions import UnregisteredCallbackError
 
-from communication_library.exceptions import TransportTimeoutError
+from communication_library.exceptions import ClosedTransportError, TransportTimeoutError
 from communication_library.tcp_transport import TcpSettings
+from communication_library.log_pipeline import setup_queue_logging, stop_queue_logging
+from communication_library.frame_trace import FrameTraceWriter, TraceDirection
+from simulation_clock import WallClock, VirtualClock
+from feed_scheduler import FeedScheduler
+from simulation_model import SimulationModel, ModelContext, run_all
+from live_plot import LivePlot
+from integrators import INTEGRATORS, SemiImplicitEuler, EVENT_TOLERANCE
+from checkpoints import load_checkpoints, save_checkpoints, checkpoint_name
+from sensor_stress import SensorStress
+from loop_metrics import LoopMetrics
 
 
 from argparse import ArgumentParser
@@ -38,37 +48,87 @@ class SimulationState(Enum): # enum przechowujący stany symulacji rakiety
     LANDED = "LANDED"
 
 
+class RocketLogAdapter(logging.LoggerAdapter): # prefiks z nazwą rakiety, gdy jeden proces symuluje ich wiele
+    def process(self, msg, kwargs):
+        return f'[{self.extra["rocket"]}] {msg}', kwargs
+
+
 class StandaloneMock:
+    # najwięcej odcinków (zdarzeń) w jednym kroku fizyki
+    MAX_SEGMENTS = 100
+    # atrybuty zapisywane w punkcie kontrolnym obok czujników, serw, przekaźników i timerów
+    CHECKPOINT_VARIABLES = ('velocity', 'thrust_multiplier', 'max_altitude')
+
     def __init__(self, proxy_address: str,
                  proxy_port: int,
-                 hardware_config: str,
+                 hardware_config,
                  feed_send_interval: float,
                  no_print: bool,
                  verbose: bool,
                  time_multiplier: float,
-                 plot_vt: bool):
+                 plot_vt: bool,
+                 flow_window: int = 0,
+                 clock=None,
+                 name: str = None,
+                 recording_file=None,
+                 model='simulator_model.yaml',
+                 integrator=None,
+                 checkpoint_path: str = None,
+                 stress=None,
+                 metrics_interval: float = 0.0,
+                 status_interval: float = 1.0,
+                 trace_path: str = None):
         
-        with open(hardware_config, 'r') as config_file:
-            self.config = yaml.safe_load(config_file)
+        if isinstance(hardware_config, dict): # konfiguracja już wczytana, np. z przesuniętymi device_id
+            self.config = hardware_config
+        else:
+            with open(hardware_config, 'r') as config_file:
+                self.config = yaml.safe_load(config_file)
         
         self.manager = CommunicationManager()
         self.manager.change_transport_type(TransportType.TCP)
-        self.manager.connect(TcpSettings(address=proxy_address, port=proxy_port)) # łączenie z hardware proxy TCP
+        if proxy_address is not None: # bez adresu symulator działa bez proxy, np. w czasie wirtualnym
+            self.manager.connect(TcpSettings(address=proxy_address, port=proxy_port)) # łączenie z hardware proxy TCP
+        if proxy_address is not None and flow_window:
+            self.manager.enable_flow_control(flow_window) # proxy przydziela kredyty na wysyłane ramki
 
         self.setup_loggers()
         self._logger = logging.getLogger("main")
+        if name is not None:
+            self._logger = RocketLogAdapter(self._logger, {'rocket': name})
         
         self.feed_send_delay = feed_send_interval
         self.no_print = no_print
         self.verbose = verbose
         self.time_multiplier = time_multiplier
-        self.last_feed_update = time.perf_counter()
-        self.last_physics_update = time.perf_counter()
+        # czas symulacji; WallClock płynie z czasem rzeczywistym, VirtualClock tylko przy kolejnych krokach
+        self.clock = clock if clock is not None else WallClock(time_multiplier)
+        self.last_physics_tick = time.perf_counter()
+        self.last_physics_update = self.clock.now()
         self.last_status_print = time.perf_counter()
+        # status przy zmianie stanu najwyżej raz na status_interval sekund symulacji
+        self.status_interval = status_interval
+        self.last_status_time = float('-inf')
         self.should_run = True
         self.plot_vt = plot_vt
+        # osobna częstotliwość każdego urządzenia, domyślnie co feed_send_interval sekund
+        self.recording_writer = None
+        if recording_file is not None:
+            self.recording_writer = csv.writer(recording_file)
+            self.recording_writer.writerow(('time', 'sensor', 'value', 'units'))
+        self.feed_scheduler = FeedScheduler(self.config, float(feed_send_interval),
+                                            self.record_sensor if self.recording_writer else None)
+        # tryb obciążeniowy: wybrane czujniki wysyłane z dużą częstotliwością, z szumem i utratą próbek
+        self.sensor_stress = SensorStress(stress, self.feed_scheduler) if stress is not None else None
+        # pomiary czasów pętli, podsumowanie w logu co metrics_interval sekund (0 = tylko na końcu)
+        self.loop_metrics = LoopMetrics(self.feed_scheduler.jitter)
+        self.metrics_interval = metrics_interval
+        self.last_metrics_log = time.perf_counter()
+        # binarny zapis wszystkich odebranych i wysłanych ramek, szybszy niż --verbose
+        self.frame_trace = FrameTraceWriter(trace_path) if trace_path is not None else None
         
         self.state = SimulationState.IDLE
+        self.state_changed_at = self.clock.now()
         
         self.servos = {}
         for servo_name, servo_config in self.config['devices']['servo'].items():
@@ -78,13 +138,24 @@ class StandaloneMock:
         for relay_name in self.config['devices']['relay'].keys():
             self.relays[relay_name] = 0
         
-        self.sensors = {
-            'fuel_level': 0.0,
-            'oxidizer_level': 0.0,
-            'altitude': 0.0,
-            'oxidizer_pressure': 0.0,
-            'angle': 2.0
-        }
+        # słowniki device_id -> nazwa zamiast przeszukiwania konfiguracji przy każdej komendzie
+        self._servo_names = {settings['device_id']: name
+                             for name, settings in self.config['devices']['servo'].items()}
+        self._relay_names = {settings['device_id']: name
+                             for name, settings in self.config['devices']['relay'].items()}
+        self._servo_open_ranges = {name: (settings['open_pos'], abs(settings['open_pos'] - settings['closed_pos']) * 0.3)
+                                   for name, settings in self.config['devices']['servo'].items()}
+
+        # stany, przejścia i reguły awarii z pliku modelu, skompilowane do tablicy reguł na stan
+        self.model = model if isinstance(model, SimulationModel) else \
+            SimulationModel(model, [state.name for state in SimulationState])
+        self._state_rules = {state: self.model.rules.get(state.name, []) for state in SimulationState}
+        # IDLE i EXPLOSION ustawia sam symulator, pozostałe stany wynikają z modelu
+        self.feed_scheduler.check_states(self.model.states | {SimulationState.IDLE.name, SimulationState.EXPLOSION.name})
+        self._model_context = ModelContext(self)
+        # całkowanie ruchu; domyślnie półjawny Euler, jeden krok na tick jak dotąd
+        self.integrator = integrator if integrator is not None else SemiImplicitEuler()
+        self.sensors = dict(self.model.initial_sensors)
         
         self.oxidizer_filled = False
         self.fuel_filled = False
@@ -96,63 +167,69 @@ class StandaloneMock:
         self.velocity = 0.0
         self.thrust_multiplier = 1.0
 
-        if self.plot_vt:
-            self.fig, self.ax = plt.subplots()
-            self.ax.set_ylabel("Velocity [m/s]")
-            self.ax.set_xlabel("Time [s]")
-            self.ax.set_title("Rocket velocity / time")
-            self.ax.grid(True)
+        # punkty kontrolne po nazwie, z pliku checkpoint_path, do którego trafiają też nowe
+        self.checkpoint_path = checkpoint_path
+        self.set_checkpoints(load_checkpoints(checkpoint_path))
+        self._timer_attributes = sorted({'fuel_main_open_time', 'oxidizer_main_open_time', 'igniter_start_time',
+                                         'apogee_reached_time', 'state_changed_at',
+                                         *self.model.servo_timers.values(), *self.model.relay_timers.values()})
+
+        if self.plot_vt: # wykres rysuje osobny proces, symulacja tylko zapisuje próbki
+            self.live_plot = LivePlot()
 
-        self._logger.info(
-            f'Rocket simulator is running connected to {proxy_address}:{proxy_port}')
+        if proxy_address is not None:
+            self._logger.info(
+                f'Rocket simulator is running connected to {proxy_address}:{proxy_port}')
         self._logger.info(f'State: {self.state.value}')
 
     def setup_loggers(self):
         logger_main = logging.getLogger("main")
-        logger_main.setLevel(logging.DEBUG)
-
-        fmt = '[%(asctime)s] [%(levelname)s] %(message)s'
-        log_formatter = logging.Formatter(fmt=fmt)
-
-        console_handler = logging.StreamHandler(sys.stdout)
-
-        console_handler.setFormatter(log_formatter)
-        logger_main.addHandler(console_handler)
-
-    def print_rocket_status(self):
-        self._logger.info("=" * 60)
-        self._logger.info("ROCKET STATUS:")
-        self._logger.info(f"  State: {self.state.value}")
-        self._logger.info(f"  Sensors:")
-        self._logger.info(f"    - Fuel Level: {self.sensors['fuel_level']:.1f}%")
-        self._logger.info(f"    - Oxidizer Level: {self.sensors['oxidizer_level']:.1f}%")
-        self._logger.info(f"    - Oxidizer Pressure: {self.sensors['oxidizer_pressure']:.1f} bar")
-        self._logger.info(f"    - Altitude: {self.sensors['altitude']:.1f} m")
-        self._logger.info(f"    - Angle: {self.sensors['angle']:.1f}°")
-        self._logger.info(f"  Servos:")
-        for servo_name, position in self.servos.items():
-            self._logger.info(f"    - {servo_name}: {position}")
-        self._logger.info(f"  Relays:")
-        for relay_name, state in self.relays.items():
-            self._logger.info(f"    - {relay_name}: {'OPEN' if state else 'CLOSED'}")
-        self._logger.info(f"  Velocity: {self.velocity:.2f} m/s")
-        self._logger.info("=" * 60)
+        if logger_main.handlers: # kolejne rakiety w tym samym procesie korzystają z tego samego handlera
+            return
+        # konsola obsługiwana w osobnym wątku, wypisywanie nie blokuje obsługi ramek
+        setup_queue_logging(logger_main, '[%(asctime)s] [%(levelname)s] %(message)s')
+
+    def print_rocket_status(self, force: bool = True):
+        """
+        Logs the rocket status as one record. Without force the status is skipped
+        when the previous one is less than status_interval simulated seconds old.
+        """
+        now = self.clock.now()
+        if not force and now < self.last_status_time + self.status_interval:
+            return
+        self.last_status_time = now
+        lines = ["=" * 60,
+                 "ROCKET STATUS:",
+                 f"  State: {self.state.value}",
+                 f"  Sensors:",
+                 f"    - Fuel Level: {self.sensors['fuel_level']:.1f}%",
+                 f"    - Oxidizer Level: {self.sensors['oxidizer_level']:.1f}%",
+                 f"    - Oxidizer Pressure: {self.sensors['oxidizer_pressure']:.1f} bar",
+                 f"    - Altitude: {self.sensors['altitude']:.1f} m",
+                 f"    - Angle: {self.sensors['angle']:.1f}°",
+                 f"  Servos:"]
+        lines.extend(f"    - {servo_name}: {position}" for servo_name, position in self.servos.items())
+        lines.append(f"  Relays:")
+        lines.extend(f"    - {relay_name}: {'OPEN' if state else 'CLOSED'}" for relay_name, state in self.relays.items())
+        lines.append(f"  Velocity: {self.velocity:.2f} m/s")
+        if self.feed_scheduler.missed_sends:
+            lines.append(f"  Feed frames missed (rate not kept): {self.feed_scheduler.missed_sends}")
+        if self.sensor_stress is not None:
+            lines.append(f"  Stress samples sent: {self.sensor_stress.sent}, lost by dropout: "
+                         f"{self.sensor_stress.dropped}, skipped (loop too slow): {self.sensor_stress.skipped}")
+        lines.append("=" * 60)
+        self._logger.info("\n".join(lines))
 
     def plot_rocket_vt(self):
-
-        self.ax.scatter(self.last_physics_update, self.velocity, color='red', s=10)
-
-        self.ax.legend()
-        self.fig.canvas.draw()
-        plt.pause(0.1)
-        
+        self.live_plot.push(self.clock.now(), self.velocity)
 
     def explode(self, reason: str):
         self.state = SimulationState.EXPLOSION
+        self.state_changed_at = self.model_time()
         self._logger.error(f'EXPLOSION: {reason}')
         self.print_rocket_status()
         self._logger.error('Simulation ended.')
-        time.sleep(2)
+        self.clock.sleep(2)
         self.should_run = False
 
     def handle_frame(self, _frame) -> list[Frame]:
@@ -160,7 +237,7 @@ class StandaloneMock:
         handled = False
         
         if self.verbose:
-            self._logger.info(f'Received frame: {_frame}')
+            self._logger.info('Received frame: %s', _frame)
         
         if _frame.device_type == ids.DeviceID.SERVO:
             servo_name = self.get_servo_name(_frame.device_id)
@@ -176,16 +253,10 @@ class StandaloneMock:
                     
                     self._logger.info(f'{servo_name} position set to {new_position} (was {old_val})')
                     
-                    if abs(new_position - open_pos) < abs(new_position - closed_pos):
-                        if servo_name == 'fuel_main':
-                            self.fuel_main_open_time = time.perf_counter()
-                        elif servo_name == 'oxidizer_main':
-                            self.oxidizer_main_open_time = time.perf_counter()
-                    else:
-                        if servo_name == 'fuel_main':
-                            self.fuel_main_open_time = None
-                        elif servo_name == 'oxidizer_main':
-                            self.oxidizer_main_open_time = None
+                    timer = self.model.servo_timers.get(servo_name)
+                    if timer is not None:
+                        opened = abs(new_position - open_pos) < abs(new_position - closed_pos)
+                        setattr(self, timer, self.clock.now() if opened else None)
                     
                     handled = True
                 else:
@@ -209,8 +280,8 @@ class StandaloneMock:
                     self.relays[relay_name] = 1
                     self._logger.info(f'{relay_name} relay opened (was {old_val}, now 1)')
                     
-                    if relay_name == 'igniter':
-                        self.igniter_start_time = time.perf_counter()
+                    if relay_name in self.model.relay_timers:
+                        setattr(self, self.model.relay_timers[relay_name], self.clock.now())
                     
                     handled = True
                         
@@ -219,8 +290,8 @@ class StandaloneMock:
                     self.relays[relay_name] = 0
                     self._logger.info(f'{relay_name} relay closed (was {old_val}, now 0)')
                     
-                    if relay_name == 'igniter':
-                        self.igniter_start_time = None
+                    if relay_name in self.model.relay_timers:
+                        setattr(self, self.model.relay_timers[relay_name], None)
                     
                     handled = True
                 else:
@@ -236,365 +307,311 @@ class StandaloneMock:
                 }
                 output_frames.append(Frame(**{**_frame.as_dict(), **replacements}))
         
+        elif _frame.device_type == ids.DeviceID.SIMULATOR:
+            name = checkpoint_name(self.checkpoint_names, int(_frame.data))
+            if _frame.operation == ids.OperationID.SIMULATOR.value.CHECKPOINT_SAVE:
+                self.save_checkpoint(name)
+                handled = True
+            elif _frame.operation == ids.OperationID.SIMULATOR.value.CHECKPOINT_RESTORE and name in self.checkpoints:
+                self.restore_checkpoint(name)
+                handled = True
+            else:
+                self._logger.warning(f'Cannot handle simulator operation {_frame.operation} for checkpoint {name}')
+            
+            replacements = {
+                'destination': _frame.source,
+                'source': _frame.destination,
+                'action': ids.ActionID.ACK if handled else ids.ActionID.NACK
+            }
+            output_frames.append(Frame(**{**_frame.as_dict(), **replacements}))
+        
         else:
             self._logger.warning(f'Unknown device_type {_frame.device_type}')
         
         return output_frames
 
+    def set_checkpoints(self, checkpoints: dict):
+        """
+        Checkpoints by name. Their order fixes the indexes used by control frames,
+        checkpoints saved later do not shift them.
+        """
+        self.checkpoints = checkpoints
+        self.checkpoint_names = list(checkpoints)
+
+    def checkpoint(self) -> dict:
+        """
+        Full simulation state as plain data, timers stored as absolute simulation times.
+        """
+        # czas wirtualny jest sumą kroków, zaokrąglenie do mikrosekund usuwa szum sumowania z pliku
+        return {'state': self.state.name,
+                'time': round(self.clock.now(), 6),
+                'sensors': dict(self.sensors),
+                'servos': dict(self.servos),
+                'relays': dict(self.relays),
+                'variables': {name: getattr(self, name) for name in self.CHECKPOINT_VARIABLES},
+                'timers': {name: None if getattr(self, name) is None else round(getattr(self, name), 6)
+                           for name in self._timer_attributes}}
+
+    def restore(self, checkpoint: dict):
+        """
+        Restores a checkpoint() result. Timers are shifted by the time passed since the save,
+        so e.g. the time since apogee is the same as when the checkpoint was made.
+        """
+        shift = self.clock.now() - checkpoint['time']
+        self.state = SimulationState[checkpoint['state']]
+        self.should_run = True
+        self.sensors.update(checkpoint['sensors'])
+        self.servos.update(checkpoint['servos'])
+        self.relays.update(checkpoint['relays'])
+        for name, value in checkpoint['variables'].items():
+            setattr(self, name, value)
+        for name, value in checkpoint['timers'].items():
+            setattr(self, name, None if value is None else value + shift)
+
+    def save_checkpoint(self, name: str):
+        self.checkpoints[name] = self.checkpoint()
+        if self.checkpoint_path is not None:
+            save_checkpoints(self.checkpoint_path, self.checkpoints)
+        self._logger.info(f'Checkpoint {name} saved in state {self.state.value}')
+
+    def restore_checkpoint(self, name: str):
+        self.restore(self.checkpoints[name])
+        self._logger.info(f'Checkpoint {name} restored, State: {self.state.value}')
+        self.print_rocket_status()
+
     def get_servo_name(self, device_id):
-        for name, settings in self.config['devices']['servo'].items():
-            if settings['device_id'] == device_id:
-                return name
-        return None
+        return self._servo_names.get(device_id)
     
     def get_relay_name(self, device_id):
-        for name, settings in self.config['devices']['relay'].items():
-            if settings['device_id'] == device_id:
-                return name
-        return None
+        return self._relay_names.get(device_id)
 
     def is_servo_open(self, servo_name: str) -> bool:
-        servo_config = self.config['devices']['servo'][servo_name]
-        open_pos = servo_config['open_pos']
-        closed_pos = servo_config['closed_pos']
-        current_pos = self.servos[servo_name]
-        
-        threshold = abs(open_pos - closed_pos) * 0.3
-        return abs(current_pos - open_pos) < threshold
+        open_pos, threshold = self._servo_open_ranges[servo_name]
+        return abs(self.servos[servo_name] - open_pos) < threshold
 
     def update_physics(self, dt: float):
-        old_state = self.state
-        
-        if self.state == SimulationState.IDLE:
-            if self.is_servo_open('fuel_intake'):
-                self._logger.warning('PROPELLANT LOADING VIOLATION: Fuel intake opened before oxidizer is filled!')
-                self._logger.warning('Correct procedure: Fill oxidizer tank first, then fuel tank.')
-            elif self.is_servo_open('oxidizer_intake'):
-                self.state = SimulationState.FILLING_OXIDIZER
-                self._logger.info(f'State: {self.state.value}')
-                self.print_rocket_status()
-        
-        elif self.state == SimulationState.FILLING_OXIDIZER:
-            if self.is_servo_open('fuel_intake'):
-                self._logger.warning('PROPELLANT LOADING VIOLATION: Fuel intake opened before oxidizer is fully filled!')
-                self._logger.warning('Correct procedure: Complete oxidizer filling first.')
-            
-            if self.is_servo_open('oxidizer_intake'):
-                self.sensors['oxidizer_level'] = min(100.0, self.sensors['oxidizer_level'] + dt * 10.0)
-                self.sensors['oxidizer_pressure'] = min(40.0, self.sensors['oxidizer_pressure'] + dt * 2.0)
-                
-                if self.sensors['oxidizer_level'] >= 100.0:
-                    self.state = SimulationState.OXIDIZER_FILLED
-                    self._logger.info(f'State: {self.state.value}')
-                    self.print_rocket_status()
-            else:
-                if self.sensors['oxidizer_level'] >= 100.0:
-                    self.state = SimulationState.OXIDIZER_FILLED
-                    self._logger.info(f'State: {self.state.value}')
-                    self.print_rocket_status()
-                else:
-                    self.sensors['oxidizer_pressure'] = max(0.0, self.sensors['oxidizer_pressure'] - dt * 1.0)
-        
-        elif self.state == SimulationState.OXIDIZER_FILLED:
-            if self.relays['oxidizer_heater'] == 1:
-                self.sensors['oxidizer_pressure'] = min(90.0, self.sensors['oxidizer_pressure'] + dt * 2.5)
-                if self.sensors['oxidizer_pressure'] >= 90.0:
-                    self.explode("Oxidizer pressure too high (90 bars) - tank explosion")
-                    return
-            else:
-                self.sensors['oxidizer_pressure'] = max(30.0, self.sensors['oxidizer_pressure'] - dt * 1.0)
-            
-            if self.is_servo_open('fuel_intake'):
-                self.state = SimulationState.FILLING_FUEL
-                self._logger.info(f'State: {self.state.value}')
-                self.print_rocket_status()
-        
-        elif self.state == SimulationState.FILLING_FUEL:
-            if self.relays['oxidizer_heater'] == 1:
-                self.sensors['oxidizer_pressure'] = min(90.0, self.sensors['oxidizer_pressure'] + dt * 2.5)
-                if self.sensors['oxidizer_pressure'] >= 90.0:
-                    self.explode("Oxidizer pressure too high (90 bars) - tank explosion")
-                    return
-            else:
-                self.sensors['oxidizer_pressure'] = max(30.0, self.sensors['oxidizer_pressure'] - dt * 1.0)
-            
-            if self.is_servo_open('fuel_intake'):
-                self.sensors['fuel_level'] = min(100.0, self.sensors['fuel_level'] + dt * 10.0)
-                
-                if self.sensors['fuel_level'] >= 100.0:
-                    self.state = SimulationState.FUEL_FILLED
-                    self._logger.info(f'State: {self.state.value}')
-                    self.print_rocket_status()
-            else:
-                if self.sensors['fuel_level'] >= 100.0:
-                    self.state = SimulationState.FUEL_FILLED
-                    self._logger.info(f'State: {self.state.value}')
-                    self.print_rocket_status()
-        
-        elif self.state == SimulationState.FUEL_FILLED:
-            if self.relays['oxidizer_heater'] == 1:
-                self.sensors['oxidizer_pressure'] = min(90.0, self.sensors['oxidizer_pressure'] + dt * 2.5)
-                if self.sensors['oxidizer_pressure'] >= 90.0:
-                    self.explode("Oxidizer pressure too high (90 bars) - tank explosion")
-                    return
-            else:
-                self.sensors['oxidizer_pressure'] = max(30.0, self.sensors['oxidizer_pressure'] - dt * 1.0)
-            
-            if self.fuel_main_open_time and self.oxidizer_main_open_time:
-                time_diff = abs(self.fuel_main_open_time - self.oxidizer_main_open_time)
-                if time_diff > 1.0:
-                    if self.igniter_start_time:
-                        self.explode("Main valves opened with >1s difference - propellant imbalance explosion")
-                        return
-                
-                if self.igniter_start_time:
-                    igniter_delay_fuel = abs(self.igniter_start_time - self.fuel_main_open_time)
-                    igniter_delay_ox = abs(self.igniter_start_time - self.oxidizer_main_open_time)
-                    
-                    if igniter_delay_fuel > 1.0 or igniter_delay_ox > 1.0:
-                        self.explode("Igniter started >1s after main valves - engine flooded")
-                        return
-                    
-                    if self.igniter_start_time < min(self.fuel_main_open_time, self.oxidizer_main_open_time):
-                        self.explode("Igniter started before main valves - single propellant combustion")
-                        return
-                    
-                    if self.is_servo_open('fuel_intake') or self.is_servo_open('oxidizer_intake'):
-                        self.explode("Intake valves still open during ignition - catastrophic pressure loss")
-                        return
-                    
-                    pressure = self.sensors['oxidizer_pressure']
-                    
-                    if pressure < 40.0:
-                        self._logger.error(f"Ignition failed: Oxidizer pressure too low ({pressure:.1f} bars) - engine won't ignite")
-                        self.igniter_start_time = None
-                        return
-                    
-                    if pressure > 65.0:
-                        self.explode(f"Oxidizer pressure too high at ignition ({pressure:.1f} bars) - engine explosion")
-                        return
-                    
-                    if 55.0 <= pressure <= 65.0:
-                        self.thrust_multiplier = 1.0
-                        self._logger.info(f"Optimal pressure {pressure:.1f} bars - full thrust!")
-                    else:
-                        pressure_deviation = min(abs(pressure - 55.0), abs(pressure - 65.0))
-                        self.thrust_multiplier = max(0.5, 1.0 - (pressure_deviation / 15.0) * 0.5)
-                        self._logger.warning(f"Suboptimal pressure {pressure:.1f} bars - thrust reduced to {self.thrust_multiplier*100:.0f}%")
-                    
-                    self.state = SimulationState.FLIGHT
-                    self._logger.info(f'State: {self.state.value} - Engine ignited successfully!')
-                    self.print_rocket_status()
-        
-        elif self.state == SimulationState.FLIGHT:
-            if self.sensors['fuel_level'] > 0:
-                if self.relays['parachute'] == 1:
-                    self.explode("Parachute opened while engine is running - structural failure")
-                    return
-                
-                burn_rate = dt * 8.0
-                self.sensors['fuel_level'] = max(0.0, self.sensors['fuel_level'] - burn_rate)
-                self.sensors['oxidizer_level'] = max(0.0, self.sensors['oxidizer_level'] - burn_rate)
-                self.sensors['oxidizer_pressure'] = max(30.0, self.sensors['oxidizer_pressure'] - dt * 3.0)
-                
-                thrust = 15.0 * self.thrust_multiplier
-                gravity = 9.81
-                acceleration = thrust - gravity
-                self.velocity += acceleration * dt
-                self.sensors['altitude'] += self.velocity * dt
-                
-                self.sensors['angle'] = min(30.0, self.sensors['angle'] + dt * 2.0)
-            else:
-                if self.relays['parachute'] == 1:
-                    if self.velocity > 30.0:
-                        self._logger.error(f'Parachute deployed at too high velocity ({self.velocity:.1f} m/s) during ascent - parachute ripped!')
-                        self._logger.error('Continuing ballistic trajectory...')
-                    else:
-                        self.state = SimulationState.PARACHUTE_DEPLOYED
-                        self._logger.info(f'State: {self.state.value} - Early parachute deployment')
-                        self.print_rocket_status()
-                        return
-                
-                self.velocity -= 9.81 * dt
-                self.sensors['altitude'] += self.velocity * dt
-                
-                self.sensors['angle'] = min(90.0, self.sensors['angle'] + dt * 15.0)
-                
-                if self.sensors['altitude'] > self.max_altitude:
-                    self.max_altitude = self.sensors['altitude']
-                
-                if self.velocity <= 0 and self.apogee_reached_time is None:
-                    self.apogee_reached_time = time.perf_counter()
-                    self.state = SimulationState.APOGEE
-                    self._logger.info(f'State: {self.state.value} - Maximum altitude: {self.sensors["altitude"]:.2f}m')
-                    self.print_rocket_status()
-
-            if self.plot_vt: self.plot_rocket_vt()
-        
-        elif self.state == SimulationState.APOGEE:
-            time_since_apogee = time.perf_counter() - self.apogee_reached_time
-            
-            self.sensors['angle'] = min(180.0, self.sensors['angle'] + dt * 20.0)
-            
-            if self.relays['parachute'] == 1:
-                self.state = SimulationState.PARACHUTE_DEPLOYED
-                self._logger.info(f'State: {self.state.value}')
-                self.print_rocket_status()
-            elif time_since_apogee > 10.0:
-                self.state = SimulationState.FREEFALL
-                self._logger.info(f'State: {self.state.value} - Parachute not deployed in time!')
-                self.print_rocket_status()
+        context = self._model_context
+        end_time = self.clock.now()
+        remaining = dt
+        # integrator z wykrywaniem zdarzeń kończy odcinek na zdarzeniu (apogeum, wypalenie, przyziemienie),
+        # reguły stanu są wtedy sprawdzane w tej chwili, a reszta kroku liczona już w nowym stanie
+        for _ in range(self.MAX_SEGMENTS):
+            start_time = end_time - remaining
+            regime = self.model.regime(self.state.name, context)
+            if regime is None:
+                context.pending_motion, elapsed = {}, remaining
             else:
-                self.velocity -= 9.81 * dt
-                self.sensors['altitude'] += self.velocity * dt
-
-            if self.plot_vt: self.plot_rocket_vt()
-        
-        elif self.state == SimulationState.PARACHUTE_DEPLOYED:
-            terminal_velocity = -5.0
-            self.velocity = max(terminal_velocity, self.velocity - 9.81 * dt)
-            self.sensors['altitude'] += self.velocity * dt
-            
-            if self.sensors['angle'] > 0:
-                self.sensors['angle'] = max(0.0, self.sensors['angle'] - dt * 30.0)
-            elif self.sensors['angle'] < 0:
-                self.sensors['angle'] = min(0.0, self.sensors['angle'] + dt * 30.0)
-            
-            if self.sensors['altitude'] <= 0:
-                self.sensors['altitude'] = 0.0
-                self.velocity = 0.0
-                self.state = SimulationState.LANDED
-                self._logger.info(f'State: {self.state.value} - Successful landing!')
-                self.print_rocket_status()
-                time.sleep(2)
-                self.should_run = False
+                context.pending_motion, elapsed = self.integrator.advance(context, regime, start_time, remaining)
+            remaining -= elapsed
+            context.dt = elapsed
+            context.now = end_time - remaining
+            # reguły tylko bieżącego stanu, skompilowane z modelu przy starcie
+            stopped = run_all(self._state_rules[self.state], context)
+            if stopped or not self.should_run or remaining <= EVENT_TOLERANCE:
+                break
+        context.now = None
+        if stopped:
+            return
+        if self.plot_vt and self.state.name in self.model.plotted_states: self.plot_rocket_vt()
+
+    def model_time(self) -> float:
+        # chwila bieżącego odcinka kroku fizyki, poza krokiem czas zegara
+        return self.clock.now() if self._model_context.now is None else self._model_context.now
+
+    def enter_state(self, state: str, message: str = None, level: str = 'info'):
+        self.state = SimulationState[state]
+        self.state_changed_at = self.model_time()
+        getattr(self._logger, level)(f'State: {self.state.value}' + (f' - {message}' if message else ''))
+        self.print_rocket_status(force=False)
+
+    def finish(self):
+        self.clock.sleep(2)
+        self.should_run = False
 
-            if self.plot_vt: self.plot_rocket_vt()
-        
-        elif self.state == SimulationState.FREEFALL:
-            self.velocity -= 9.81 * dt
-            self.sensors['altitude'] += self.velocity * dt
-            
-            self.sensors['angle'] = min(180.0, self.sensors['angle'] + dt * 20.0)
-            
-            if self.relays['parachute'] == 1:
-                if abs(self.velocity) > 30.0:
-                    self._logger.error(f'Parachute deployed at too high velocity ({abs(self.velocity):.1f} m/s) - parachute ripped!')
-                    self._logger.error('Continuing freefall...')
-                else:
-                    self.state = SimulationState.PARACHUTE_DEPLOYED
-                    self._logger.info(f'State: {self.state.value} - Late parachute deployment successful')
-                    self.print_rocket_status()
-            
-            if self.sensors['altitude'] <= 0:
-                self.sensors['altitude'] = 0.0
-                self.velocity = 0.0
-                self.state = SimulationState.LANDED
-                self._logger.error(f'State: {self.state.value} - CRASH LANDING!')
-                self.print_rocket_status()
-                time.sleep(2)
-                self.should_run = False
+    def send_frames(self):
+        try:
+            self.manager.flush()
+        except (TransportTimeoutError, ClosedTransportError):
+            # gniazdo nie przyjmuje danych (pełny bufor), ramki zostają w buforze do następnej próby
+            pass
 
-            if self.plot_vt: self.plot_rocket_vt()
+    def tick_physics(self):
+        simulation_time = self.clock.now()
+        self.update_physics(simulation_time - self.last_physics_update)
+        self.last_physics_update = simulation_time
 
     def send_feed_frame(self):
-        conf_dict = self.config
-        sensors_config: dict = conf_dict["devices"]["sensor"]
-
-        for sensor_name, sensor_settings in sensors_config.items():
-            source = ids.BoardID[sensor_settings["board"].upper()]
-            device_id = sensor_settings["device_id"]
-            data_type = ids.DataTypeID[sensor_settings["data_type"].upper()]
-            
-            if sensor_name in self.sensors:
-                value = self.sensors[sensor_name]
-            else:
-                value = 0.0
-
-            frame = Frame(destination=ids.BoardID.SOFTWARE,
-                          priority=ids.PriorityID.LOW,
-                          action=ids.ActionID.FEED,
-                          source=source,
-                          device_type=ids.DeviceID.SENSOR,
-                          device_id=device_id,
-                          data_type=data_type,
-                          operation=ids.OperationID.SENSOR.value.READ,
-                          payload=(value,))
-            self.manager.push(frame)
-            try:
-                self.manager.send()
-            except TransportTimeoutError:
-                break
-
-            if self.verbose:
-                self._logger.info(f"sent feed frame: {frame}")
-
-        servos_config: dict = conf_dict["devices"]["servo"]
-        for servo_name, servo_settings in servos_config.items():
-            source = ids.BoardID[servo_settings["board"].upper()]
-            device_id = servo_settings["device_id"]
-            data_type = ids.DataTypeID.INT16
-            
-            if servo_name in self.servos:
-                value = int(self.servos[servo_name])
-            else:
-                value = 0
-
-            frame = Frame(destination=ids.BoardID.SOFTWARE,
-                          priority=ids.PriorityID.LOW,
-                          action=ids.ActionID.FEED,
-                          source=source,
-                          device_type=ids.DeviceID.SERVO,
-                          device_id=device_id,
-                          data_type=data_type,
-                          operation=ids.OperationID.SERVO.value.POSITION,
-                          payload=(value,))
+        # ramki czekają jeszcze na kredyty od proxy, urządzenia pozostają zaległe do następnego wywołania
+        if self.manager.buffered_frames:
+            self.send_frames()
+            return
+
+        frames = self.feed_frames()
+        if not frames:
+            return
+        for frame in frames:
             self.manager.push(frame)
-            try:
-                self.manager.send()
-            except TransportTimeoutError:
-                break
 
             if self.verbose:
-                self._logger.info(f"sent feed frame: {frame}")
+                self._logger.info("pushed feed frame: %s", frame)
+            if self.frame_trace is not None:
+                self.frame_trace.trace(TraceDirection.SENT, frame)
+
+        self.send_frames() # wszystkie zaległe ramki jednym zapisem
+
+    def feed_frames(self, now: float = None) -> list[Frame]:
+        """
+        FEED frames of devices due at now (wall clock, defaults to the current time),
+        sent at the rates of the current state taken from the config.
+        """
+        if now is None:
+            now = time.perf_counter()
+        values = dict(self.sensors)
+        values.update(self.servos)
+        frames = self.feed_scheduler.due_frames(now, self.state.name, values)
+        if self.sensor_stress is not None:
+            frames.extend(self.sensor_stress.due_frames(now, values))
+        return frames
+
+    def record_sensor(self, name: str, value, units: str):
+        self.recording_writer.writerow((f'{self.clock.now():.3f}', name, value, units))
 
     def receive_send_loop(self):
         while self.should_run:
             current_time = time.perf_counter()
             
-            if current_time > self.last_physics_update + 0.1:
-                dt = (current_time - self.last_physics_update) * self.time_multiplier
-                self.update_physics(dt)
-                self.last_physics_update = current_time
+            # fizyka liczona co najmniej tak często, jak wysyłany jest najszybszy czujnik
+            physics_interval = min(0.1, self.feed_scheduler.shortest_interval(self.state.name) or 0.1)
+            if current_time > self.last_physics_tick + physics_interval:
+                self.loop_metrics.observe('tick_lag', current_time - self.last_physics_tick - physics_interval)
+                self.tick_physics()
+                self.loop_metrics.observe('tick_duration', time.perf_counter() - current_time)
+                self.last_physics_tick = current_time
             
             if not self.verbose and current_time > self.last_status_print + 1.0:
                 self.print_rocket_status()
                 self.last_status_print = current_time
+
+            if self.metrics_interval and current_time > self.last_metrics_log + self.metrics_interval:
+                self.log_loop_metrics()
+                self.last_metrics_log = current_time
             
             try:
                 frame = self.manager.receive()
             except TransportTimeoutError:
-                if current_time > self.last_feed_update + float(self.feed_send_delay):
-                    self.send_feed_frame()
-                    self.last_feed_update = current_time
+                self.send_feed_frame()
                 continue
             except UnregisteredCallbackError as e:
                 frame = e.frame
             except KeyboardInterrupt:
                 sys.exit()
 
+            # ramki kontrolne proxy (np. zwrócone kredyty) obsługuje CommunicationManager
+            if frame.destination == ids.BoardID.PROXY:
+                self.send_frames()
+                continue
+
+            received_at = time.perf_counter()
+            if self.frame_trace is not None:
+                self.frame_trace.trace(TraceDirection.RECEIVED, frame)
             for response_frame in self.handle_frame(frame):
                 self.manager.push(response_frame)
                 if self.verbose:
-                    self._logger.info(f"pushed frame: {response_frame}")
-                try:
-                    self.manager.send()
-                except TransportTimeoutError:
-                    continue
+                    self._logger.info("pushed frame: %s", response_frame)
+                if self.frame_trace is not None:
+                    self.frame_trace.trace(TraceDirection.SENT, response_frame)
+            self.send_frames()
+            self.loop_metrics.observe('ack_latency', time.perf_counter() - received_at)
             
-            if current_time > self.last_feed_update + float(self.feed_send_delay):
-                self.send_feed_frame()
-                self.last_feed_update = current_time
+            self.send_feed_frame()
+
+    def log_loop_metrics(self):
+        self._logger.info("Loop timing:")
+        for line in self.loop_metrics.summary():
+            self._logger.info(f"  {line}")
+
+    def command_frame(self, step: dict) -> Frame:
+        """
+        Frame the controller would send for a procedure step,
+        e.g. {'servo': 'fuel_main', 'position': 0} or {'relay': 'igniter', 'state': 1}.
+        """
+        if 'servo' in step:
+            device_type = ids.DeviceID.SERVO
+            device_id = self.config['devices']['servo'][step['servo']]['device_id']
+            data_type = ids.DataTypeID.INT16
+            operation = ids.OperationID.SERVO.value.POSITION
+            payload = (int(step['position']),)
+        else:
+            device_type = ids.DeviceID.RELAY
+            device_id = self.config['devices']['relay'][step['relay']]['device_id']
+            data_type = ids.DataTypeID.NO_DATA
+            operation = ids.OperationID.RELAY.value.OPEN if step['state'] else ids.OperationID.RELAY.value.CLOSE
+            payload = ()
+
+        return Frame(destination=ids.BoardID.ROCKET,
+                     priority=ids.PriorityID.LOW,
+                     action=ids.ActionID.SERVICE,
+                     source=ids.BoardID.SOFTWARE,
+                     device_type=device_type,
+                     device_id=device_id,
+                     data_type=data_type,
+                     operation=operation,
+                     payload=payload)
+
+    def condition_met(self, condition: dict) -> bool:
+        # {'sensor': nazwa sensora albo 'velocity', 'above': próg i/lub 'below': próg}
+        name = condition['sensor']
+        value = self.velocity if name == 'velocity' else self.sensors[name]
+        if 'above' in condition and value < condition['above']:
+            return False
+        if 'below' in condition and value > condition['below']:
+            return False
+        return True
+
+    def run_procedure(self, steps: list, physics_step: float = 0.1, timeout: float = 600.0) -> dict:
+        """
+        Runs a procedure in virtual time with a fixed physics step, without the proxy.
+        Every step is a command (see command_frame), {'wait': seconds}, {'until': condition}
+        or {'checkpoint': name}, which saves a checkpoint of the simulation under that name.
+        After the last step the simulation goes on until landing, explosion or timeout.
+        :return: final state, simulation time, maximum altitude and state transitions
+        """
+        assert isinstance(self.clock, VirtualClock), 'Procedures can only run on a VirtualClock'
+        transitions = [(self.clock.now(), self.state.value)]
+
+        def advance(dt):
+            old_state = self.state
+            self.clock.advance(dt)
+            self.update_physics(dt)
+            self.last_physics_update = self.clock.now()
+            if self.state != old_state:
+                transitions.append((round(self.state_changed_at, 6), self.state.value))
+
+        def running():
+            return self.should_run and self.clock.now() < timeout
+
+        for step in steps:
+            if not running():
+                break
+            if 'wait' in step:
+                wait_end = self.clock.now() + step['wait']
+                while running() and self.clock.now() < wait_end:
+                    advance(min(physics_step, wait_end - self.clock.now()))
+            elif 'until' in step:
+                while running() and not self.condition_met(step['until']):
+                    advance(physics_step)
+            elif 'checkpoint' in step:
+                self.save_checkpoint(step['checkpoint'])
+            else:
+                self.handle_frame(self.command_frame(step))
+
+        while running():
+            advance(physics_step)
+
+        return {'state': self.state.value,
+                'time': round(self.clock.now(), 6),
+                'max_altitude': self.max_altitude,
+                'transitions': transitions}
 
 
 if __name__ == "__main__":
@@ -603,13 +620,87 @@ if __name__ == "__main__":
     parser.add_argument('--proxy-port', default=3001)
     parser.add_argument('--feed-interval', default=1)
     parser.add_argument('--hardware-config', default='simulator_config.yaml')
+    parser.add_argument('--model', default='simulator_model.yaml',
+                        help='YAML model with the states, transitions and failure rules of the simulation.')
     parser.add_argument('--no-print', default=False, action='store_true')
     parser.add_argument('--verbose', default=False, action='store_true', 
                         help='Print all frames sent/received. If disabled, prints rocket status every second.')
     parser.add_argument('--time-multiplier', default=1.0, type=float,
                         help='Simulation speed multiplier. 1.0 = real-time, 2.0 = 2x faster, 0.5 = 2x slower.')
     parser.add_argument('--plot-vt', default=False)
+    parser.add_argument('--procedure', default=None,
+                        help='YAML procedure run in virtual time without the proxy, e.g. flight_procedure.yaml.')
+    parser.add_argument('--physics-step', default=0.1, type=float,
+                        help='Simulated seconds per physics step of a procedure run.')
+    parser.add_argument('--procedure-timeout', default=600.0, type=float,
+                        help='Simulated seconds after which a procedure run is stopped.')
+    parser.add_argument('--expect-state', default=None,
+                        help='Final state a procedure run must end in, otherwise the exit code is 1.')
+    parser.add_argument('--flow-window', default=256, type=int,
+                        help='Credit window asked from the proxy, frames above it wait in the buffer. 0 disables flow control.')
+    parser.add_argument('--integrator', default='euler', choices=sorted(INTEGRATORS),
+                        help='Integrator of the rocket motion. euler keeps one update per physics tick, rk4 and adaptive '
+                             'stop exactly at events (burnout, apogee, touchdown) and stay accurate with large steps.')
+    parser.add_argument('--max-step', default=None, type=float,
+                        help='Longest integration step of rk4 and adaptive in simulated seconds.')
+    parser.add_argument('--checkpoints', default=None,
+                        help='YAML file the named checkpoints are saved to and restored from. Without it checkpoints '
+                             'are restored from checkpoints.yaml and new ones are not saved.')
+    parser.add_argument('--restore', default=None,
+                        help='Checkpoint the simulation starts from. A procedure run skips its steps '
+                             'up to the checkpoint step of the same name.')
+    parser.add_argument('--stress', default=None,
+                        help='YAML config of high rate sensor streams with noise, e.g. stress_config.yaml.')
+    parser.add_argument('--metrics-interval', default=60.0, type=float,
+                        help='Seconds between loop timing summaries in the log, 0 to log only at exit.')
+    parser.add_argument('--metrics-file', default=None,
+                        help='JSON file the loop timing histograms are written to at exit.')
+    parser.add_argument('--trace-file', default=None,
+                        help='Binary trace of all frames received and sent, '
+                             'read with python3 -m communication_library.frame_trace FILE.')
+    parser.add_argument('--sensor-recording', default=None,
+                        help='CSV file the values of sensors with recording: on in the config are written to.')
     cl_args = parser.parse_args()
+    recording_file = open(cl_args.sensor_recording, 'w', newline='') if cl_args.sensor_recording else None
+    integrator_class = INTEGRATORS[cl_args.integrator]
+    integrator = integrator_class() if cl_args.max_step is None or integrator_class is SemiImplicitEuler \
+        else integrator_class(max_step=cl_args.max_step)
+
+    # bez --checkpoints punkty są tylko czytane z dołączonego pliku, przebieg procedury go nie nadpisuje
+    checkpoints = load_checkpoints(cl_args.checkpoints or 'checkpoints.yaml')
+
+    if cl_args.procedure is not None:
+        with open(cl_args.procedure, 'r') as procedure_file:
+            procedure = yaml.safe_load(procedure_file)
+        # przywrócony przebieg zaczyna się w chwili zapisu punktu, czasy przejść są jak w pełnym przebiegu
+        start_time = 0.0 if cl_args.restore is None else checkpoints[cl_args.restore]['time']
+        standalone_mock = StandaloneMock(None,
+                                         0,
+                                         cl_args.hardware_config,
+                                         cl_args.feed_interval,
+                                         cl_args.no_print,
+                                         cl_args.verbose,
+                                         1.0,
+                                         False,
+                                         clock=VirtualClock(start_time),
+                                         recording_file=recording_file,
+                                         model=cl_args.model,
+                                         integrator=integrator,
+                                         checkpoint_path=cl_args.checkpoints)
+        standalone_mock.set_checkpoints(checkpoints)
+        steps = procedure['steps']
+        if cl_args.restore is not None:
+            standalone_mock.restore_checkpoint(cl_args.restore)
+            marker = {'checkpoint': cl_args.restore}
+            steps = steps[steps.index(marker) + 1:] if marker in steps else []
+        result = standalone_mock.run_procedure(steps, cl_args.physics_step, cl_args.procedure_timeout)
+        stop_queue_logging() # log procedury wypisany przed podsumowaniem
+        for transition_time, state in result['transitions']:
+            print(f'{transition_time:10.3f} s  {state}')
+        print(f"Final state: {result['state']} after {result['time']:.3f} s, "
+              f"max altitude {result['max_altitude']:.2f} m")
+        sys.exit(int(cl_args.expect_state is not None and result['state'] != cl_args.expect_state.upper()))
+
     standalone_mock = StandaloneMock(cl_args.proxy_address,
                                      int(cl_args.proxy_port),
                                      cl_args.hardware_config,
@@ -617,7 +708,25 @@ if __name__ == "__main__":
                                      cl_args.no_print,
                                      cl_args.verbose,
                                      cl_args.time_multiplier,
-                                     cl_args.plot_vt)
-    standalone_mock.receive_send_loop()
-    if cl_args.plot_vt:
-        plt.show()
\ No newline at end of file
+                                     cl_args.plot_vt,
+                                     cl_args.flow_window,
+                                     recording_file=recording_file,
+                                     model=cl_args.model,
+                                     integrator=integrator,
+                                     checkpoint_path=cl_args.checkpoints,
+                                     stress=cl_args.stress,
+                                     metrics_interval=cl_args.metrics_interval,
+                                     trace_path=cl_args.trace_file)
+    standalone_mock.set_checkpoints(checkpoints)
+    if cl_args.restore is not None:
+        standalone_mock.restore_checkpoint(cl_args.restore)
+    try:
+        standalone_mock.receive_send_loop()
+    finally:
+        standalone_mock.log_loop_metrics()
+        if cl_args.metrics_file is not None:
+            standalone_mock.loop_metrics.write(cl_args.metrics_file)
+        if standalone_mock.frame_trace is not None:
+            standalone_mock.frame_trace.close()
+        if cl_args.plot_vt:
+            standalone_mock.live_plot.close()
\ No newline at end of file
@@ -0,0 +1,229 @@
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+
+class WindowStats(NamedTuple):
+    count: int
+    min: float
+    max: float
+    mean: float
+
+
+def minmax(timestamps: np.ndarray, values: np.ndarray, points: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Downsampling to about points samples keeping the minimum and maximum of points // 2
+    equal buckets, so peaks are not lost.
+    """
+    buckets = max(1, points // 2)
+    if len(values) <= 2 * buckets:
+        return timestamps, values
+    # ostatni kubełek dostaje nadmiarowe próbki, reszta ma równą długość
+    size = len(values) // buckets
+    tail_start = size * (buckets - 1)
+    body = values[:tail_start].reshape(buckets - 1, size)
+    tail = values[tail_start:]
+    offsets = np.arange(buckets - 1) * size
+    indexes = np.unique(np.concatenate([offsets + body.argmin(axis=1), offsets + body.argmax(axis=1),
+                                        [tail_start + tail.argmin(), tail_start + tail.argmax()]]))
+    return timestamps[indexes], values[indexes]
+
+
+def lttb(timestamps: np.ndarray, values: np.ndarray, points: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Largest-Triangle-Three-Buckets downsampling to points samples. The first and last
+    samples are kept and from every bucket in between the sample forming the largest
+    triangle with the previously chosen one and the average of the next bucket,
+    which keeps the visual shape of the line. Buckets are processed one after another,
+    long windows should be reduced with minmax() first.
+    """
+    count = len(values)
+    if points >= count or points < 3:
+        return timestamps, values
+    # granice points - 2 kubełków pomiędzy pierwszą i ostatnią próbką
+    edges = np.linspace(1, count - 1, points - 1).astype(np.intp)
+    # średnie kubełków z sum skumulowanych, ostatnim "następnym kubełkiem" jest ostatnia próbka
+    time_sums = np.concatenate(([0.0], np.cumsum(timestamps)))
+    value_sums = np.concatenate(([0.0], np.cumsum(values)))
+    starts = np.append(edges[1:-1], count - 1)
+    ends = np.append(edges[2:], count)
+    lengths = ends - starts
+    next_times = ((time_sums[ends] - time_sums[starts]) / lengths).tolist()
+    next_values = ((value_sums[ends] - value_sums[starts]) / lengths).tolist()
+
+    # kubełki mają po kilka próbek, na listach pętla jest szybsza niż wywołania NumPy
+    time_list = timestamps.tolist()
+    value_list = values.tolist()
+    edge_list = edges.tolist()
+    selected = [0]
+    previous = 0
+    for bucket in range(points - 2):
+        previous_time = time_list[previous]
+        previous_value = value_list[previous]
+        time_span = previous_time - next_times[bucket]
+        value_span = next_values[bucket] - previous_value
+        largest = -1.0
+        for index in range(edge_list[bucket], edge_list[bucket + 1]):
+            # podwojone pole trójkąta, stały czynnik nie zmienia wyboru maksimum
+            area = abs(time_span * (value_list[index] - previous_value)
+                       - (previous_time - time_list[index]) * value_span)
+            if area > largest:
+                largest = area
+                previous = index
+        selected.append(previous)
+    selected.append(count - 1)
+    return timestamps[selected], values[selected]
+
+
+class TelemetryChannel:
+    """
+    History of one channel in a preallocated ring buffer of (timestamp, value) pairs.
+    Appending is O(1) and never allocates; once the ring is full the oldest samples
+    are overwritten, so memory stays constant however long the controller runs.
+    Queries return views into the buffer instead of copies. There is a single writer
+    (the receive thread), a reader slower than capacity samples may see the oldest
+    samples of its view overwritten.
+    :param capacity: number of samples kept
+    """
+
+    # samples per displayed point left by min/max reduction before LTTB
+    LTTB_PREREDUCTION = 4
+
+    def __init__(self, capacity: int = 65536) -> None:
+        self.capacity = capacity
+        self._timestamps = np.zeros(capacity)
+        self._values = np.zeros(capacity)
+        # total number of samples ever appended
+        self.appended = 0
+
+    def __len__(self) -> int:
+        return min(self.appended, self.capacity)
+
+    @property
+    def nbytes(self) -> int:
+        return self._timestamps.nbytes + self._values.nbytes
+
+    def append(self, timestamp: float, value: float) -> None:
+        position = self.appended % self.capacity
+        self._timestamps[position] = timestamp
+        self._values[position] = value
+        self.appended += 1
+
+    def latest(self) -> Optional[Tuple[float, float]]:
+        if not self.appended:
+            return None
+        position = (self.appended - 1) % self.capacity
+        return float(self._timestamps[position]), float(self._values[position])
+
+    def segments(self, start: float = None, end: float = None) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """
+        Samples with start <= timestamp <= end as at most two (timestamps, values) pairs
+        of views, in chronological order. The ring wraps around between the two.
+        :param start: earliest timestamp, None for the oldest sample kept
+        :param end:   latest timestamp, None for the newest sample
+        """
+        appended = self.appended
+        if appended <= self.capacity:
+            ranges = [(0, appended)]
+        else:
+            oldest = appended % self.capacity
+            ranges = [(oldest, self.capacity), (0, oldest)]
+
+        result = []
+        for first, last in ranges:
+            timestamps = self._timestamps[first:last]
+            # znaczniki czasu w obrębie segmentu są rosnące, okno wyznacza wyszukiwanie binarne
+            low = 0 if start is None else int(np.searchsorted(timestamps, start, 'left'))
+            high = len(timestamps) if end is None else int(np.searchsorted(timestamps, end, 'right'))
+            if low < high:
+                result.append((timestamps[low:high], self._values[first + low:first + high]))
+        return result
+
+    def window(self, start: float = None, end: float = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Samples with start <= timestamp <= end as (timestamps, values) arrays.
+        These are views unless the window spans the wrap-around of the ring.
+        """
+        parts = self.segments(start, end)
+        if not parts:
+            return np.empty(0), np.empty(0)
+        if len(parts) == 1:
+            return parts[0]
+        return np.concatenate([part[0] for part in parts]), np.concatenate([part[1] for part in parts])
+
+    def last(self, seconds: float) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Samples from the last seconds before the newest sample.
+        """
+        newest = self.latest()
+        if newest is None:
+            return np.empty(0), np.empty(0)
+        return self.window(newest[0] - seconds)
+
+    def stats(self, start: float = None, end: float = None) -> WindowStats:
+        parts = [values for _, values in self.segments(start, end)]
+        count = sum(len(values) for values in parts)
+        if not count:
+            return WindowStats(0, float('nan'), float('nan'), float('nan'))
+        return WindowStats(count,
+                           float(min(values.min() for values in parts)),
+                           float(max(values.max() for values in parts)),
+                           float(sum(values.sum() for values in parts) / count))
+
+    def slope(self, seconds: float) -> float:
+        """
+        Rate of change in units per second over the last seconds, a least squares fit,
+        e.g. vertical velocity from altitude. 0.0 with fewer than two samples.
+        """
+        timestamps, values = self.last(seconds)
+        if len(timestamps) < 2:
+            return 0.0
+        centered = timestamps - timestamps.mean()
+        spread = float(np.dot(centered, centered))
+        if not spread:
+            return 0.0
+        return float(np.dot(centered, values - values.mean()) / spread)
+
+    def downsample(self, points: int, start: float = None, end: float = None,
+                   method: str = 'minmax') -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Window reduced to about points samples for display. Windows already small enough
+        are returned as they are.
+        :param method: 'minmax' keeps the minimum and maximum of points // 2 buckets, so peaks
+                       are not lost; 'lttb' keeps the shape of the line with
+                       Largest-Triangle-Three-Buckets
+        """
+        timestamps, values = self.window(start, end)
+        if method == 'lttb':
+            # LTTB przetwarza kubełki po kolei, więc długie okna są najpierw redukowane tanim min/max
+            timestamps, values = minmax(timestamps, values, self.LTTB_PREREDUCTION * points)
+            return lttb(timestamps, values, points)
+        if method != 'minmax':
+            raise ValueError(f'Unknown downsampling method {method}')
+        return minmax(timestamps, values, points)
+
+class TelemetryStore:
+    """
+    Telemetry channels by name, all with the same capacity.
+    :param names:    names of the channels
+    :param capacity: samples kept per channel
+    """
+
+    def __init__(self, names: Iterable[str], capacity: int = 65536) -> None:
+        self.channels: Dict[str, TelemetryChannel] = {name: TelemetryChannel(capacity) for name in names}
+
+    def __getitem__(self, name: str) -> TelemetryChannel:
+        return self.channels[name]
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.channels
+
+    def __iter__(self):
+        return iter(self.channels)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(channel.nbytes for channel in self.channels.values())
+
+    def append(self, name: str, timestamp: float, value: float) -> None:
+        self.channels[name].append(timestamp, value)
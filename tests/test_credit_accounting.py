@@ -0,0 +1,188 @@
+import socket
+
+import pytest
+
+from communication_library import ids
+from communication_library.communication_manager import CommunicationManager
+from communication_library.exceptions import ClosedTransportError
+from communication_library.frame import Frame
+from communication_library.protocol import GroundStationProtocol
+from communication_library.tcp_transport import TcpSettings
+from communication_library.transport import TransportType
+from tcp_proxy import FRAME_LENGTH, control_frame
+
+CREDIT = ids.OperationID.PROXY.value.CREDIT
+
+
+class FakeProxy:
+    """
+    Listening socket standing in for the proxy, frames are exchanged over real TCP.
+    """
+
+    def __init__(self) -> None:
+        self.listener = socket.create_server(('127.0.0.1', 0))
+        self.settings = TcpSettings(address='127.0.0.1', port=self.listener.getsockname()[1])
+        self.connection = None
+
+    def accept(self) -> None:
+        self.connection, _ = self.listener.accept()
+        self.connection.settimeout(1.0)
+
+    def send_credit(self, action: ids.ActionID, credits: int) -> None:
+        frame = control_frame(CREDIT, action, ids.DataTypeID.UINT32, (credits,))
+        self.connection.sendall(GroundStationProtocol.encode(frame))
+
+    def received(self, count: int) -> list:
+        data = b''
+        while len(data) < count * FRAME_LENGTH:
+            data += self.connection.recv(count * FRAME_LENGTH - len(data))
+        return [GroundStationProtocol.decode(data[offset:offset + FRAME_LENGTH])
+                for offset in range(0, len(data), FRAME_LENGTH)]
+
+    def nothing_received(self) -> bool:
+        self.connection.settimeout(0.1)
+        try:
+            return not self.connection.recv(FRAME_LENGTH)
+        except socket.timeout:
+            return True
+        finally:
+            self.connection.settimeout(1.0)
+
+    def close(self) -> None:
+        if self.connection is not None:
+            self.connection.close()
+        self.listener.close()
+
+
+def command(position: int) -> Frame:
+    return Frame(destination=ids.BoardID.ROCKET,
+                 priority=ids.PriorityID.LOW,
+                 action=ids.ActionID.SERVICE,
+                 source=ids.BoardID.SOFTWARE,
+                 device_type=ids.DeviceID.SERVO,
+                 device_id=0,
+                 data_type=ids.DataTypeID.INT16,
+                 operation=ids.OperationID.SERVO.value.POSITION,
+                 payload=(position,))
+
+
+def receive_reply(manager: CommunicationManager) -> None:
+    assert manager.wait_for_frame(1.0)
+    assert manager.receive_frames()
+
+
+@pytest.fixture
+def proxy():
+    fake_proxy = FakeProxy()
+    yield fake_proxy
+    fake_proxy.close()
+
+
+@pytest.fixture
+def manager(proxy):
+    communication_manager = CommunicationManager()
+    communication_manager.change_transport_type(TransportType.TCP)
+    communication_manager.connect(proxy.settings)
+    proxy.accept()
+    yield communication_manager
+    communication_manager.disconnect()
+
+
+def push_commands(manager: CommunicationManager, count: int) -> None:
+    for position in range(count):
+        manager.push(command(position))
+
+
+def test_flush_without_flow_control_sends_everything(proxy, manager):
+    push_commands(manager, 5)
+    assert manager.flush() == 5
+    assert [frame.payload[0] for frame in proxy.received(5)] == [0, 1, 2, 3, 4]
+    assert manager.send_credits is None
+
+
+def test_ack_grants_the_window(proxy, manager):
+    manager.enable_flow_control(3)
+    request = proxy.received(1)[0]
+    assert request.operation == CREDIT and request.payload == (3,)
+
+    proxy.send_credit(ids.ActionID.ACK, 3)
+    receive_reply(manager)
+    assert manager.send_credits == 3
+
+    push_commands(manager, 5)
+    assert manager.flush() == 3
+    assert [frame.payload[0] for frame in proxy.received(3)] == [0, 1, 2]
+    assert manager.send_credits == 0
+    assert manager.buffered_frames == 2
+    assert manager.flush() == 0
+    assert proxy.nothing_received()
+
+
+def test_service_grant_releases_held_back_frames(proxy, manager):
+    manager.enable_flow_control(2)
+    proxy.received(1)
+    proxy.send_credit(ids.ActionID.ACK, 2)
+    receive_reply(manager)
+    push_commands(manager, 5)
+    assert manager.flush() == 2
+
+    proxy.send_credit(ids.ActionID.SERVICE, 2)
+    receive_reply(manager)
+    assert manager.send_credits == 2
+    assert manager.flush() == 2
+    assert [frame.payload[0] for frame in proxy.received(4)] == [0, 1, 2, 3]
+    assert manager.send_credits == 0
+    assert manager.buffered_frames == 1
+
+
+def test_nack_turns_flow_control_off(proxy, manager):
+    manager.enable_flow_control(2)
+    proxy.received(1)
+    proxy.send_credit(ids.ActionID.NACK, 2)
+    receive_reply(manager)
+    assert manager.send_credits is None
+
+    push_commands(manager, 4)
+    assert manager.flush() == 4
+    proxy.received(4)
+
+
+def test_service_grant_without_flow_control_is_ignored(proxy, manager):
+    proxy.send_credit(ids.ActionID.SERVICE, 5)
+    receive_reply(manager)
+    assert manager.send_credits is None
+
+
+def test_failed_write_keeps_frames_and_credits(proxy, manager, monkeypatch):
+    manager.enable_flow_control(3)
+    proxy.received(1)
+    proxy.send_credit(ids.ActionID.ACK, 3)
+    receive_reply(manager)
+    push_commands(manager, 2)
+
+    def refuse(data):
+        raise ClosedTransportError('Writing to a closed socket')
+    monkeypatch.setattr(manager._transport, 'write', refuse)
+    with pytest.raises(ClosedTransportError):
+        manager.flush()
+    assert manager.buffered_frames == 2
+    assert manager.send_credits == 3
+
+    monkeypatch.undo()
+    assert manager.flush() == 2
+    assert [frame.payload[0] for frame in proxy.received(2)] == [0, 1]
+    assert manager.send_credits == 1
+
+
+def test_reconnect_asks_again_for_the_default_window(proxy, manager):
+    manager.enable_flow_control(0)
+    assert proxy.received(1)[0].payload == (0,)
+    proxy.send_credit(ids.ActionID.ACK, 1024)
+    receive_reply(manager)
+
+    manager.reconnect(proxy.settings)
+    proxy.accept()
+    # credits of the old connection are gone until the proxy answers again
+    assert manager.send_credits is None
+    request = proxy.received(1)[0]
+    assert request.operation == CREDIT and request.payload == (0,)
@@ -0,0 +1,85 @@
+import pytest
+
+from communication_library.frame_log import (FrameDirection, FrameLogReader, FrameLogWriter,
+                                             INDEX_SUFFIX, RECORD, SEGMENT_HEADER, SEGMENT_SUFFIX)
+
+RECORDS_PER_SEGMENT = 10
+
+
+def direction_of(number: int) -> FrameDirection:
+    return FrameDirection.FROM_CLIENT if number % 2 else FrameDirection.TO_CLIENTS
+
+
+def record_all(directory, count: int, index_interval: int = 3) -> FrameLogWriter:
+    writer = FrameLogWriter(str(directory), segment_size=SEGMENT_HEADER.size + RECORDS_PER_SEGMENT * RECORD.size,
+                            index_interval=index_interval)
+    for number in range(count):
+        writer.record(direction_of(number), number % 7, bytes([number % 256]) * 14)
+    writer.close()
+    return writer
+
+
+def test_round_trip_across_segment_rollover(tmp_path):
+    writer = record_all(tmp_path, 35)
+    assert writer.recorded_frames == 35
+    assert len(list(tmp_path.glob('*' + SEGMENT_SUFFIX))) == 4
+
+    reader = FrameLogReader(str(tmp_path))
+    assert [segment.record_count for segment in reader.segments] == [10, 10, 10, 5]
+    records = list(reader.records())
+    assert [data for _, _, _, data in records] == [bytes([number]) * 14 for number in range(35)]
+    assert [client_id for _, _, client_id, _ in records] == [number % 7 for number in range(35)]
+    assert [direction for _, direction, _, _ in records] == [direction_of(number) for number in range(35)]
+    timestamps = [timestamp for timestamp, _, _, _ in records]
+    assert timestamps == sorted(timestamps)
+    assert reader.first_timestamp == timestamps[0]
+
+
+@pytest.mark.parametrize('position', [0, 1, 2, 3, 9, 10, 11, 20, 29, 30, 34])
+def test_seek_by_timestamp(tmp_path, position):
+    record_all(tmp_path, 35)
+    reader = FrameLogReader(str(tmp_path))
+    records = list(reader.records())
+    start = records[position][0]
+    assert list(reader.records(start)) == [record for record in records if record[0] >= start]
+
+
+def test_seek_past_the_end_and_before_the_start(tmp_path):
+    record_all(tmp_path, 35)
+    reader = FrameLogReader(str(tmp_path))
+    records = list(reader.records())
+    assert list(reader.records(records[-1][0] + 1)) == []
+    assert list(reader.records(0)) == records
+
+
+def test_segments_without_index_entries(tmp_path):
+    record_all(tmp_path, 35)
+    records = list(FrameLogReader(str(tmp_path)).records())
+    # index entries are flushed after the records, a crash can leave them missing
+    for index_path in tmp_path.glob('*' + INDEX_SUFFIX):
+        index_path.write_bytes(b'')
+
+    reader = FrameLogReader(str(tmp_path))
+    assert reader.first_timestamp == records[0][0]
+    start = records[25][0]
+    assert list(reader.records(start)) == [record for record in records if record[0] >= start]
+
+
+def test_recordings_started_together_do_not_overwrite_each_other(tmp_path):
+    first = FrameLogWriter(str(tmp_path))
+    second = FrameLogWriter(str(tmp_path))
+    first.record(FrameDirection.TO_CLIENTS, 0, b'\x01' * 14)
+    second.record(FrameDirection.TO_CLIENTS, 0, b'\x02' * 14)
+    first.close()
+    second.close()
+
+    sessions = {path.stem.rsplit('_', 1)[0] for path in tmp_path.glob('*' + SEGMENT_SUFFIX)}
+    assert len(sessions) == 2
+    payloads = {session: [data for _, _, _, data in FrameLogReader(str(tmp_path), session).records()]
+                for session in sessions}
+    assert sorted(payloads.values()) == [[b'\x01' * 14], [b'\x02' * 14]]
+
+
+def test_empty_directory(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        FrameLogReader(str(tmp_path))
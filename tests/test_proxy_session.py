@@ -0,0 +1,79 @@
+import pytest
+
+from communication_library import ids
+from communication_library.frame import Frame
+from communication_library.protocol import GroundStationProtocol
+from tcp_proxy import FRAME_LENGTH, ProxySession, control_frame
+
+
+def feed_frame(number: int) -> bytes:
+    return GroundStationProtocol.encode(Frame(destination=ids.BoardID.SOFTWARE,
+                                              priority=ids.PriorityID.LOW,
+                                              action=ids.ActionID.FEED,
+                                              source=ids.BoardID.ROCKET,
+                                              device_type=ids.DeviceID.SERVO,
+                                              device_id=0,
+                                              data_type=ids.DataTypeID.INT16,
+                                              operation=ids.OperationID.SERVO.value.POSITION,
+                                              payload=(number,)))
+
+
+def numbers(data: bytes) -> list:
+    return [GroundStationProtocol.decode(data[offset:offset + FRAME_LENGTH]).payload[0]
+            for offset in range(0, len(data), FRAME_LENGTH)]
+
+
+def session_with(count: int, capacity: int) -> ProxySession:
+    session = ProxySession(session_id=1, capacity=capacity)
+    for number in range(1, count + 1):
+        session.append(feed_frame(number))
+    return session
+
+
+def test_frames_after_returns_only_missed_frames():
+    session = session_with(5, capacity=10)
+    assert numbers(session.frames_after(2)) == [3, 4, 5]
+
+
+def test_frames_after_last_sequence_is_empty():
+    session = session_with(5, capacity=10)
+    assert session.frames_after(5) == b''
+
+
+def test_frames_after_oldest_kept_boundary_of_full_ring():
+    session = session_with(15, capacity=10)
+    # frames 6..15 are kept, so a client which received frame 5 misses nothing that is gone
+    assert numbers(session.frames_after(5)) == list(range(6, 16))
+
+
+def test_frames_after_beyond_ring_is_none():
+    session = session_with(15, capacity=10)
+    assert session.frames_after(4) is None
+
+
+def test_frames_after_sequence_from_the_future_is_none():
+    session = session_with(5, capacity=10)
+    assert session.frames_after(6) is None
+
+
+def test_frames_after_from_start_of_session():
+    session = session_with(3, capacity=10)
+    assert numbers(session.frames_after(0)) == [1, 2, 3]
+
+
+def test_batches_are_split_and_control_frames_skipped():
+    session = ProxySession(session_id=1, capacity=10)
+    ping = GroundStationProtocol.encode(control_frame(ids.OperationID.PROXY.value.PING))
+    session.append(feed_frame(1) + ping + feed_frame(2))
+    assert session.last_sequence == 2
+    assert numbers(session.frames_after(0)) == [1, 2]
+
+
+@pytest.mark.parametrize('received', range(0, 13))
+def test_frames_after_every_position_of_wrapped_ring(received):
+    session = session_with(12, capacity=4)
+    missed = session.frames_after(received)
+    if received < 8:
+        assert missed is None
+    else:
+        assert numbers(missed) == list(range(received + 1, 13))